@@ -1,7 +1,21 @@
 """Agent核心逻辑 - ReAct循环"""
+import functools
+import itertools
 import json
+import time
+import uuid
 from openai import OpenAI
 from tools import get_weather, search_nearby, search_knowledge_base
+from tool_executor import ToolExecutor, TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT
+from context_manager import ContextManager
+from prefetch import KnowledgePrefetcher, SPECULATIVE_RAG
+from router import IntentRouter, INTENT_ROUTER, ROUTE_EMPTY_RESULTS
+from resilience import CircuitOpenError, get_endpoint, is_upstream_failure
+from tracing import tracer
+
+
+# 默认系统提示
+SYSTEM_PROMPT = "你是一个小米汽车的智能顾问。关于车辆的具体配置问题，请务必调用 search_knowledge_base 工具查询知识库。关于生活服务问题，调用地图或天气工具。"
 
 
 # 工具描述 Schema
@@ -55,16 +69,194 @@ TOOLS_SCHEMA = [
 ]
 
 
+def _knowledge_base_version():
+    # 按需导入：只用天气 / 地图工具时不加载知识库依赖
+    from tools.rag import get_index_version
+    return get_index_version()
+
+
+# 工具结果记忆策略：cacheable 为 False 或未列出的工具每次都真实调用；
+# ttl 为同一对话内复用结果的秒数（天气变化快，地点与知识库内容稳定）；
+# version 返回数据版本，与记忆写入时不同则视为失效（知识库文档更新后不再复用旧检索结果）
+TOOL_CACHE_POLICY = {
+    "search_knowledge_base": {"cacheable": True, "ttl": 3600, "version": _knowledge_base_version},
+    "search_nearby": {"cacheable": True, "ttl": 6 * 3600},
+    "get_weather": {"cacheable": True, "ttl": 600},
+}
+
+# 以这些前缀开头的工具结果是失败或临时状态，不写入记忆
+UNCACHEABLE_RESULT_PREFIXES = (
+    "工具调用", "未知工具", "参数", "未配置", "查询失败", "查询出错", "搜索出错",
+    "知识库不可用", "知识库未初始化", "知识库正在预热", "检索出错",
+)
+
+# 工具熔断期间直接返回的降级结果（以"工具调用"开头：不写入记忆，本地路由改走完整循环）
+DEGRADED_TOOL_RESULT = "工具调用已降级：{name} 的上游服务暂时不可用（约 {seconds:.0f}s 后恢复探测），请告知用户稍后再试"
+
+# 本地路由快速路径以 llm 方式回答时的提示
+ROUTER_ANSWER_PROMPT = "你是一个小米汽车的智能顾问。请根据工具结果，用一两句话简洁地回答用户的问题。"
+
+
+def _merge_tool_call_deltas(pending, deltas):
+    """
+    将流式返回的 tool_call 片段按 index 拼接成完整的工具调用
+    
+    Args:
+        pending: 已累积的工具调用 {index: tool_call_dict}
+        deltas: 本个 chunk 中的 tool_call 片段列表
+    """
+    for delta in deltas:
+        index = delta.index if delta.index is not None else len(pending)
+        entry = pending.get(index)
+        # 部分兼容接口并行调用时 index 恒为 0，只能靠新的 id 区分
+        if entry and delta.id and entry["id"] and delta.id != entry["id"]:
+            index = max(pending) + 1
+            entry = None
+        if entry is None:
+            entry = {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+            pending[index] = entry
+        
+        if delta.id:
+            entry["id"] = delta.id
+        if delta.function:
+            if delta.function.name and not entry["function"]["name"]:
+                entry["function"]["name"] = delta.function.name
+            if delta.function.arguments:
+                entry["function"]["arguments"] += delta.function.arguments
+
+
+def _parse_tool_args(arguments):
+    """
+    解析工具参数 JSON
+    
+    Returns:
+        tuple: (参数字典, 错误信息)，解析失败时参数为空字典
+    """
+    try:
+        args = json.loads(arguments) if arguments else {}
+        if not isinstance(args, dict):
+            return {}, f"参数格式错误: {arguments}"
+        return args, None
+    except json.JSONDecodeError as e:
+        return {}, f"参数解析失败: {e}"
+
+
+def _policy_version(policy):
+    return policy["version"]() if "version" in policy else None
+
+
+def _memo_lookup(memo, func_name, args):
+    """按 TOOL_CACHE_POLICY 查找对话内记忆的工具结果，不可记忆或未命中时返回 None"""
+    policy = TOOL_CACHE_POLICY.get(func_name)
+    if memo is None or not policy or not policy["cacheable"]:
+        return None
+    return memo.get(func_name, args, policy["ttl"], version=_policy_version(policy))
+
+
+def _memo_store(memo, func_name, args, result):
+    """记录可记忆工具的成功结果"""
+    policy = TOOL_CACHE_POLICY.get(func_name)
+    if memo is None or not policy or not policy["cacheable"]:
+        return
+    if not isinstance(result, str) or result.startswith(UNCACHEABLE_RESULT_PREFIXES):
+        return
+    memo.put(func_name, args, result, version=_policy_version(policy))
+
+
+def trim_unanswered_tool_calls(messages):
+    """
+    原地去掉末尾尚未得到全部工具结果的 assistant tool_calls 消息（及其后的部分工具结果）
+    
+    运行中途被中断（如客户端断开）时，消息列表可能停在发出工具调用之后；
+    带着未应答的 tool_calls 再次请求会被接口拒绝，保存前需先去掉。
+    
+    Returns:
+        int: 去掉的消息数
+    """
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if message.get("role") == "tool":
+            continue
+        if message.get("role") != "assistant" or not message.get("tool_calls"):
+            return 0
+        answered = {m.get("tool_call_id") for m in messages[index + 1:]}
+        if all(call["id"] in answered for call in message["tool_calls"]):
+            return 0
+        removed = len(messages) - index
+        del messages[index:]
+        return removed
+    return 0
+
+
+def _routed_messages(route, result, content):
+    """
+    本地路由快速路径写回的消息，与模型规划时的 assistant(tool_calls) → tool → assistant 结构一致，
+    后续轮次的模型能看到这次工具调用
+    """
+    call_id = "route_" + uuid.uuid4().hex[:16]
+    return [
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{
+                "id": call_id,
+                "type": "function",
+                "function": {"name": route.tool, "arguments": json.dumps(route.args, ensure_ascii=False)}
+            }]
+        },
+        {"role": "tool", "tool_call_id": call_id, "content": result},
+        {"role": "assistant", "content": content},
+    ]
+
+
+def _compact_answer_messages(question, result):
+    """快速路径精简模型调用的消息（不带历史与工具）"""
+    return [
+        {"role": "system", "content": ROUTER_ANSWER_PROMPT},
+        {"role": "user", "content": f"{question}\n\n工具结果：{result}"},
+    ]
+
+
+def _degraded_result(func_name, retry_after):
+    return DEGRADED_TOOL_RESULT.format(name=func_name, seconds=retry_after)
+
+
+def _record_tool_outcome(endpoint, func_name, elapsed, error=None):
+    """
+    更新工具的熔断统计：超过工具截止时间，或抛出超时 / 连接错误 / 429 / 5xx（is_upstream_failure）
+    计为失败；参数错误等客户端错误与工具自行处理的失败结果不计入
+    """
+    if elapsed >= TOOL_TIMEOUTS.get(func_name, DEFAULT_TOOL_TIMEOUT) or \
+            (error is not None and is_upstream_failure(error)):
+        endpoint.record_failure()
+    elif error is None:
+        endpoint.record_success(elapsed)
+    else:
+        endpoint.breaker.record_success()
+
+
+def _record_usage(span, chunk):
+    """记录流式响应末尾 usage 块中的 token 数（需 stream_options.include_usage）"""
+    usage = getattr(chunk, "usage", None)
+    if usage:
+        span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
 class AgentCore:
     """Agent核心类 - 负责ReAct循环逻辑"""
     
-    def __init__(self, api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"):
+    def __init__(self, api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                 tool_executor=None, context_manager=None, prefetcher=None, router=None):
         """
         初始化Agent
         
         Args:
             api_key: API密钥
             base_url: API基础URL
+            tool_executor: 并行工具执行器，默认新建 ToolExecutor
+            context_manager: 上下文窗口管理器，默认新建 ContextManager
+            prefetcher: 知识库预取器 KnowledgePrefetcher，默认按 SPECULATIVE_RAG 决定是否开启
+            router: 本地意图路由器 IntentRouter，默认按 INTENT_ROUTER 决定是否开启
         """
         self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.tools_schema = TOOLS_SCHEMA
@@ -73,97 +265,369 @@ class AgentCore:
             "search_nearby": search_nearby,
             "get_weather": get_weather
         }
+        self.tool_executor = tool_executor or ToolExecutor()
+        self.context_manager = context_manager or ContextManager()
+        self.prefetcher = prefetcher or (KnowledgePrefetcher(search_knowledge_base) if SPECULATIVE_RAG else None)
+        self.router = router or (IntentRouter() if INTENT_ROUTER else None)
     
-    def run_agent(self, messages, model="qwen-plus", callback=None):
+    def _call_tool(self, func_name, args, parent=None):
         """
-        运行Agent的ReAct循环
+        调用对应的工具函数
+        
+        Args:
+            func_name: 工具名称
+            args: 参数字典
+            parent: 工具 span 的父 span（工具在线程池中执行，需显式传入）
+        
+        Returns:
+            str: 工具结果
+        """
+        if func_name not in self.tool_functions:
+            return f"未知工具: {func_name}"
+        endpoint = get_endpoint(f"tool.{func_name}")
+        with tracer.span(f"tool.{func_name}", parent=parent) as span:
+            if not endpoint.allow():
+                span.set(degraded=True)
+                return _degraded_result(func_name, endpoint.breaker.retry_after())
+            started = time.monotonic()
+            error = None
+            try:
+                result = self.tool_functions[func_name](**args)
+                span.set(result_chars=len(result))
+            except CircuitOpenError as e:
+                # 工具依赖的上游端点熔断中（如 amap.weather），不计入工具自身的熔断
+                span.set(degraded=True)
+                endpoint.breaker.record_success()
+                return _degraded_result(func_name, e.retry_after)
+            except Exception as e:
+                span.record_error(e)
+                error = e
+                result = f"工具调用出错: {e}"
+            _record_tool_outcome(endpoint, func_name, time.monotonic() - started, error)
+            return result
+    
+    def _open_stream(self, span, **request):
+        """
+        经 llm.chat 端点打开流式请求（自适应超时、对冲请求与熔断，见 resilience）
+        
+        端点记录的延迟是请求发出到收到首个片段的耗时，对冲也覆盖这一段；
+        落败的流会被关闭。熔断打开时直接抛出 CircuitOpenError。
+        
+        Args:
+            span: 本次调用的 llm.chat span
+            **request: chat.completions.create 的参数
+        
+        Returns:
+            iterator: 从首个片段开始的流
+        """
+        endpoint = get_endpoint("llm.chat")
+        span.set(timeout_s=round(endpoint.timeout(), 3))
+        
+        def attempt(timeout):
+            stream = self.client.chat.completions.create(timeout=timeout, **request)
+            try:
+                return stream, next(stream, None)
+            except Exception:
+                stream.close()
+                raise
+        
+        stream, first = endpoint.call(attempt, discard=lambda opened: opened[0].close())
+        return stream if first is None else itertools.chain((first,), stream)
+    
+    def stream_agent(self, messages, model="qwen-plus", cancel_event=None, memo=None):
+        """
+        以流式方式运行Agent的ReAct循环
+        
+        模型输出一边生成一边产出 'delta' 事件；流式返回的工具调用片段
+        会被拼接完整后再执行。同一轮的多个工具调用并发执行，
+        结果按 tool_call 的原始顺序写回。messages 会被原地追加；
+        每轮请求前由 context_manager 生成符合 token 预算的副本发送给模型。
+        传入 memo 时，与之前相同的工具调用（按 TOOL_CACHE_POLICY）直接复用记忆结果，
+        对应的 'tool_result' 事件带 cached=True。开启知识库预取时，用户原文的检索与首轮
+        模型调用并行进行，模型随后的相似知识库查询直接复用预取结果（speculative=True）。
+        开启本地路由时，明确的天气 / 地点问题跳过模型规划，直接调用工具并组织回答。
+        运行过程记录为 agent.run → agent.iteration → llm.chat / tool.* 的 span 树（见 tracing）。
         
         Args:
             messages: 对话历史消息列表
             model: 使用的模型名称
-            callback: 回调函数，用于UI更新 callback(event_type, data)
-                event_type: 'thinking' | 'tool_call' | 'tool_result' | 'response' | 'error'
+            cancel_event: threading.Event，置位后放弃未完成的工具调用
+            memo: 本对话的工具结果记忆 ToolMemo，None 表示不记忆
+        
+        Yields:
+            tuple: (event_type, data)
+                event_type: 'thinking' | 'context' | 'delta' | 'tool_call' | 'tool_result' | 'response' | 'error'
         
         Returns:
-            tuple: (最终回复内容, 更新后的消息列表)
+            str: 最终回复内容（生成器结束时通过 StopIteration.value 返回）
         """
         max_iterations = 10  # 防止无限循环
         iteration = 0
+        run_span = tracer.start_span("agent.run", model=model)
+        iteration_span = None
+        prefetch = None
         
-        while iteration < max_iterations:
-            iteration += 1
+        try:
+            new_question = messages and messages[-1]["role"] == "user"
+            if self.router and new_question:
+                route = self.router.route(messages[-1]["content"])
+                run_span.set(route=route.intent, route_confidence=round(route.confidence, 3),
+                             fast_path=route.fast_path)
+                if route.fast_path:
+                    content = yield from self._routed_turn(messages, route, model, memo, run_span, cancel_event)
+                    if content is not None:
+                        return content
+            if self.prefetcher and new_question:
+                prefetch = self.prefetcher.start(messages[-1]["content"], parent=run_span)
             
-            try:
+            while iteration < max_iterations:
+                iteration += 1
+                iteration_span = tracer.start_span("agent.iteration", parent=run_span, iteration=iteration)
+                
                 # Agent 决策
-                if callback:
-                    callback('thinking', f"第 {iteration} 轮思考...")
+                yield 'thinking', f"第 {iteration} 轮思考..."
                 
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    tools=self.tools_schema,
-                    stream=False
-                )
+                # 按 token 预算裁剪本轮发送的上下文
+                prompt_messages, context_report = self.context_manager.fit(messages)
+                iteration_span.set(context_tokens=context_report["prompt_tokens"],
+                                   dropped_messages=context_report["dropped_messages"])
+                yield 'context', context_report
                 
-                ai_message = response.choices[0].message
+                content_parts = []
+                pending_calls = {}
+                llm_span = tracer.start_span("llm.chat", parent=iteration_span, model=model)
+                try:
+                    stream = self._open_stream(
+                        llm_span,
+                        model=model,
+                        messages=prompt_messages,
+                        tools=self.tools_schema,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                    
+                    for chunk in stream:
+                        _record_usage(llm_span, chunk)
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        if delta.content:
+                            llm_span.mark("ttft_ms")
+                            content_parts.append(delta.content)
+                            yield 'delta', delta.content
+                        if delta.tool_calls:
+                            llm_span.mark("ttft_ms")
+                            _merge_tool_call_deltas(pending_calls, delta.tool_calls)
                 
-            except Exception as e:
-                if callback:
-                    callback('error', str(e))
-                return f"API错误: {str(e)}", messages
-            
-            # 如果需要调用工具
-            if ai_message.tool_calls:
-                messages.append(ai_message.model_dump())
+                except Exception as e:
+                    tracer.end_span(llm_span, error=e)
+                    run_span.record_error(e)
+                    yield 'error', str(e)
+                    return f"API错误: {str(e)}"
                 
-                # 遍历所有工具调用
-                for tool_call in ai_message.tool_calls:
-                    func_name = tool_call.function.name
-                    args = json.loads(tool_call.function.arguments)
+                tracer.end_span(llm_span)
+                run_span.add("prompt_tokens", llm_span.get("prompt_tokens", 0))
+                run_span.add("completion_tokens", llm_span.get("completion_tokens", 0))
+                content = "".join(content_parts)
+                
+                # 如果需要调用工具
+                if pending_calls:
+                    tool_calls = [pending_calls[i] for i in sorted(pending_calls)]
+                    iteration_span.set(tool_calls=len(tool_calls))
+                    messages.append({
+                        "role": "assistant",
+                        "content": content,
+                        "tool_calls": tool_calls
+                    })
                     
-                    if callback:
-                        callback('tool_call', {
+                    # 先解析全部工具调用，参数有误的直接以错误信息作为结果
+                    results = [None] * len(tool_calls)
+                    runnable = []
+                    speculated = []
+                    for position, tool_call in enumerate(tool_calls):
+                        func_name = tool_call["function"]["name"]
+                        args, parse_error = _parse_tool_args(tool_call["function"]["arguments"])
+                        
+                        yield 'tool_call', {
                             'name': func_name,
                             'args': args
-                        })
+                        }
+                        
+                        if parse_error:
+                            results[position] = parse_error
+                            yield 'tool_result', {'name': func_name, 'result': parse_error, 'cached': False}
+                            continue
+                        
+                        # 本对话中已有相同调用的结果时直接复用
+                        cached = _memo_lookup(memo, func_name, args)
+                        if cached is not None:
+                            results[position] = cached
+                            iteration_span.add("tool_cache_hits", 1)
+                            yield 'tool_result', {'name': func_name, 'result': cached, 'cached': True}
+                        elif (func_name == "search_knowledge_base" and self.prefetcher
+                              and self.prefetcher.match(prefetch, args.get("query", ""))):
+                            # 与用户原文足够相似：认领已在后台进行的预取检索
+                            speculated.append((position, func_name, args))
+                        else:
+                            runnable.append((position, func_name, args))
+                    claimed_at = time.monotonic()
                     
-                    # 调用对应的工具函数
-                    if func_name in self.tool_functions:
-                        tool_result = self.tool_functions[func_name](**args)
-                    else:
-                        tool_result = f"未知工具: {func_name}"
+                    # 并发调用工具，按完成顺序通知；工作线程中的工具 span 挂在本轮之下
+                    completed = self.tool_executor.execute(
+                        [(func_name, args) for _, func_name, args in runnable],
+                        functools.partial(self._call_tool, parent=iteration_span),
+                        cancel_event=cancel_event
+                    )
+                    for index, tool_result in completed:
+                        position, func_name, args = runnable[index]
+                        results[position] = tool_result
+                        _memo_store(memo, func_name, args, tool_result)
+                        yield 'tool_result', {
+                            'name': func_name,
+                            'result': tool_result,
+                            'cached': False
+                        }
                     
-                    if callback:
-                        callback('tool_result', {
+                    # 预取通常已在其他工具执行期间完成，这里只等待剩余部分
+                    for position, func_name, args in speculated:
+                        tool_result = self._claim_prefetch(prefetch, claimed_at, iteration_span, cancel_event)
+                        results[position] = tool_result
+                        _memo_store(memo, func_name, args, tool_result)
+                        yield 'tool_result', {
                             'name': func_name,
-                            'result': tool_result
+                            'result': tool_result,
+                            'cached': False,
+                            'speculative': True
+                        }
+                    
+                    # 将工具结果按原始顺序添加到消息列表
+                    for tool_call, tool_result in zip(tool_calls, results):
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call["id"],
+                            "content": tool_result
                         })
                     
-                    # 将工具结果添加到消息列表
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": tool_result
-                    })
+                    # 继续下一轮循环，让模型根据工具结果生成回复
+                    tracer.end_span(iteration_span)
+                    continue
                 
-                # 继续下一轮循环，让模型根据工具结果生成回复
-                continue
-            
-            # 如果模型返回了最终回复
-            else:
-                final_content = ai_message.content
-                if callback:
-                    callback('response', final_content)
+                # 如果模型返回了最终回复
+                yield 'response', content
                 
                 messages.append({
                     "role": "assistant",
-                    "content": final_content
+                    "content": content
                 })
                 
-                return final_content, messages
+                return content
+            
+            # 超过最大迭代次数
+            error_msg = "达到最大思考次数，请重新提问"
+            run_span.record_error(error_msg)
+            yield 'error', error_msg
+            return error_msg
+        finally:
+            # 正常结束、出错或调用方提前关闭生成器时都结束 span
+            if iteration_span is not None:
+                tracer.end_span(iteration_span)
+            if prefetch is not None:
+                self.prefetcher.finish(prefetch)
+            run_span.set(iterations=iteration)
+            tracer.end_span(run_span)
+    
+    def _routed_turn(self, messages, route, model, memo, parent, cancel_event=None):
+        """
+        本地路由快速路径：直接调用工具，按模板或一次精简模型调用组织回答
+        
+        工具失败或没有查到内容时不写入消息并返回 None，交回完整的 ReAct 循环。
         
-        # 超过最大迭代次数
-        error_msg = "达到最大思考次数，请重新提问"
-        if callback:
-            callback('error', error_msg)
-        return error_msg, messages
+        Yields:
+            tuple: (event_type, data)，与 stream_agent 相同
+        
+        Returns:
+            str | None: 最终回复内容
+        """
+        yield 'thinking', f"本地路由：{route.intent}（置信度 {route.confidence:.2f}）"
+        yield 'tool_call', {'name': route.tool, 'args': route.args}
+        
+        result = _memo_lookup(memo, route.tool, route.args)
+        cached = result is not None
+        if not cached:
+            completed = self.tool_executor.execute(
+                [(route.tool, route.args)],
+                functools.partial(self._call_tool, parent=parent),
+                cancel_event=cancel_event
+            )
+            for _, result in completed:
+                pass
+        yield 'tool_result', {'name': route.tool, 'result': result, 'cached': cached}
+        if result.startswith(UNCACHEABLE_RESULT_PREFIXES) or result in ROUTE_EMPTY_RESULTS:
+            return None
+        _memo_store(memo, route.tool, route.args, result)
+        
+        content = None
+        if self.router.answer_mode == "llm":
+            content = yield from self._compact_answer(messages[-1]["content"], result, model, parent)
+        if not content:
+            content = self.router.render(route, result)
+        yield 'response', content
+        messages.extend(_routed_messages(route, result, content))
+        return content
+    
+    def _compact_answer(self, question, result, model, parent):
+        """快速路径的一次精简模型调用（不带工具），失败时返回 None 改用模板"""
+        parts = []
+        llm_span = tracer.start_span("llm.chat", parent=parent, model=model, compact=True)
+        try:
+            stream = self._open_stream(
+                llm_span,
+                model=model,
+                messages=_compact_answer_messages(question, result),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                _record_usage(llm_span, chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    llm_span.mark("ttft_ms")
+                    parts.append(chunk.choices[0].delta.content)
+                    yield 'delta', chunk.choices[0].delta.content
+        except Exception as e:
+            tracer.end_span(llm_span, error=e)
+            return None
+        tracer.end_span(llm_span)
+        return "".join(parts)
+    
+    def _claim_prefetch(self, prefetch, claimed_at, parent, cancel_event=None):
+        """等待认领的预取结果，截止时间与知识库工具相同"""
+        timeout = self.tool_executor.timeouts.get("search_knowledge_base", self.tool_executor.default_timeout)
+        with tracer.span("tool.search_knowledge_base", parent=parent, speculative=True) as span:
+            result, saved = self.prefetcher.wait(prefetch, claimed_at, timeout, cancel_event)
+            span.set(result_chars=len(result), saved_ms=round(saved * 1000, 1))
+            return result
+    
+    def run_agent(self, messages, model="qwen-plus", callback=None, cancel_event=None, memo=None):
+        """
+        运行Agent的ReAct循环
+        
+        Args:
+            messages: 对话历史消息列表
+            model: 使用的模型名称
+            callback: 回调函数，用于UI更新 callback(event_type, data)
+                event_type: 'thinking' | 'context' | 'delta' | 'tool_call' | 'tool_result' | 'response' | 'error'
+            cancel_event: threading.Event，置位后放弃未完成的工具调用
+            memo: 本对话的工具结果记忆 ToolMemo，None 表示不记忆
+        
+        Returns:
+            tuple: (最终回复内容, 更新后的消息列表)
+        """
+        events = self.stream_agent(messages, model=model, cancel_event=cancel_event, memo=memo)
+        while True:
+            try:
+                event_type, data = next(events)
+            except StopIteration as stop:
+                return stop.value, messages
+            
+            if callback:
+                callback(event_type, data)
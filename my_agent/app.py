@@ -3,10 +3,13 @@ import streamlit as st
 import os
 import time
 from dotenv import load_dotenv
-from agent_core import AgentCore
-from tools.rag import init_rag_system
+from agent_core import AgentCore, SYSTEM_PROMPT
+from tools.rag import start_rag_warmup, rag_status, get_cache_stats
 import uuid
 import history_utils  # ✨ 导入历史记录工具
+from tool_memo import ToolMemo
+from resilience import resilience_metrics
+from tracing import tracer
 
 # 加载环境变量
 load_dotenv()
@@ -82,27 +85,21 @@ if not AMAP_KEY:
 # ============ 2. 初始化 RAG 系统 ============
 @st.cache_resource
 def initialize_rag():
-    """初始化RAG知识库"""
-    # 确保你的路径是正确的
-    docx_path = os.path.join(os.path.dirname(__file__), "data", "xiaomiYU7.docx")
+    """在后台预热RAG知识库，不阻塞页面渲染"""
+    # data 目录下的所有文档都会被索引，只有变化的文档块需要重新向量化
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    return start_rag_warmup(data_dir, API_KEY)
 
-    status_container = st.empty()
-    status_container.info("🔄 正在初始化知识库 (加载 docx -> 向量化)...")
 
-    # 注意：这里的传参要和你 tools/rag.py 里的定义一致
-    rag_instance, error = init_rag_system(docx_path, API_KEY)
+# 预热期间天气 / 地图问题可以直接回答，知识库问题会短暂等待就绪
+initialize_rag()
+rag_state, rag_error = rag_status()
+if rag_state == "failed":
+    st.error(f"⚠️ 知识库初始化失败: {rag_error}")
 
-    if rag_instance:
-        status_container.success("✅ 知识库加载完成！")
-        time.sleep(1)
-        status_container.empty()
-    else:
-        status_container.error(f"⚠️ 知识库初始化失败: {error}")
 
-    return rag_instance, error
-
-
-rag_instance, rag_error = initialize_rag()
+# 侧边栏显示的知识库状态
+RAG_STATE_LABELS = {"ready": "✅", "warming": "🔄 预热中", "failed": "❌", "idle": "❌"}
 
 
 # ============ 3. 初始化 Agent ============
@@ -116,6 +113,12 @@ agent = get_agent()
 
 # ============ 4. 会话状态管理 (✨ 核心修改) ============
 
+# 侧边栏每页显示的历史对话数
+HISTORY_PAGE_SIZE = 50
+
+if "history_limit" not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
+
 # 初始化当前的 Chat ID
 if "current_chat_id" not in st.session_state:
     st.session_state.current_chat_id = str(uuid.uuid4())
@@ -125,7 +128,7 @@ if "messages" not in st.session_state:
     st.session_state.messages = [
         {
             "role": "system",
-            "content": "你是一个小米汽车的智能顾问。关于车辆的具体配置问题，请务必调用 search_knowledge_base 工具查询知识库。关于生活服务问题，调用地图或天气工具。"
+            "content": SYSTEM_PROMPT
         }
     ]
 
@@ -138,7 +141,7 @@ with st.sidebar:
         st.session_state.current_chat_id = str(uuid.uuid4())
         st.session_state.messages = [
             {"role": "system",
-             "content": "你是一个小米汽车的智能顾问。关于车辆的具体配置问题，请务必调用 search_knowledge_base 工具查询知识库。关于生活服务问题，调用地图或天气工具。"}
+             "content": SYSTEM_PROMPT}
         ]
         st.rerun()
 
@@ -146,7 +149,11 @@ with st.sidebar:
 
     # B. 显示历史列表
     st.subheader("历史记录")
-    history_list = history_utils.get_all_conversations()
+    # 只读取当前页的元数据，历史再多侧边栏渲染开销也不变
+    # 多取一条用于判断是否还有下一页
+    history_list = history_utils.get_all_conversations(limit=st.session_state.history_limit + 1)
+    has_more = len(history_list) > st.session_state.history_limit
+    history_list = history_list[:st.session_state.history_limit]
 
     for chat in history_list:
         # 给每个按钮唯一的 Key
@@ -171,14 +178,59 @@ with st.sidebar:
                     st.session_state.messages = [{"role": "system", "content": "你是一个小米汽车的智能顾问。"}]
                 st.rerun()
 
+    if has_more:
+        if st.button("加载更多", use_container_width=True):
+            st.session_state.history_limit += HISTORY_PAGE_SIZE
+            st.rerun()
+
     # 原来的系统信息挪到底部
     st.divider()
     with st.expander("ℹ️ 系统状态"):
         st.info(f"""
         **API:** {'✅' if API_KEY else '❌'}
-        **RAG:** {'✅' if rag_instance else '❌'}
+        **RAG:** {RAG_STATE_LABELS.get(rag_state, rag_state)}
         **Chat ID:** `{st.session_state.current_chat_id[:8]}...`
         """)
+        cache_stats = get_cache_stats()
+        if cache_stats:
+            st.caption(
+                f"问答缓存：精确命中 {cache_stats['exact_hits']}/{cache_stats['exact_hits'] + cache_stats['exact_misses']}，"
+                f"语义命中 {cache_stats['semantic_hits']}/{cache_stats['semantic_hits'] + cache_stats['semantic_misses']}"
+                f"（阈值 {cache_stats['similarity_threshold']}）"
+            )
+        if agent.prefetcher:
+            prefetch_stats = agent.prefetcher.stats()
+            st.caption(
+                f"知识库预取：命中 {prefetch_stats['hits']}/{prefetch_stats['launched']}，"
+                f"共节省 {prefetch_stats['saved_seconds']:.1f}s（每次 {prefetch_stats['mean_saved_ms']:.0f}ms）"
+            )
+        if agent.router:
+            router_stats = agent.router.stats()
+            st.caption(
+                f"本地路由：快速路径 {router_stats['fast_path']}/{router_stats['routed']}"
+                f"（阈值 {agent.router.threshold}，{agent.router.answer_mode} 回答）"
+            )
+        # 上游韧性：熔断未关闭的端点与对冲胜率
+        endpoints = resilience_metrics()
+        unhealthy = [name for name, stats in endpoints.items() if stats["state"] != "closed"]
+        hedged = [(name, stats) for name, stats in endpoints.items() if stats["hedges"]]
+        if unhealthy:
+            st.caption("⚠️ 熔断中：" + "，".join(unhealthy))
+        if hedged:
+            st.caption("对冲请求：" + "，".join(
+                f"{name} 胜 {stats['hedge_wins']}/{stats['hedges']}（超时 {stats['timeout_s']:.1f}s）"
+                for name, stats in hedged
+            ))
+        # 各阶段延迟（进程启动以来，按 p95 从高到低）
+        trace_summary = tracer.summary()
+        slowest = sorted(
+            ((name, stats) for name, stats in trace_summary.items() if "[" not in name),
+            key=lambda item: item[1]["p95_ms"], reverse=True
+        )[:5]
+        if slowest:
+            st.caption("耗时（p50 / p95）：" + "，".join(
+                f"{name} {stats['p50_ms']:.0f}/{stats['p95_ms']:.0f}ms" for name, stats in slowest
+            ))
 
 # ============ 6. 渲染当前聊天内容 ============
 for msg in st.session_state.messages:
@@ -200,42 +252,65 @@ if prompt := st.chat_input("请问关于小米 YU7 的问题..."):
     with st.chat_message("assistant"):
         status_container = st.status("🤖 AI 正在思考...", expanded=True)
         response_placeholder = st.empty()
-        full_response = ""
+        # 流式输出状态：已收到的文本、提问时刻、首个 token 到达时刻
+        stream_state = {"text": "", "started_at": time.perf_counter(), "first_token_at": None}
 
 
         # 回调函数
         def agent_callback(event_type, data):
             if event_type == 'thinking':
                 status_container.update(label=f"🤔 {data}", state="running")
+            elif event_type == 'context':
+                # 上下文超出预算被裁剪时提示
+                if data['truncated_tool_results'] or data['dropped_messages']:
+                    status_container.write(
+                        f"✂️ 上下文 {data['original_tokens']} → {data['prompt_tokens']} tokens"
+                        f"（截断 {data['truncated_tool_results']} 条工具结果，省略 {data['dropped_messages']} 条旧消息）"
+                    )
+            elif event_type == 'delta':
+                # 模型生成的 token 实时渲染
+                if stream_state["first_token_at"] is None:
+                    stream_state["first_token_at"] = time.perf_counter()
+                stream_state["text"] += data
+                response_placeholder.markdown(stream_state["text"] + "▌")
             elif event_type == 'tool_call':
+                # 工具调用前输出的文本只是中间思考，清空后等待最终回答
+                stream_state["text"] = ""
+                response_placeholder.empty()
                 status_container.write(f"🔧 正在调用工具：**{data['name']}**")
                 if data['name'] == 'search_knowledge_base':
                     status_container.write(f"📖 正在翻阅文档: {data['args'].get('query', '')}")
             elif event_type == 'tool_result':
                 result_preview = str(data['result'])[:100]
-                status_container.write(f"✓ {data['name']} 完成")
+                if data.get('cached'):
+                    status_container.write(f"♻️ {data['name']} 复用本对话中的结果")
+                elif data.get('speculative'):
+                    status_container.write(f"⚡ {data['name']} 使用预取结果")
+                else:
+                    status_container.write(f"✓ {data['name']} 完成")
             elif event_type == 'response':
-                status_container.update(label="✨ 回答生成完成", state="complete", expanded=False)
+                label = "✨ 回答生成完成"
+                if stream_state["first_token_at"] is not None:
+                    ttft = stream_state["first_token_at"] - stream_state["started_at"]
+                    label += f"（首字 {ttft:.2f}s）"
+                status_container.update(label=label, state="complete", expanded=False)
             elif event_type == 'error':
                 status_container.error(f"❌ 错误: {data}")
 
 
-        # 运行 Agent
+        # 运行 Agent（模型输出通过 delta 事件流式渲染）；相同的工具调用复用本对话记忆的结果
+        tool_memo = ToolMemo(history_utils.load_tool_memo(st.session_state.current_chat_id))
         final_response, updated_messages = agent.run_agent(
             messages=st.session_state.messages.copy(),
-            callback=agent_callback
+            callback=agent_callback,
+            memo=tool_memo
         )
+        history_utils.save_tool_memo(st.session_state.current_chat_id, tool_memo)
 
         # 更新会话状态
         st.session_state.messages = updated_messages
 
-        # 打字机效果
-        for char in final_response:
-            full_response += char
-            response_placeholder.markdown(full_response + "▌")
-            time.sleep(0.01)
-
-        response_placeholder.markdown(full_response)
+        response_placeholder.markdown(final_response)
 
         # ✨ 2. AI 回答完，再次保存完整对话
         # 注意：AgentCore 可能会返回新的 messages 列表（包含 tool calls），我们要保存这个完整的
@@ -0,0 +1,414 @@
+"""异步Agent核心 - 基于 AsyncOpenAI 的 ReAct 循环，单进程服务大量并发对话"""
+import asyncio
+import functools
+import time
+import httpx
+from openai import AsyncOpenAI
+from agent_core import (TOOLS_SCHEMA, UNCACHEABLE_RESULT_PREFIXES, _merge_tool_call_deltas, _parse_tool_args,
+                        _record_usage, _memo_lookup, _memo_store, _routed_messages, _compact_answer_messages,
+                        _degraded_result, _record_tool_outcome)
+from context_manager import ContextManager
+from prefetch import KnowledgePrefetcher, SPECULATIVE_RAG
+from router import IntentRouter, INTENT_ROUTER, ROUTE_EMPTY_RESULTS
+from resilience import CircuitOpenError, get_endpoint
+from tracing import tracer
+from tool_executor import TOOL_CONCURRENCY, DEFAULT_TOOL_CONCURRENCY, TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT
+from tools import get_weather_async, search_nearby_async, search_knowledge_base
+
+
+# 内部事件：携带最终回复，不对外产出
+_FINAL = '_final'
+
+
+async def _prepend_chunk(first, stream):
+    if first is not None:
+        yield first
+    async for chunk in stream:
+        yield chunk
+
+
+class AsyncAgentCore:
+    """
+    异步Agent核心类
+    
+    事件类型与 AgentCore 完全一致；所有对话共享同一个 httpx 连接池，
+    高德工具走原生异步请求，知识库检索放到线程中执行，不阻塞事件循环。
+    """
+    
+    def __init__(self, api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                 http_client=None, max_connections=200, context_manager=None, prefetcher=None,
+                 router=None):
+        """
+        初始化异步Agent
+        
+        Args:
+            api_key: API密钥
+            base_url: API基础URL
+            http_client: 共享的 httpx.AsyncClient，默认新建连接池
+            max_connections: 新建连接池时的最大连接数
+            context_manager: 上下文窗口管理器，默认新建 ContextManager
+            prefetcher: 知识库预取器 KnowledgePrefetcher，默认按 SPECULATIVE_RAG 决定是否开启
+            router: 本地意图路由器 IntentRouter，默认按 INTENT_ROUTER 决定是否开启
+        """
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client)
+        self.tools_schema = TOOLS_SCHEMA
+        self.tool_functions = {
+            "search_knowledge_base": functools.partial(asyncio.to_thread, search_knowledge_base),
+            "search_nearby": functools.partial(search_nearby_async, http_client=self.http_client),
+            "get_weather": functools.partial(get_weather_async, http_client=self.http_client)
+        }
+        self.context_manager = context_manager or ContextManager()
+        self.prefetcher = prefetcher or (KnowledgePrefetcher(search_knowledge_base) if SPECULATIVE_RAG else None)
+        self.router = router or (IntentRouter() if INTENT_ROUTER else None)
+        self._semaphores = {}
+    
+    def _semaphore(self, name):
+        # 在事件循环内首次使用时创建，保证绑定到当前循环
+        if name not in self._semaphores:
+            limit = TOOL_CONCURRENCY.get(name, DEFAULT_TOOL_CONCURRENCY)
+            self._semaphores[name] = asyncio.Semaphore(limit)
+        return self._semaphores[name]
+    
+    async def _call_tool(self, func_name, args, parent=None):
+        """
+        调用对应的异步工具函数（受并发上限与截止时间约束）
+        
+        Args:
+            func_name: 工具名称
+            args: 参数字典
+            parent: 工具 span 的父 span
+        
+        Returns:
+            str: 工具结果
+        """
+        if func_name not in self.tool_functions:
+            return f"未知工具: {func_name}"
+        
+        timeout = TOOL_TIMEOUTS.get(func_name, DEFAULT_TOOL_TIMEOUT)
+        endpoint = get_endpoint(f"tool.{func_name}")
+        with tracer.span(f"tool.{func_name}", parent=parent) as span:
+            if not endpoint.allow():
+                span.set(degraded=True)
+                return _degraded_result(func_name, endpoint.breaker.retry_after())
+            started = time.monotonic()
+            error = None
+            try:
+                async with self._semaphore(func_name):
+                    result = await asyncio.wait_for(self.tool_functions[func_name](**args), timeout)
+                span.set(result_chars=len(result))
+            except CircuitOpenError as e:
+                # 工具依赖的上游端点熔断中（如 amap.weather），不计入工具自身的熔断
+                span.set(degraded=True)
+                endpoint.breaker.record_success()
+                return _degraded_result(func_name, e.retry_after)
+            except asyncio.TimeoutError as e:
+                span.record_error(f"超时（{timeout}s）")
+                error = e
+                result = f"工具调用超时（{timeout}s）"
+            except Exception as e:
+                span.record_error(e)
+                error = e
+                result = f"工具调用出错: {e}"
+            _record_tool_outcome(endpoint, func_name, time.monotonic() - started, error)
+            return result
+    
+    async def _open_stream(self, span, **request):
+        """与 AgentCore._open_stream 一致：经 llm.chat 端点打开流并取得首个片段，返回从首个片段开始的异步流"""
+        endpoint = get_endpoint("llm.chat")
+        span.set(timeout_s=round(endpoint.timeout(), 3))
+        
+        async def attempt(timeout):
+            stream = await self.client.chat.completions.create(timeout=timeout, **request)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                # 对冲落败被取消或读取失败时关闭连接
+                await stream.close()
+                raise
+        
+        stream, first = await endpoint.acall(attempt, discard=lambda opened: opened[0].close())
+        return _prepend_chunk(first, stream)
+    
+    async def _claim_prefetch(self, prefetch, claimed_at, parent=None):
+        """等待认领的预取结果，截止时间与知识库工具相同"""
+        timeout = TOOL_TIMEOUTS.get("search_knowledge_base", DEFAULT_TOOL_TIMEOUT)
+        with tracer.span("tool.search_knowledge_base", parent=parent, speculative=True) as span:
+            try:
+                # shield：超时或取消时不打断后台检索，其结果仍会写入问答缓存
+                result = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(prefetch.future)),
+                    max(0.0, claimed_at + timeout - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                span.record_error(f"超时（{timeout}s）")
+                return f"工具调用超时（{timeout}s）"
+            except Exception as e:
+                span.record_error(e)
+                return f"工具调用出错: {e}"
+            saved = self.prefetcher.record_hit(prefetch, claimed_at)
+            span.set(result_chars=len(result), saved_ms=round(saved * 1000, 1))
+            return result
+    
+    async def _routed_turn(self, messages, route, model, memo, parent):
+        """本地路由快速路径，与 AgentCore._routed_turn 一致；完成时产出 _FINAL，工具失败时直接结束交回 ReAct 循环"""
+        yield 'thinking', f"本地路由：{route.intent}（置信度 {route.confidence:.2f}）"
+        yield 'tool_call', {'name': route.tool, 'args': route.args}
+        
+        result = _memo_lookup(memo, route.tool, route.args)
+        cached = result is not None
+        if not cached:
+            result = await self._call_tool(route.tool, route.args, parent=parent)
+        yield 'tool_result', {'name': route.tool, 'result': result, 'cached': cached}
+        if result.startswith(UNCACHEABLE_RESULT_PREFIXES) or result in ROUTE_EMPTY_RESULTS:
+            return
+        _memo_store(memo, route.tool, route.args, result)
+        
+        content_parts = []
+        if self.router.answer_mode == "llm":
+            llm_span = tracer.start_span("llm.chat", parent=parent, model=model, compact=True)
+            try:
+                stream = await self._open_stream(
+                    llm_span,
+                    model=model,
+                    messages=_compact_answer_messages(messages[-1]["content"], result),
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    _record_usage(llm_span, chunk)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        llm_span.mark("ttft_ms")
+                        content_parts.append(chunk.choices[0].delta.content)
+                        yield 'delta', chunk.choices[0].delta.content
+                tracer.end_span(llm_span)
+            except Exception as e:
+                tracer.end_span(llm_span, error=e)
+                content_parts = []
+        content = "".join(content_parts) or self.router.render(route, result)
+        yield 'response', content
+        messages.extend(_routed_messages(route, result, content))
+        yield _FINAL, content
+    
+    async def _agent_loop(self, messages, model, memo=None):
+        """ReAct 循环本体，最后产出一个内部 _FINAL 事件携带最终回复"""
+        max_iterations = 10  # 防止无限循环
+        iteration = 0
+        run_span = tracer.start_span("agent.run", model=model)
+        iteration_span = None
+        prefetch = None
+        
+        try:
+            new_question = messages and messages[-1]["role"] == "user"
+            if self.router and new_question:
+                route = self.router.route(messages[-1]["content"])
+                run_span.set(route=route.intent, route_confidence=round(route.confidence, 3),
+                             fast_path=route.fast_path)
+                if route.fast_path:
+                    async for event_type, data in self._routed_turn(messages, route, model, memo, run_span):
+                        yield event_type, data
+                        if event_type == _FINAL:
+                            return
+            if self.prefetcher and new_question:
+                prefetch = self.prefetcher.start(messages[-1]["content"], parent=run_span)
+            
+            while iteration < max_iterations:
+                iteration += 1
+                iteration_span = tracer.start_span("agent.iteration", parent=run_span, iteration=iteration)
+                
+                # Agent 决策
+                yield 'thinking', f"第 {iteration} 轮思考..."
+                
+                # 按 token 预算裁剪本轮发送的上下文
+                prompt_messages, context_report = self.context_manager.fit(messages)
+                iteration_span.set(context_tokens=context_report["prompt_tokens"],
+                                   dropped_messages=context_report["dropped_messages"])
+                yield 'context', context_report
+                
+                content_parts = []
+                pending_calls = {}
+                llm_span = tracer.start_span("llm.chat", parent=iteration_span, model=model)
+                try:
+                    stream = await self._open_stream(
+                        llm_span,
+                        model=model,
+                        messages=prompt_messages,
+                        tools=self.tools_schema,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                    
+                    async for chunk in stream:
+                        _record_usage(llm_span, chunk)
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        if delta.content:
+                            llm_span.mark("ttft_ms")
+                            content_parts.append(delta.content)
+                            yield 'delta', delta.content
+                        if delta.tool_calls:
+                            llm_span.mark("ttft_ms")
+                            _merge_tool_call_deltas(pending_calls, delta.tool_calls)
+                
+                except Exception as e:
+                    tracer.end_span(llm_span, error=e)
+                    run_span.record_error(e)
+                    yield 'error', str(e)
+                    yield _FINAL, f"API错误: {str(e)}"
+                    return
+                
+                tracer.end_span(llm_span)
+                run_span.add("prompt_tokens", llm_span.get("prompt_tokens", 0))
+                run_span.add("completion_tokens", llm_span.get("completion_tokens", 0))
+                content = "".join(content_parts)
+                
+                # 如果需要调用工具
+                if pending_calls:
+                    tool_calls = [pending_calls[i] for i in sorted(pending_calls)]
+                    iteration_span.set(tool_calls=len(tool_calls))
+                    messages.append({
+                        "role": "assistant",
+                        "content": content,
+                        "tool_calls": tool_calls
+                    })
+                    
+                    results = [None] * len(tool_calls)
+                    tasks = {}
+                    claimed_at = time.monotonic()
+                    for position, tool_call in enumerate(tool_calls):
+                        func_name = tool_call["function"]["name"]
+                        args, parse_error = _parse_tool_args(tool_call["function"]["arguments"])
+                        
+                        yield 'tool_call', {
+                            'name': func_name,
+                            'args': args
+                        }
+                        
+                        if parse_error:
+                            results[position] = parse_error
+                            yield 'tool_result', {'name': func_name, 'result': parse_error, 'cached': False}
+                            continue
+                        
+                        # 本对话中已有相同调用的结果时直接复用
+                        cached = _memo_lookup(memo, func_name, args)
+                        if cached is not None:
+                            results[position] = cached
+                            iteration_span.add("tool_cache_hits", 1)
+                            yield 'tool_result', {'name': func_name, 'result': cached, 'cached': True}
+                        elif (func_name == "search_knowledge_base" and self.prefetcher
+                              and self.prefetcher.match(prefetch, args.get("query", ""))):
+                            # 与用户原文足够相似：认领已在后台进行的预取检索
+                            task = asyncio.ensure_future(self._claim_prefetch(prefetch, claimed_at, parent=iteration_span))
+                            tasks[task] = (position, func_name, args, True)
+                        else:
+                            task = asyncio.ensure_future(self._call_tool(func_name, args, parent=iteration_span))
+                            tasks[task] = (position, func_name, args, False)
+                    
+                    # 并发调用工具，按完成顺序通知
+                    try:
+                        pending = set(tasks)
+                        while pending:
+                            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                            for task in sorted(done, key=lambda t: tasks[t][0]):
+                                position, func_name, args, speculative = tasks[task]
+                                results[position] = task.result()
+                                _memo_store(memo, func_name, args, results[position])
+                                event = {'name': func_name, 'result': results[position], 'cached': False}
+                                if speculative:
+                                    event['speculative'] = True
+                                yield 'tool_result', event
+                    finally:
+                        # 调用方提前停止迭代（如客户端断开）时取消未完成的工具调用
+                        for task in tasks:
+                            task.cancel()
+                    
+                    # 将工具结果按原始顺序添加到消息列表
+                    for tool_call, tool_result in zip(tool_calls, results):
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call["id"],
+                            "content": tool_result
+                        })
+                    
+                    # 继续下一轮循环，让模型根据工具结果生成回复
+                    tracer.end_span(iteration_span)
+                    continue
+                
+                # 如果模型返回了最终回复
+                yield 'response', content
+                
+                messages.append({
+                    "role": "assistant",
+                    "content": content
+                })
+                
+                yield _FINAL, content
+                return
+            
+            # 超过最大迭代次数
+            error_msg = "达到最大思考次数，请重新提问"
+            run_span.record_error(error_msg)
+            yield 'error', error_msg
+            yield _FINAL, error_msg
+        finally:
+            # 正常结束、出错或调用方提前关闭生成器时都结束 span
+            if iteration_span is not None:
+                tracer.end_span(iteration_span)
+            if prefetch is not None:
+                self.prefetcher.finish(prefetch)
+            run_span.set(iterations=iteration)
+            tracer.end_span(run_span)
+    
+    async def astream_agent(self, messages, model="qwen-plus", memo=None):
+        """
+        以异步流式方式运行Agent的ReAct循环，messages 会被原地追加
+        
+        Args:
+            messages: 对话历史消息列表
+            model: 使用的模型名称
+            memo: 本对话的工具结果记忆 ToolMemo，None 表示不记忆
+        
+        Yields:
+            tuple: (event_type, data)
+                event_type: 'thinking' | 'context' | 'delta' | 'tool_call' | 'tool_result' | 'response' | 'error'
+        """
+        async for event_type, data in self._agent_loop(messages, model, memo):
+            if event_type != _FINAL:
+                yield event_type, data
+    
+    async def run_agent(self, messages, model="qwen-plus", callback=None, memo=None):
+        """
+        运行Agent的ReAct循环
+        
+        Args:
+            messages: 对话历史消息列表
+            model: 使用的模型名称
+            callback: 回调函数 callback(event_type, data)，可以是普通函数或协程函数
+            memo: 本对话的工具结果记忆 ToolMemo，None 表示不记忆
+        
+        Returns:
+            tuple: (最终回复内容, 更新后的消息列表)
+        """
+        final_content = None
+        async for event_type, data in self._agent_loop(messages, model, memo):
+            if event_type == _FINAL:
+                final_content = data
+                continue
+            if callback:
+                result = callback(event_type, data)
+                if asyncio.iscoroutine(result):
+                    await result
+        return final_content, messages
+    
+    async def aclose(self):
+        """关闭共享连接池"""
+        await self.http_client.aclose()
@@ -0,0 +1,178 @@
+"""
+离线批量问答 - 批量跑 FAQ 问题预生成答案，或在手册更新后做回归测试
+
+问题按批处理：未命中缓存的问题一次批量向量化、组成矩阵一次向量检索，
+answer 模式下以有界并发生成答案。每批完成后把结果追加写入输出 JSONL 并落盘，
+输出文件同时是断点：中断后重新运行同一命令会跳过已完成的问题继续处理。
+检索或生成出错的问题不写入输出，重新运行时会再次处理（如上游临时故障恢复后）。
+
+输入格式：
+- .jsonl: 每行一个问题字符串，或包含 question（可选 id 及其他字段）的对象
+- .json:  问题列表，或形如 {"questions": [...]} 的问答集（如 benchmarks/golden/yu7_qa_v1.json）
+- 其他:   每行一个问题
+
+用法（在 my_agent 目录下）:
+    python batch_qa.py questions.jsonl --output answers.jsonl --batch-size 64 --concurrency 4
+    python batch_qa.py benchmarks/golden/yu7_qa_v1.json --output regression.jsonl --mode retrieval
+"""
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from tools.rag import RAGSystem
+
+load_dotenv()
+
+API_KEY = os.getenv('DASHSCOPE_API_KEY')
+
+# 知识库文档目录
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 每批问题数（一批内的问题共用一次批量向量化与矩阵检索）
+BATCH_QA_SIZE = int(os.getenv("BATCH_QA_SIZE", "64"))
+
+# answer 模式下同时生成的答案数上限
+BATCH_QA_CONCURRENCY = int(os.getenv("BATCH_QA_CONCURRENCY", "4"))
+
+
+def load_questions(path):
+    """
+    读取问题文件
+    
+    Returns:
+        list: [{"id", "question", ...}, ...]，未指定 id 时以序号作为 id
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            raw = data.get("questions", []) if isinstance(data, dict) else data
+        elif path.endswith(".jsonl"):
+            raw = [json.loads(line) for line in f if line.strip()]
+        else:
+            raw = [line.strip() for line in f if line.strip()]
+    
+    items = []
+    for index, entry in enumerate(raw):
+        item = dict(entry) if isinstance(entry, dict) else {"question": entry}
+        item["id"] = str(item.get("id", index))
+        items.append(item)
+    return items
+
+
+def load_checkpoint(path):
+    """
+    读取已完成问题的 id（path 为 error 的结果不算完成）
+    
+    中断时最后一行可能只写了一半：截断到最后一个完整行，续写时不会产生坏行。
+    
+    Returns:
+        set: 已完成的问题 id
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    valid_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if record.get("path") != "error":
+                    done.add(str(record["id"]))
+            except (ValueError, KeyError, AttributeError):
+                break
+            valid_bytes += len(line)
+    if valid_bytes < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(valid_bytes)
+    return done
+
+
+def run_batches(rag, items, output_path, batch_size=BATCH_QA_SIZE, max_concurrency=BATCH_QA_CONCURRENCY):
+    """
+    分批查询并把结果流式追加到输出 JSONL（每批完成后落盘，出错的结果不写入）
+    
+    Args:
+        rag: 已初始化的 RAGSystem
+        items: 待处理的问题 [{"id", "question", ...}, ...]
+        output_path: 输出 JSONL 路径
+        batch_size: 每批问题数
+        max_concurrency: 生成并发上限
+    
+    Returns:
+        dict: questions / seconds / questions_per_second / paths（各缓存路径计数）
+    """
+    paths = {}
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as f:
+        for offset in range(0, len(items), batch_size):
+            batch = items[offset:offset + batch_size]
+            results = rag.query_batch([item["question"] for item in batch], max_concurrency=max_concurrency)
+            for item, result in zip(batch, results):
+                paths[result["path"]] = paths.get(result["path"], 0) + 1
+                if result["path"] == "error":
+                    continue
+                f.write(json.dumps(dict(item, result=result["result"], path=result["path"]),
+                                   ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            
+            completed = offset + len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"📦 {completed}/{len(items)}，{completed / elapsed:.1f} 问/秒")
+    
+    elapsed = time.perf_counter() - started
+    return {
+        "questions": len(items),
+        "seconds": round(elapsed, 3),
+        "questions_per_second": round(len(items) / elapsed, 2) if elapsed else 0.0,
+        "paths": paths,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量问答")
+    parser.add_argument("input", help="问题文件（.jsonl / .json / 每行一个问题）")
+    parser.add_argument("--output", required=True, help="结果 JSONL 路径（同时作为断点）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_QA_SIZE, help="每批问题数")
+    parser.add_argument("--concurrency", type=int, default=BATCH_QA_CONCURRENCY, help="answer 模式下的生成并发上限")
+    parser.add_argument("--mode", choices=["answer", "retrieval"], help="查询模式，默认读取 RAG_MODE")
+    parser.add_argument("--data", default=DATA_DIR, help="文档路径或目录")
+    parser.add_argument("--index-dir", help="向量索引目录，默认 my_agent/vector_store")
+    parser.add_argument("--restart", action="store_true", help="忽略已有结果，从头开始")
+    args = parser.parse_args()
+    
+    items = load_questions(args.input)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    todo = [item for item in items if item["id"] not in done]
+    print(f"📋 共 {len(items)} 个问题，已完成 {len(items) - len(todo)}，待处理 {len(todo)}")
+    if not todo:
+        return 0
+    
+    if not API_KEY:
+        print("⚠️ 未设置 DASHSCOPE_API_KEY")
+    rag = RAGSystem(args.data, API_KEY, index_dir=args.index_dir, mode=args.mode)
+    if not rag.initialize():
+        print(f"❌ 知识库初始化失败: {rag.error}")
+        return 1
+    
+    try:
+        summary = run_batches(rag, todo, args.output, args.batch_size, args.concurrency)
+    except KeyboardInterrupt:
+        print(f"⏸️ 已中断，重新运行同一命令即可从断点继续（{args.output}）")
+        return 130
+    print(f"✅ 完成 {summary['questions']} 个问题，耗时 {summary['seconds']}s，"
+          f"{summary['questions_per_second']} 问/秒，路径分布 {summary['paths']}")
+    failed = summary["paths"].get("error", 0)
+    if failed:
+        print(f"⚠️ {failed} 个问题出错未写入，重新运行同一命令即可重试")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+"""基准测试与本地模拟上游服务"""
@@ -0,0 +1,141 @@
+"""
+异步Agent并发压测
+
+对本地模拟的 OpenAI 兼容接口与高德接口，比较 AsyncAgentCore（单事件循环）
+与 AgentCore（线程池）在大量并发对话下的吞吐与延迟。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_async_agent --conversations 500 --concurrency 200 --mode both
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.metrics import summarize_latencies
+from benchmarks.mock_servers import LatencyModel, fetch_stats, start_server_process
+
+PROMPTS = [
+    "北京今天天气怎么样",
+    "帮我找一下上海的小米之家",
+    "杭州天气如何",
+    "你好，介绍一下你自己",
+]
+
+
+def _conversation(i):
+    return [
+        {"role": "system", "content": "你是一个小米汽车的智能顾问。"},
+        {"role": "user", "content": PROMPTS[i % len(PROMPTS)]},
+    ]
+
+
+def _report(name, latencies, errors, elapsed, extra=None):
+    report = {
+        "mode": name,
+        "conversations": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round((len(latencies) + errors) / elapsed, 2) if elapsed else 0.0,
+        "latency": summarize_latencies(latencies),
+    }
+    report.update(extra or {})
+    lat = report["latency"]
+    print(f"[{name:>5}] {report['throughput_per_second']:>8} 对话/秒  "
+          f"p50 {lat['p50_ms']}ms  p95 {lat['p95_ms']}ms  p99 {lat['p99_ms']}ms  错误 {errors}")
+    return report
+
+
+async def _run_async(base_url, conversations, concurrency):
+    from async_agent_core import AsyncAgentCore
+    
+    agent = AsyncAgentCore(api_key="mock", base_url=base_url + "/v1", max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            final, _ = await agent.run_agent(_conversation(i))
+            if final is None or final.startswith("API错误"):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(conversations)))
+    elapsed = time.perf_counter() - started
+    await agent.aclose()
+    return _report("async", latencies, errors, elapsed)
+
+
+def _run_sync(base_url, conversations, concurrency):
+    from agent_core import AgentCore
+    
+    agent = AgentCore(api_key="mock", base_url=base_url + "/v1")
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    
+    def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        final, _ = agent.run_agent(_conversation(i))
+        with lock:
+            if final is None or final.startswith("API错误"):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(conversations)))
+    elapsed = time.perf_counter() - started
+    return _report("sync", latencies, errors, elapsed, {"threads": concurrency})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步Agent并发压测")
+    parser.add_argument("--conversations", type=int, default=500, help="对话总数")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时进行的对话数")
+    parser.add_argument("--chat-latency", default="0.2", help="模型首 token 延迟分布")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="流式片段间隔秒数")
+    parser.add_argument("--amap-latency", default="0.05", help="高德接口延迟分布")
+    parser.add_argument("--mode", choices=["async", "sync", "both"], default="async")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    # 模拟服务放在独立进程，避免与被测客户端争抢 GIL
+    base_url, server_process = start_server_process(
+        chat_latency=LatencyModel.parse(args.chat_latency),
+        chat_token_interval=args.token_interval,
+        amap_latency=LatencyModel.parse(args.amap_latency),
+    )
+    # 工具模块在导入时读取高德地址，必须先设置环境变量
+    os.environ["AMAP_BASE_URL"] = base_url
+    os.environ.setdefault("AMAP_KEY", "mock")
+    
+    results = []
+    try:
+        if args.mode in ("async", "both"):
+            results.append(asyncio.run(_run_async(base_url, args.conversations, args.concurrency)))
+        if args.mode in ("sync", "both"):
+            results.append(_run_sync(base_url, args.conversations, args.concurrency))
+        server_stats = fetch_stats(base_url)
+    finally:
+        server_process.terminate()
+    
+    report = {"config": vars(args), "results": results, "server": server_stats}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
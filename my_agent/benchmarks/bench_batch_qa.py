@@ -0,0 +1,110 @@
+"""
+离线批量问答吞吐基准
+
+使用本地桩向量 / 对话模型（可模拟每次请求的延迟），比较逐条 query 与不同批大小的
+query_batch 的吞吐（问/秒）与向量请求次数。问题由金标准问答集循环生成并加上编号，
+每轮使用全新的问答缓存，避免轮次之间互相命中。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_batch_qa --questions 400 --batch-sizes 1,16,64,256 \\
+        --embed-latency 0.05 --chat-latency 0.2 --mode answer --output batch_qa.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_rag import DEFAULT_GOLDEN, load_golden
+from benchmarks.mock_servers import LatencyModel
+from benchmarks.stub_models import StubEmbeddings, stub_chat_model
+
+
+def _fresh_cache(rag):
+    from tools.answer_cache import AnswerCache
+    
+    rag.answer_cache = AnswerCache(
+        max_entries=rag.answer_cache.max_entries,
+        ttl=rag.answer_cache.ttl,
+        similarity_threshold=rag.answer_cache.similarity_threshold
+    )
+
+
+def _run(rag, stub, questions, batch_size, concurrency):
+    """一轮测量；batch_size=None 表示逐条调用 query"""
+    _fresh_cache(rag)
+    calls_before = stub.calls
+    paths = {}
+    started = time.perf_counter()
+    if batch_size is None:
+        for question in questions:
+            rag.query(question)
+    else:
+        for offset in range(0, len(questions), batch_size):
+            for result in rag.query_batch(questions[offset:offset + batch_size], max_concurrency=concurrency):
+                paths[result["path"]] = paths.get(result["path"], 0) + 1
+    elapsed = time.perf_counter() - started
+    return {
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "questions_per_second": round(len(questions) / elapsed, 2),
+        "embedding_requests": stub.calls - calls_before,
+        "paths": paths,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量问答吞吐基准")
+    parser.add_argument("--data", default="data", help="文档路径或目录")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN, help="问题来源（金标准问答集 JSON）")
+    parser.add_argument("--questions", type=int, default=400, help="问题总数")
+    parser.add_argument("--batch-sizes", default="1,16,64,256", help="逗号分隔的批大小")
+    parser.add_argument("--concurrency", type=int, default=4, help="answer 模式下的生成并发上限")
+    parser.add_argument("--dim", type=int, default=256, help="桩向量维度")
+    parser.add_argument("--embed-latency", default="0.05", help="桩向量模型每次请求延迟分布")
+    parser.add_argument("--chat-latency", default="0.2", help="桩对话模型每次调用延迟分布")
+    parser.add_argument("--mode", choices=["retrieval", "answer"], default="retrieval", help="知识库查询模式")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    from tools.embedding import BatchedEmbeddings
+    from tools.rag import RAGSystem
+    
+    golden = load_golden(args.golden)["questions"]
+    questions = [f"{golden[i % len(golden)]['question']} #{i}" for i in range(args.questions)]
+    
+    index_dir = tempfile.mkdtemp(prefix="bench_batch_qa_")
+    stub = StubEmbeddings(dim=args.dim, latency=LatencyModel.parse(args.embed_latency))
+    rag = RAGSystem(
+        args.data, "stub",
+        index_dir=index_dir,
+        mode=args.mode,
+        embeddings=BatchedEmbeddings(stub),
+        llm=stub_chat_model(latency=LatencyModel.parse(args.chat_latency))
+    )
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not rag.initialize():
+                raise RuntimeError(f"知识库初始化失败: {rag.error}")
+        
+        runs = [_run(rag, stub, questions, None, args.concurrency)]
+        for batch_size in (int(value) for value in args.batch_sizes.split(",")):
+            runs.append(_run(rag, stub, questions, batch_size, args.concurrency))
+        for run in runs:
+            label = "逐条 query" if run["batch_size"] is None else f"batch={run['batch_size']}"
+            print(f"{label:<12} {run['questions_per_second']:>8} 问/秒  耗时 {run['seconds']}s  "
+                  f"向量请求 {run['embedding_requests']} 次  {run['paths'] or ''}")
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    
+    report = {"config": vars(args), "runs": runs}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
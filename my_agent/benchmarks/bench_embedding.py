@@ -0,0 +1,81 @@
+"""
+向量化管线基准测试
+
+对本地模拟 DashScope 向量服务，比较不同批大小 / 并发度下的建索引吞吐。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_embedding --chunks 2000 --latency 0.05 --workers 1,4,8
+"""
+import argparse
+import json
+import os
+import random
+
+from benchmarks.mock_servers import LatencyModel, MockUpstreamServer
+
+
+def _make_chunks(count, chars):
+    """生成随机中文文档块"""
+    alphabet = "小米汽车续航充电电池电机底盘悬架座舱智能驾驶激光雷达高压快充CLTCkWh0123456789"
+    return ["".join(random.choices(alphabet, k=chars)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量化管线吞吐基准")
+    parser.add_argument("--chunks", type=int, default=1000, help="文档块数量")
+    parser.add_argument("--chunk-chars", type=int, default=500, help="每块字符数")
+    parser.add_argument("--batch-sizes", default="25", help="批大小，逗号分隔")
+    parser.add_argument("--workers", default="1,4,8", help="并发度，逗号分隔")
+    parser.add_argument("--latency", default="0.05", help="服务端延迟分布，如 0.05 或 lognormal:0.05:0.5")
+    parser.add_argument("--server-rps", type=int, default=0, help="服务端每秒请求上限，超过返回 429")
+    parser.add_argument("--rps", type=float, default=0, help="客户端请求限速")
+    parser.add_argument("--tps", type=float, default=0, help="客户端 token 限速")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    server = MockUpstreamServer(
+        embedding_latency=LatencyModel.parse(args.latency),
+        embedding_max_rps=args.server_rps or None,
+    )
+    base_url = server.start()
+    os.environ["DASHSCOPE_HTTP_BASE_URL"] = base_url + "/api/v1"
+    
+    import dashscope
+    from langchain_community.embeddings.dashscope import DashScopeEmbeddings
+    from tools.embedding import BatchedEmbeddings
+    
+    dashscope.base_http_api_url = base_url + "/api/v1"
+    chunks = _make_chunks(args.chunks, args.chunk_chars)
+    results = []
+    
+    try:
+        for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+            for workers in [int(x) for x in args.workers.split(",")]:
+                embeddings = BatchedEmbeddings(
+                    DashScopeEmbeddings(model="text-embedding-v2", dashscope_api_key="mock", max_retries=1),
+                    batch_size=batch_size,
+                    max_workers=workers,
+                    requests_per_second=args.rps or None,
+                    tokens_per_second=args.tps or None,
+                    backoff_base=0.2,
+                )
+                vectors = embeddings.embed_documents(chunks)
+                assert len(vectors) == len(chunks)
+                stats = embeddings.stats.as_dict()
+                stats.update({"batch_size": batch_size, "workers": workers})
+                results.append(stats)
+                print(f"batch={batch_size:>3} workers={workers:>2} "
+                      f"{stats['chunks_per_second']:>9} 块/秒 {stats['tokens_per_second']:>11} tokens/秒 "
+                      f"重试 {stats['retries']}（限流 {stats['throttled']}）")
+    finally:
+        server.stop()
+    
+    report = {"config": vars(args), "results": results, "server": server.stats}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+向量索引类型基准测试
+
+在合成的聚类向量（或 --vectors 指定的 .npy 矩阵）上，对比 Flat / HNSW / IVF-Flat / IVF-PQ
+在不同 nprobe / efSearch 下的召回率（相对精确检索的 top-k 重合率）与单次查询延迟，
+同时给出构建耗时、索引大小，以及当前内存预算下自动选择的索引类型。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_index --count 200000 --dim 256 --memory-mb 128 --output index.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.metrics import summarize_latencies
+from tools import vector_index
+
+
+def make_vectors(count, dim, clusters=256, seed=0):
+    """生成带聚类结构的归一化向量（比均匀随机更接近真实文本向量的分布）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    vector_index.faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _recall(found, truth):
+    """top-k 重合率"""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def measure(index, queries, truth, k, params=None):
+    """
+    逐条查询测量延迟与召回率
+    
+    Returns:
+        dict: recall 与延迟统计
+    """
+    latencies = []
+    found = []
+    for query in queries:
+        started = time.perf_counter()
+        _, positions = index.search(query[None, :], k, params=params)
+        latencies.append(time.perf_counter() - started)
+        found.append(positions[0])
+    result = {"recall": round(_recall(np.array(found), truth), 4)}
+    result.update(summarize_latencies(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引召回率 / 延迟权衡")
+    parser.add_argument("--count", type=int, default=100000, help="合成向量数")
+    parser.add_argument("--dim", type=int, default=256, help="合成向量维度")
+    parser.add_argument("--vectors", help="使用 .npy 向量矩阵代替合成数据")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--k", type=int, default=8, help="每次返回的近邻数")
+    parser.add_argument("--memory-mb", type=float, default=vector_index.RAG_INDEX_MEMORY_MB, help="内存预算")
+    parser.add_argument("--specs", help="分号分隔的 index_factory 字符串，如 \"HNSW32;IVF256,PQ16\"，默认自动生成候选")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF 探查数扫描")
+    parser.add_argument("--ef-search", default="16,32,64,128", help="HNSW efSearch 扫描")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        vector_index.faiss.normalize_L2(vectors)
+    else:
+        vectors = make_vectors(args.count, args.dim)
+    count, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(count, args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    vector_index.faiss.normalize_L2(queries)
+    
+    nlist = vector_index._nlist_for(count)
+    pq = next((m for m in (32, 16, 8) if dim % m == 0), 4)
+    if args.specs:
+        specs = [spec.strip() for spec in args.specs.split(";") if spec.strip()]
+    else:
+        specs = ["Flat", f"HNSW{vector_index.HNSW_M}", f"IVF{nlist},Flat", f"IVF{nlist},PQ{pq}"]
+    chosen = vector_index.choose_index_spec(count, dim, args.memory_mb * 2 ** 20)
+    print(f"📐 {count} 条 {dim} 维向量，内存预算 {args.memory_mb}MB，自动选择: {chosen}")
+    
+    exact = vector_index.build_index(vectors, "Flat")
+    _, truth = exact.search(queries, args.k)
+    
+    results = []
+    for spec in specs:
+        started = time.perf_counter()
+        index = vector_index.build_index(vectors, spec)
+        build_seconds = time.perf_counter() - started
+        size = vector_index.index_bytes(index)
+        
+        if vector_index.faiss.try_extract_index_ivf(index) is not None:
+            sweep = [("nprobe", int(v)) for v in args.nprobe.split(",")]
+        elif hasattr(index, "hnsw"):
+            sweep = [("efSearch", int(v)) for v in args.ef_search.split(",")]
+        else:
+            sweep = [(None, None)]
+        
+        for name, value in sweep:
+            params = None
+            if name == "nprobe":
+                params = vector_index.search_parameters(index, nprobe=value)
+            elif name == "efSearch":
+                params = vector_index.search_parameters(index, ef_search=value)
+            result = measure(index, queries, truth, args.k, params)
+            result.update({
+                "spec": spec,
+                "param": name,
+                "value": value,
+                "build_seconds": round(build_seconds, 3),
+                "index_mb": round(size / 2 ** 20, 2),
+                "estimated_mb": round(vector_index.estimate_index_bytes(spec, count, dim) / 2 ** 20, 2),
+            })
+            results.append(result)
+            label = f"{spec} {name}={value}" if name else spec
+            print(f"{label:<28} recall@{args.k}={result['recall']:.3f} "
+                  f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                  f"大小 {result['index_mb']}MB 构建 {result['build_seconds']}s")
+    
+    report = {"config": vars(args), "count": count, "dim": dim, "auto_spec": chosen, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
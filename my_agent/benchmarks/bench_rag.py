@@ -0,0 +1,214 @@
+"""
+RAG 流水线基准测试与检索质量评估
+
+使用本地桩向量 / 对话模型（不消耗 API 配额），测量建索引耗时、检索延迟、
+端到端 search_knowledge_base 延迟与内存占用，并基于版本化的 YU7 金标准问答集
+计算 recall@k 与 MRR。结果写为 JSON，便于逐次对比切分参数、索引类型与缓存策略的影响。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_rag --chunk-size 500 --k 4 --output rag_500.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.metrics import summarize_latencies
+from benchmarks.mock_servers import LatencyModel
+from benchmarks.stub_models import StubEmbeddings, stub_chat_model
+
+DEFAULT_GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "yu7_qa_v1.json")
+
+
+def load_golden(path):
+    """读取金标准问答集"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _is_relevant(hit, item):
+    """文档块包含任一证据短语即视为相关"""
+    return any(evidence in hit["content"] for evidence in item["evidence"])
+
+
+def evaluate(rag, questions, k, retriever="hybrid"):
+    """
+    计算检索质量
+    
+    Args:
+        rag: 已初始化的 RAGSystem
+        questions: 金标准问题列表
+        k: 截断名次
+        retriever: "hybrid" | "vector" | "bm25"
+    
+    Returns:
+        dict: recall@1 / recall@k / mrr 以及未命中的问题 ID
+    """
+    hits_at_1 = 0
+    hits_at_k = 0
+    reciprocal_ranks = []
+    misses = []
+    for item in questions:
+        # 评估时放开 token 预算，只看排序
+        options = {"k": k, "token_budget": 10 ** 9}
+        if retriever == "vector":
+            options["lexical_hits"] = []
+        elif retriever == "bm25":
+            options["use_vector"] = False
+        hits = rag.retrieve(item["question"], **options)
+        
+        rank = next((i for i, hit in enumerate(hits, 1) if _is_relevant(hit, item)), None)
+        if rank is None:
+            reciprocal_ranks.append(0.0)
+            misses.append(item["id"])
+            continue
+        hits_at_1 += rank == 1
+        hits_at_k += 1
+        reciprocal_ranks.append(1.0 / rank)
+    
+    total = len(questions) or 1
+    return {
+        "recall@1": round(hits_at_1 / total, 4),
+        f"recall@{k}": round(hits_at_k / total, 4),
+        "mrr": round(sum(reciprocal_ranks) / total, 4),
+        "misses": misses,
+    }
+
+
+def _build(rag_module, data_path, index_dir, args):
+    """构建（或加载）索引并计时"""
+    from tools.embedding import BatchedEmbeddings
+    
+    stub = StubEmbeddings(dim=args.dim, latency=LatencyModel.parse(args.embed_latency))
+    rag = rag_module.RAGSystem(
+        data_path, "stub",
+        index_dir=index_dir,
+        mode=args.mode,
+        embeddings=BatchedEmbeddings(stub, batch_size=args.batch_size),
+        llm=stub_chat_model(latency=LatencyModel.parse(args.chat_latency)),
+        index_type=args.index_type
+    )
+    started = time.perf_counter()
+    if not rag.initialize():
+        raise RuntimeError(f"知识库初始化失败: {rag.error}")
+    return rag, time.perf_counter() - started, stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 流水线基准与检索质量评估")
+    parser.add_argument("--data", default="data", help="文档路径或目录")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN, help="金标准问答集 JSON")
+    parser.add_argument("--chunk-size", type=int, help="切分块大小，默认使用 rag.CHUNK_SIZE")
+    parser.add_argument("--chunk-overlap", type=int, help="切分重叠，默认使用 rag.CHUNK_OVERLAP")
+    parser.add_argument("--k", type=int, default=4, help="检索返回块数")
+    parser.add_argument("--dim", type=int, default=256, help="桩向量维度")
+    parser.add_argument("--batch-size", type=int, default=25, help="向量化批大小")
+    parser.add_argument("--embed-latency", default="0", help="桩向量模型每次请求延迟分布")
+    parser.add_argument("--chat-latency", default="0", help="桩对话模型每次调用延迟分布")
+    parser.add_argument("--index-type", default="auto", help="检索索引类型：auto 或 FAISS index_factory 字符串")
+    parser.add_argument("--mode", choices=["retrieval", "answer"], default="retrieval", help="知识库查询模式")
+    parser.add_argument("--repeat", type=int, default=5, help="延迟测量轮数")
+    parser.add_argument("--index-dir", help="索引目录，默认使用临时目录（每次冷启动构建）")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    import tools.rag as rag_module
+    
+    if args.chunk_size:
+        rag_module.CHUNK_SIZE = args.chunk_size
+    if args.chunk_overlap is not None:
+        rag_module.CHUNK_OVERLAP = args.chunk_overlap
+    
+    golden = load_golden(args.golden)
+    questions = golden["questions"]
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="bench_rag_")
+    
+    try:
+        # 1. 建索引（冷启动）与从磁盘加载（热启动）
+        tracemalloc.start()
+        rag, build_seconds, stub = _build(rag_module, args.data, index_dir, args)
+        _, build_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        build_calls = stub.calls
+        rag, load_seconds, _ = _build(rag_module, args.data, index_dir, args)
+        
+        index = rag.vector_store.index
+        print(f"📦 {index.ntotal} 个文档块，建索引 {build_seconds:.3f}s（向量请求 {build_calls} 次），"
+              f"加载 {load_seconds:.3f}s")
+        
+        # 2. 检索质量
+        quality = {name: evaluate(rag, questions, args.k, name) for name in ("hybrid", "vector", "bm25")}
+        for name, result in quality.items():
+            print(f"🎯 {name:<6} recall@1={result['recall@1']:.3f} "
+                  f"recall@{args.k}={result[f'recall@{args.k}']:.3f} MRR={result['mrr']:.3f}")
+        
+        # 3. 检索延迟（不含缓存与生成）
+        retrieve_latencies = []
+        for _ in range(args.repeat):
+            for item in questions:
+                started = time.perf_counter()
+                rag.retrieve(item["question"], k=args.k)
+                retrieve_latencies.append(time.perf_counter() - started)
+        
+        # 4. 端到端工具延迟：首轮缓存为空，之后各轮命中缓存
+        rag_module._rag_instance = rag
+        cold_latencies, warm_latencies = [], []
+        for round_index in range(max(2, args.repeat)):
+            for item in questions:
+                started = time.perf_counter()
+                # 屏蔽工具自身的检索日志
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rag_module.search_knowledge_base(item["question"])
+                elapsed = time.perf_counter() - started
+                (cold_latencies if round_index == 0 else warm_latencies).append(elapsed)
+        
+        latency = {
+            "retrieve": summarize_latencies(retrieve_latencies),
+            "search_knowledge_base_cold": summarize_latencies(cold_latencies),
+            "search_knowledge_base_warm": summarize_latencies(warm_latencies),
+        }
+        for name, summary in latency.items():
+            print(f"⏱️ {name:<28} p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms")
+        
+        memory = {
+            "build_peak_python_mb": round(build_peak / 2 ** 20, 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+            "vector_bytes": int(index.ntotal * index.d * 4),
+        }
+        print(f"💾 建索引 Python 峰值 {memory['build_peak_python_mb']}MB，进程 RSS {memory['max_rss_mb']}MB")
+        
+        report = {
+            "config": dict(vars(args), chunk_size=rag_module.CHUNK_SIZE, chunk_overlap=rag_module.CHUNK_OVERLAP),
+            "golden": {"name": golden["name"], "version": golden["version"], "questions": len(questions)},
+            "index": {
+                "spec": rag.index_spec,
+                "chunks": index.ntotal,
+                "dim": index.d,
+                "build_seconds": round(build_seconds, 4),
+                "load_seconds": round(load_seconds, 4),
+                "embedding_requests": build_calls,
+            },
+            "quality": quality,
+            "latency": latency,
+            "memory": memory,
+            "cache": rag_module.get_cache_stats(),
+        }
+    finally:
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+录制对话回放压测
+
+把 chat_histories 中真实的多轮对话（含工具调用）按设定的到达率与并发度回放给 AgentCore：
+模拟的对话接口按录制内容逐步返回当时模型的决策（工具调用与回复），
+高德与 DashScope 向量接口同样由本地模拟服务提供，三者的延迟分布均可注入。
+
+每个到达率报告：
+- 吞吐（轮/秒、对话/秒）与排队等待（到达后等待空闲并发槽的时间）
+- 每轮延迟与首 token 延迟的 p50 / p95 / p99
+- 每轮的模型轮数与工具调用数
+- 错误率（出现 error 事件的轮）与工具错误率（超时、出错、知识库不可用等）
+
+结束时附带各上游端点的韧性指标（自适应超时、对冲次数与胜率、熔断状态，见 resilience），
+注入长尾延迟（如 --chat-latency lognormal:0.3:1.0）并对比 HEDGE_REQUESTS=0 / 1 即可评估对冲效果。
+
+逐步提高 --rates 直到吞吐不再增长、排队等待快速上升，即为饱和点；
+--baseline 与上次的结果对比，p95 延迟或吞吐劣化超过 --tolerance 时以非零状态退出。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_replay --rates 1,2,4,8 --conversations 40 --concurrency 16 \\
+        --chat-latency lognormal:0.3:0.4 --amap-latency 0.05 --output replay.json
+    python -m benchmarks.bench_replay --rates 4 --baseline replay.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_router import DEFAULT_HISTORY_DIR, load_db_conversations, load_json_conversations
+from benchmarks.metrics import summarize_latencies
+from benchmarks.mock_servers import LatencyModel, fetch_stats, scripted_chat_reply, start_server_process
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 视为失败的最终回复
+FAILED_REPLIES = ("API错误", "达到最大思考次数")
+
+
+def extract_turns(messages):
+    """
+    拆分录制对话的轮次
+    
+    Returns:
+        list: [(用户消息, [该轮的 assistant 消息, ...]), ...]，没有回复的用户消息跳过
+    """
+    turns = []
+    for index, message in enumerate(messages):
+        if message.get("role") != "user" or not isinstance(message.get("content"), str):
+            continue
+        replies = []
+        for follow in messages[index + 1:]:
+            if follow.get("role") == "user":
+                break
+            if follow.get("role") == "assistant":
+                replies.append(follow)
+        if replies:
+            turns.append((message["content"], replies))
+    return turns
+
+
+class ReplayScript:
+    """
+    按录制内容回放的对话决策（MockUpstreamServer 的 chat_reply，可 pickle 到模拟服务子进程）
+    
+    以最后一条用户消息定位录制的轮次，以其后已有的 assistant 消息数定位该轮的第几步；
+    录制中没有的消息或步数退回 scripted_chat_reply。
+    """
+    
+    def __init__(self, conversations):
+        self.replies = {}
+        for messages in conversations:
+            for text, replies in extract_turns(messages):
+                self.replies.setdefault(text, replies)
+    
+    def __call__(self, messages):
+        user_index = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].get("role") == "user"), None)
+        if user_index is None:
+            return scripted_chat_reply(messages)
+        replies = self.replies.get(messages[user_index].get("content"))
+        step = sum(1 for message in messages[user_index + 1:] if message.get("role") == "assistant")
+        if not replies or step >= len(replies):
+            return scripted_chat_reply(messages)
+        
+        reply = replies[step]
+        tool_calls = []
+        for call in reply.get("tool_calls") or []:
+            try:
+                arguments = json.loads(call["function"].get("arguments") or "{}")
+            except json.JSONDecodeError:
+                arguments = {}
+            tool_calls.append({"id": "call_" + uuid.uuid4().hex[:16],
+                               "name": call["function"]["name"], "arguments": arguments})
+        return reply.get("content") or "", tool_calls
+
+
+def _replay_session(agent, turns, think_time, scheduled_at):
+    """回放一段对话，返回每轮的测量结果"""
+    from agent_core import SYSTEM_PROMPT, UNCACHEABLE_RESULT_PREFIXES
+    from tool_memo import ToolMemo
+    
+    queue_wait = time.perf_counter() - scheduled_at
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    memo = ToolMemo()
+    results = []
+    for index, (text, _) in enumerate(turns):
+        if index:
+            time.sleep(think_time.sample())
+        messages.append({"role": "user", "content": text})
+        turn = {"iterations": 0, "tool_calls": 0, "tool_errors": 0, "cached": 0,
+                "error": False, "first_token_s": None}
+        started = time.perf_counter()
+        
+        def callback(event_type, data):
+            if event_type == 'context':
+                turn["iterations"] += 1
+            elif event_type == 'delta' and turn["first_token_s"] is None:
+                turn["first_token_s"] = time.perf_counter() - started
+            elif event_type == 'tool_result':
+                turn["tool_calls"] += 1
+                turn["cached"] += bool(data.get('cached'))
+                turn["tool_errors"] += str(data['result']).startswith(UNCACHEABLE_RESULT_PREFIXES)
+            elif event_type == 'error':
+                turn["error"] = True
+        
+        try:
+            final, messages = agent.run_agent(messages, callback=callback, memo=memo)
+            turn["error"] = turn["error"] or final is None or final.startswith(FAILED_REPLIES)
+        except Exception:
+            turn["error"] = True
+        turn["latency_s"] = time.perf_counter() - started
+        results.append(turn)
+    return queue_wait, results
+
+
+def run_load(agent, sessions, rate, concurrency, think_time):
+    """
+    按泊松到达回放一组对话
+    
+    Args:
+        agent: AgentCore
+        sessions: [[(用户消息, 录制回复), ...], ...]
+        rate: 每秒到达的对话数，0 表示全部同时到达（只受并发度限制）
+        concurrency: 同时进行的对话数上限
+        think_time: 同一对话两轮之间的用户思考时间分布
+    
+    Returns:
+        dict: 吞吐、延迟、模型轮数、错误率等汇总
+    """
+    futures = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        arrival = 0.0
+        for turns in sessions:
+            if rate > 0:
+                arrival += random.expovariate(rate)
+                delay = started + arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(_replay_session, agent, turns, think_time, time.perf_counter()))
+        outcomes = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    
+    turns = [turn for _, results in outcomes for turn in results]
+    total = len(turns) or 1
+    iterations = {}
+    for turn in turns:
+        iterations[turn["iterations"]] = iterations.get(turn["iterations"], 0) + 1
+    tool_calls = sum(turn["tool_calls"] for turn in turns)
+    return {
+        "rate": rate,
+        "conversations": len(sessions),
+        "turns": len(turns),
+        "elapsed_seconds": round(elapsed, 3),
+        "turns_per_second": round(len(turns) / elapsed, 2),
+        "conversations_per_second": round(len(sessions) / elapsed, 2),
+        "latency": summarize_latencies([turn["latency_s"] for turn in turns]),
+        "first_token": summarize_latencies([turn["first_token_s"] for turn in turns
+                                            if turn["first_token_s"] is not None]),
+        "queue_wait": summarize_latencies([queue_wait for queue_wait, _ in outcomes]),
+        "iterations_per_turn": round(sum(turn["iterations"] for turn in turns) / total, 3),
+        "iterations_histogram": {str(k): v for k, v in sorted(iterations.items())},
+        "tool_calls_per_turn": round(tool_calls / total, 3),
+        "tool_cache_hits": sum(turn["cached"] for turn in turns),
+        "error_rate": round(sum(turn["error"] for turn in turns) / total, 4),
+        "tool_error_rate": round(sum(turn["tool_errors"] for turn in turns) / tool_calls, 4) if tool_calls else 0.0,
+    }
+
+
+def compare_baseline(results, baseline, tolerance):
+    """
+    与基线结果按到达率对比
+    
+    Returns:
+        list: 劣化项说明，空列表表示没有劣化
+    """
+    previous = {run["rate"]: run for run in baseline.get("results", [])}
+    regressions = []
+    for run in results:
+        base = previous.get(run["rate"])
+        if base is None:
+            continue
+        if run["latency"]["p95_ms"] > base["latency"]["p95_ms"] * (1 + tolerance):
+            regressions.append(f"rate={run['rate']} p95 {base['latency']['p95_ms']}ms → {run['latency']['p95_ms']}ms")
+        if run["turns_per_second"] < base["turns_per_second"] * (1 - tolerance):
+            regressions.append(f"rate={run['rate']} 吞吐 {base['turns_per_second']} → {run['turns_per_second']} 轮/秒")
+        if run["error_rate"] > base["error_rate"] + tolerance / 10:
+            regressions.append(f"rate={run['rate']} 错误率 {base['error_rate']} → {run['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制对话回放压测")
+    parser.add_argument("--history-dir", default=DEFAULT_HISTORY_DIR, help="chat_*.json 所在目录")
+    parser.add_argument("--history-db", help="额外读取的 history.db 路径")
+    parser.add_argument("--rates", default="0", help="逗号分隔的到达率（对话/秒），0 表示全部同时到达")
+    parser.add_argument("--conversations", type=int, default=40, help="每个到达率回放的对话数（循环取录制对话）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时进行的对话数上限")
+    parser.add_argument("--think-time", default="0", help="同一对话两轮之间的思考时间分布")
+    parser.add_argument("--chat-latency", default="lognormal:0.3:0.4", help="模型首 token 延迟分布")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="流式片段间隔秒数")
+    parser.add_argument("--amap-latency", default="0.05", help="高德接口延迟分布")
+    parser.add_argument("--embed-latency", default="0.05", help="向量接口延迟分布")
+    parser.add_argument("--data", default=os.path.join(AGENT_DIR, "data"), help="知识库文档路径或目录")
+    parser.add_argument("--seed", type=int, default=0, help="到达时间的随机种子")
+    parser.add_argument("--baseline", help="基线结果 JSON，用于回归对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对劣化比例")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    conversations = load_json_conversations(args.history_dir)
+    if args.history_db:
+        conversations += load_db_conversations(args.history_db)
+    recorded = [turns for turns in (extract_turns(messages) for messages in conversations) if turns]
+    if not recorded:
+        raise SystemExit("没有可回放的对话")
+    sessions = [recorded[i % len(recorded)] for i in range(args.conversations)]
+    print(f"🎞️ {len(recorded)} 段录制对话，每个到达率回放 {len(sessions)} 段"
+          f"（{sum(len(turns) for turns in sessions)} 轮）")
+    
+    # 模拟服务放在独立进程，避免与被测客户端争抢 GIL
+    base_url, server_process = start_server_process(
+        chat_latency=LatencyModel.parse(args.chat_latency),
+        chat_token_interval=args.token_interval,
+        chat_reply=ReplayScript(conversations),
+        amap_latency=LatencyModel.parse(args.amap_latency),
+        embedding_latency=LatencyModel.parse(args.embed_latency),
+        embedding_dim=256,
+    )
+    # 工具与知识库模块在导入时读取接口地址与配置，必须先设置环境变量
+    index_dir = tempfile.mkdtemp(prefix="bench_replay_")
+    os.environ.update(
+        AMAP_BASE_URL=base_url,
+        DASHSCOPE_HTTP_BASE_URL=base_url + "/api/v1",
+        RAG_MODE="retrieval",
+        RAG_INDEX_DIR=index_dir,
+    )
+    os.environ.setdefault("AMAP_KEY", "mock")
+    
+    random.seed(args.seed)
+    results = []
+    try:
+        from agent_core import AgentCore
+        from tools.rag import init_rag_system
+        
+        init_rag_system(args.data, "mock")
+        agent = AgentCore(api_key="mock", base_url=base_url + "/v1")
+        think_time = LatencyModel.parse(args.think_time)
+        for rate in (float(value) for value in args.rates.split(",")):
+            run = run_load(agent, sessions, rate, args.concurrency, think_time)
+            results.append(run)
+            lat = run["latency"]
+            print(f"[rate {rate:>5}] {run['turns_per_second']:>7} 轮/秒  p50 {lat['p50_ms']}ms  "
+                  f"p95 {lat['p95_ms']}ms  p99 {lat['p99_ms']}ms  排队 p95 {run['queue_wait']['p95_ms']}ms  "
+                  f"模型轮数 {run['iterations_per_turn']}/轮  错误率 {run['error_rate']:.2%}  "
+                  f"工具错误率 {run['tool_error_rate']:.2%}")
+        server_stats = fetch_stats(base_url)
+        
+        from resilience import resilience_metrics
+        endpoints = resilience_metrics()
+        for name, stats in endpoints.items():
+            print(f"  {name:<28} 超时 {stats['timeout_s']}s  对冲 {stats['hedge_wins']}/{stats['hedges']}  "
+                  f"熔断 {stats['state']}（打开 {stats['opens']} 次，拒绝 {stats['rejected']}）")
+    finally:
+        server_process.terminate()
+        shutil.rmtree(index_dir, ignore_errors=True)
+    
+    report = {"config": vars(args), "results": results, "server": server_stats, "resilience": endpoints}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print("✅ 与基线相比没有超出容差的劣化")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+本地意图路由离线评估
+
+从历史对话中取出每条用户消息，以紧随其后的 assistant 消息实际发起的工具调用为标注
+（无工具调用 = chat，知识库 = knowledge，多个工具 = multi），按不同置信度阈值评估：
+
+- accuracy:    单一意图消息上的意图分类准确率
+- coverage:    走快速路径的消息占比
+- precision:   快速路径中工具与参数都与模型实际调用一致的比例（tool_precision 只看工具）
+- recall:      天气 / 地点类消息中走快速路径的比例
+- latency:     单次路由耗时 p50 / p95
+- llm_calls_saved: 省去的模型调用次数（template 回答每次省 2 次，llm 回答省 1 次）
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_router --thresholds 0.7,0.8,0.9 --output router.json
+    python -m benchmarks.bench_router --history-db chat_histories/history.db --show-errors
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import time
+
+from benchmarks.metrics import summarize_latencies
+from router import INTENT_TOOLS, ROUTER_ANSWER, ROUTER_CONFIDENCE, IntentRouter
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_HISTORY_DIR = os.path.join(AGENT_DIR, "chat_histories")
+
+# 工具 -> 意图
+TOOL_INTENTS = {tool: intent for intent, tool in INTENT_TOOLS.items()}
+TOOL_INTENTS["search_knowledge_base"] = "knowledge"
+
+
+def load_json_conversations(history_dir):
+    """读取 chat_*.json 格式的历史对话"""
+    conversations = []
+    for path in sorted(glob.glob(os.path.join(history_dir, "chat_*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            conversations.append(json.load(f).get("messages", []))
+    return conversations
+
+
+def load_db_conversations(db_path):
+    """以只读方式读取 history.db 中的历史对话"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        conversations = {}
+        rows = conn.execute("SELECT conversation_id, data FROM messages ORDER BY conversation_id, seq")
+        for conversation_id, data in rows:
+            conversations.setdefault(conversation_id, []).append(json.loads(data))
+        return list(conversations.values())
+    finally:
+        conn.close()
+
+
+def label_messages(conversations):
+    """
+    为每条用户消息标注模型实际的决策
+    
+    Returns:
+        list: [{"text", "intent", "tool", "args"}, ...]
+    """
+    samples = []
+    for messages in conversations:
+        for index, message in enumerate(messages[:-1]):
+            if message.get("role") != "user" or not isinstance(message.get("content"), str):
+                continue
+            reply = messages[index + 1]
+            if reply.get("role") != "assistant":
+                continue
+            calls = reply.get("tool_calls") or []
+            sample = {"text": message["content"], "intent": "chat", "tool": None, "args": {}}
+            if len(calls) > 1:
+                sample["intent"] = "multi"
+            elif calls:
+                function = calls[0]["function"]
+                sample["tool"] = function["name"]
+                sample["intent"] = TOOL_INTENTS.get(function["name"], "chat")
+                try:
+                    sample["args"] = json.loads(function.get("arguments") or "{}")
+                except json.JSONDecodeError:
+                    pass
+            samples.append(sample)
+    return samples
+
+
+def _args_match(route_args, logged_args):
+    return all(str(logged_args.get(key, "")).strip() == value for key, value in route_args.items())
+
+
+def evaluate(samples, threshold, answer_mode=ROUTER_ANSWER):
+    """
+    在一个阈值下评估路由器
+    
+    Returns:
+        dict: 指标汇总与错误样本
+    """
+    router = IntentRouter(threshold=threshold, answer_mode=answer_mode)
+    latencies = []
+    correct = labelled = fast = fast_tool_ok = fast_exact = tool_samples = tool_fast = 0
+    errors = []
+    for sample in samples:
+        started = time.perf_counter()
+        route = router.route(sample["text"])
+        latencies.append(time.perf_counter() - started)
+        
+        if sample["intent"] != "multi":
+            labelled += 1
+            correct += route.intent == sample["intent"]
+        if sample["intent"] in INTENT_TOOLS:
+            tool_samples += 1
+            tool_fast += route.fast_path
+        if not route.fast_path:
+            continue
+        fast += 1
+        tool_ok = route.tool == sample["tool"]
+        exact = tool_ok and _args_match(route.args, sample["args"])
+        fast_tool_ok += tool_ok
+        fast_exact += exact
+        if not exact:
+            errors.append({"text": sample["text"], "route": route.as_dict(),
+                           "logged_tool": sample["tool"], "logged_args": sample["args"]})
+    
+    calls_per_hit = 2 if answer_mode == "template" else 1
+    return {
+        "threshold": threshold,
+        "samples": len(samples),
+        "accuracy": round(correct / labelled, 3) if labelled else 0.0,
+        "coverage": round(fast / len(samples), 3) if samples else 0.0,
+        "precision": round(fast_exact / fast, 3) if fast else 0.0,
+        "tool_precision": round(fast_tool_ok / fast, 3) if fast else 0.0,
+        "recall": round(tool_fast / tool_samples, 3) if tool_samples else 0.0,
+        "fast_path": fast,
+        "llm_calls_saved": fast_tool_ok * calls_per_hit,
+        "latency": summarize_latencies(latencies),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地意图路由离线准确率 / 延迟评估")
+    parser.add_argument("--history-dir", default=DEFAULT_HISTORY_DIR, help="chat_*.json 所在目录")
+    parser.add_argument("--history-db", help="额外读取的 history.db 路径")
+    parser.add_argument("--thresholds", default=f"0.6,0.7,{ROUTER_CONFIDENCE},0.9",
+                        help="逗号分隔的置信度阈值")
+    parser.add_argument("--answer", default=ROUTER_ANSWER, choices=["template", "llm"], help="快速路径回答方式")
+    parser.add_argument("--show-errors", action="store_true", help="打印快速路径与模型决策不一致的样本")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    conversations = load_json_conversations(args.history_dir)
+    if args.history_db:
+        conversations += load_db_conversations(args.history_db)
+    samples = label_messages(conversations)
+    distribution = {}
+    for sample in samples:
+        distribution[sample["intent"]] = distribution.get(sample["intent"], 0) + 1
+    print(f"{len(conversations)} 段对话，{len(samples)} 条用户消息：{distribution}")
+    
+    thresholds = sorted({float(value) for value in args.thresholds.split(",")})
+    report = {"config": vars(args), "distribution": distribution, "results": []}
+    print(f"{'阈值':>6} {'准确率':>7} {'覆盖率':>7} {'精确率':>7} {'召回率':>7} {'省调用':>6} {'p50':>8} {'p95':>8}")
+    for threshold in thresholds:
+        result = evaluate(samples, threshold, args.answer)
+        report["results"].append(result)
+        print(f"{threshold:>8.2f} {result['accuracy']:>9.3f} {result['coverage']:>9.3f} "
+              f"{result['precision']:>9.3f} {result['recall']:>9.3f} {result['llm_calls_saved']:>9} "
+              f"{result['latency']['p50_ms']:>7.3f}ms {result['latency']['p95_ms']:>7.3f}ms")
+        if args.show_errors:
+            for error in result["errors"]:
+                print(f"    ✗ {error['text']!r} → {error['route']['intent']} {error['route']['slots']}，"
+                      f"模型: {error['logged_tool']} {error['logged_args']}")
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
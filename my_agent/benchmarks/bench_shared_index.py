@@ -0,0 +1,192 @@
+"""
+多进程共享索引内存基准
+
+在合成语料上分别以“私有加载”（每个进程 FAISS.load_local + 构建 BM25）与
+“共享映射”（tools/shared_index 只读映射快照）启动 N 个 worker 进程，
+所有 worker 加载完成并执行查询后同时读取 /proc/self/smaps_rollup，报告：
+
+- private_mb: 进程私有内存（随 worker 数线性增长的部分）
+- pss_mb:     按共享进程数分摊后的内存，所有 worker 之和即实际占用
+- load_ms:    加载 / 映射耗时
+
+共享映射按 --index-types 中的每种检索索引（FAISS index_factory 字符串，分号分隔）各发布一份快照分别测量，
+覆盖 Flat 与自动选择在大语料上会选用的 IVF / IVF-PQ。
+
+仅支持 Linux。用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_shared_index --chunks 50000 --dim 256 --workers 1,2,4 \\
+        --index-types "Flat;IVF256,Flat;IVF256,PQ32" --output shared.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.mock_servers import fake_embedding
+
+# 合成文本使用的常用汉字
+_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理世车"
+
+
+def make_corpus(count, seed=0):
+    """生成 count 个约 300 字的合成文档块"""
+    rng = np.random.default_rng(seed)
+    chars = np.array(list(_CHARS))
+    return ["".join(rng.choice(chars, 300)) + f" 第{i}段" for i in range(count)]
+
+
+def _snapshot_dir(directory, spec):
+    return os.path.join(directory, "snapshots", spec.replace(",", "_"))
+
+
+def build(directory, count, dim, index_types=("Flat",)):
+    """构建私有索引目录，并为每种检索索引发布一份共享快照"""
+    from langchain_community.vectorstores import FAISS
+    from benchmarks.stub_models import StubEmbeddings
+    from tools import shared_index, vector_index
+    from tools.bm25 import BM25Index
+    from tools.rag import _chunk_id
+    
+    texts = make_corpus(count)
+    embeddings = StubEmbeddings(dim=dim)
+    ids = [_chunk_id(text) for text in texts]
+    vectors = np.array([fake_embedding(text, dim) for text in texts], dtype=np.float32)
+    store = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())), embeddings,
+        metadatas=[{"source": "synthetic.txt", "start_index": i * 300} for i in range(count)],
+        ids=ids, normalize_L2=True
+    )
+    store.save_local(os.path.join(directory, "private"))
+    
+    bm25 = BM25Index()
+    for chunk_id, text in zip(ids, texts):
+        bm25.add(chunk_id, text)
+    flat = store.index
+    for spec in index_types:
+        store.index = flat if spec == "Flat" else vector_index.build_index(
+            flat.reconstruct_n(0, flat.ntotal), spec
+        )
+        shared_index.write_snapshot(_snapshot_dir(directory, spec), store, bm25, {"version": "0" * 64})
+    return texts
+
+
+def _memory():
+    """读取本进程的 Rss / Pss / 私有内存（MB）"""
+    values = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(values.get("Rss", 0.0), 1),
+        "pss_mb": round(values.get("Pss", 0.0), 1),
+        "private_mb": round(values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def _worker(mode, directory, dim, queries, barrier, results):
+    """加载索引、执行查询，等所有 worker 就绪后统计内存"""
+    # 各模式导入相同的库，baseline 即为不含数据的进程开销
+    from langchain_community.vectorstores import FAISS
+    from benchmarks.stub_models import StubEmbeddings
+    from tools import shared_index
+    from tools.bm25 import BM25Index
+    
+    started = time.perf_counter()
+    if mode == "private":
+        store = FAISS.load_local(os.path.join(directory, "private"), StubEmbeddings(dim=dim),
+                                 allow_dangerous_deserialization=True, normalize_L2=True)
+        bm25 = BM25Index()
+        for chunk_id in store.index_to_docstore_id.values():
+            bm25.add(chunk_id, store.docstore.search(chunk_id).page_content)
+    elif mode.startswith("shared"):
+        store = shared_index.SharedIndex(shared_index.current_snapshot(directory))
+        bm25 = store.bm25
+    else:
+        store = bm25 = None
+    load_ms = (time.perf_counter() - started) * 1000
+    
+    if store is not None:
+        for query in queries:
+            vector = np.asarray([fake_embedding(query, dim)], dtype=np.float32)
+            _, positions = store.index.search(vector, 4)
+            for position in positions[0]:
+                store.docstore.search(store.index_to_docstore_id[int(position)])
+            for chunk_id, _, _ in bm25.search(query, 8):
+                store.docstore.search(chunk_id)
+    
+    barrier.wait()
+    results.put(dict(_memory(), load_ms=round(load_ms, 1)))
+    barrier.wait()
+
+
+def run(mode, directory, dim, workers, queries):
+    """启动 workers 个进程并汇总内存（shared 模式的 directory 为快照所在的索引目录）"""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(mode, directory, dim, queries, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "total_pss_mb": round(sum(s["pss_mb"] for s in samples), 1),
+        "mean_private_mb": round(sum(s["private_mb"] for s in samples) / workers, 1),
+        "mean_rss_mb": round(sum(s["rss_mb"] for s in samples) / workers, 1),
+        "mean_load_ms": round(sum(s["load_ms"] for s in samples) / workers, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="私有加载 vs 共享映射的多进程内存对比")
+    parser.add_argument("--chunks", type=int, default=20000, help="合成文档块数")
+    parser.add_argument("--dim", type=int, default=256, help="向量维度")
+    parser.add_argument("--workers", default="1,2,4", help="worker 进程数扫描")
+    parser.add_argument("--queries", type=int, default=50, help="每个 worker 的查询数")
+    parser.add_argument("--index-types", default="Flat;IVF64,Flat;IVF64,PQ16",
+                        help="分号分隔的共享快照检索索引类型（FAISS index_factory 字符串）")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    directory = tempfile.mkdtemp(prefix="bench_shared_")
+    try:
+        started = time.perf_counter()
+        index_types = [spec for spec in args.index_types.split(";") if spec]
+        texts = build(directory, args.chunks, args.dim, index_types)
+        print(f"📦 {args.chunks} 个文档块，构建 {time.perf_counter() - started:.1f}s")
+        queries = [text[:12] for text in texts[:args.queries]]
+        
+        results = []
+        for workers in [int(v) for v in args.workers.split(",")]:
+            modes = [("baseline", directory), ("private", directory)]
+            modes += [(f"shared[{spec}]", _snapshot_dir(directory, spec)) for spec in index_types]
+            for mode, mode_directory in modes:
+                result = run(mode, mode_directory, args.dim, workers, queries)
+                results.append(result)
+                print(f"{mode:<20} workers={workers:<3} 总 PSS {result['total_pss_mb']}MB "
+                      f"单进程私有 {result['mean_private_mb']}MB RSS {result['mean_rss_mb']}MB "
+                      f"加载 {result['mean_load_ms']}ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    report = {"config": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+启动耗时基准
+
+在全新的子进程中测量：
+
+- imports:  各入口模块的导入耗时（中位数），以及导入后是否已加载 LangChain / FAISS
+- server:   python server.py 从进程启动到 /health 可用、首个天气问题返回、知识库就绪的耗时
+            （cold = 空索引目录全量构建，warm = 复用磁盘索引）
+- app:      Streamlit 页面首次渲染完成的耗时（streamlit.testing 无头运行 app.py）
+
+向量、对话与高德接口都指向本地模拟服务，索引与历史记录写入临时目录，不影响正式数据。
+
+用法（在 my_agent 目录下）:
+    python -m benchmarks.bench_startup --repeat 5 --embed-latency 0.3 --output startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import Request, urlopen
+
+from benchmarks.mock_servers import LatencyModel, MockUpstreamServer
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测量导入耗时的入口模块
+ENTRY_MODULES = ["tools", "tools.rag", "agent_core", "async_agent_core", "server"]
+
+# 启动路径上不应出现的重量级依赖
+HEAVY_MODULES = ["langchain_community", "langchain_text_splitters", "faiss"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_APP_PROBE = """
+import json, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({path!r}, default_timeout=120)
+app.run()
+rendered = time.perf_counter() - started
+# 等后台预热结束再退出：解释器退出时强行终止仍在 C 扩展中运行的守护线程会异常中止
+import tools.rag
+tools.rag.wait_rag_warmup()
+print(json.dumps({{"seconds": rendered, "rag_ready_seconds": time.perf_counter() - started,
+                  "errors": [e.value for e in app.exception]}}))
+"""
+
+
+def _python(code, env, cwd):
+    """在全新解释器中执行探针代码，返回最后一行 JSON 输出"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, cwd=cwd,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _http_json(url, payload=None, timeout=60):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def measure_imports(env, repeat):
+    """各入口模块在全新进程中的导入耗时"""
+    results = {}
+    for module in ENTRY_MODULES:
+        samples = [
+            _python(_IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES), env, AGENT_DIR)
+            for _ in range(repeat)
+        ]
+        results[module] = {
+            "median_ms": round(statistics.median(s["seconds"] for s in samples) * 1000, 1),
+            "heavy_loaded": samples[0]["heavy"],
+        }
+        print(f"import {module:<18} {results[module]['median_ms']:>8}ms  "
+              f"重量级依赖: {', '.join(results[module]['heavy_loaded']) or '无'}")
+    return results
+
+
+def measure_server(env, workdir, timeout=300):
+    """
+    启动 server.py，记录 /health 可用、首个天气回答、知识库就绪三个时间点（秒，从进程启动算起）
+    """
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(AGENT_DIR, "server.py"), "--port", str(port)],
+        env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {}
+    try:
+        while "health_s" not in result:
+            if process.poll() is not None or time.perf_counter() - started > timeout:
+                raise RuntimeError("server.py 启动失败")
+            try:
+                _http_json(base + "/health", timeout=1)
+                result["health_s"] = round(time.perf_counter() - started, 3)
+            except OSError:
+                time.sleep(0.02)
+        
+        reply = _http_json(base + "/v1/chat", {"message": "北京今天天气怎么样", "stream": False})
+        result["first_weather_s"] = round(time.perf_counter() - started, 3)
+        result["weather_reply"] = (reply.get("response") or "")[:40]
+        
+        while time.perf_counter() - started < timeout:
+            health = _http_json(base + "/health")
+            if health.get("rag_status", "ready" if health.get("rag") else None) in ("ready", "failed"):
+                result["rag_ready_s"] = round(time.perf_counter() - started, 3)
+                result["rag"] = health.get("rag")
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    return result
+
+
+def measure_app(env, workdir):
+    """Streamlit 页面首次渲染耗时（包含解释器启动与全部导入）"""
+    started = time.perf_counter()
+    probe = _python(_APP_PROBE.format(path=os.path.join(AGENT_DIR, "app.py")), env, workdir)
+    return {
+        "first_render_s": round(time.perf_counter() - started, 3),
+        "script_run_s": round(probe["seconds"], 3),
+        "rag_ready_after_run_s": round(probe["rag_ready_seconds"] - probe["seconds"], 3),
+        "errors": probe["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时 / 服务就绪 / 页面首次渲染基准")
+    parser.add_argument("--repeat", type=int, default=5, help="导入耗时与启动测量的重复次数")
+    parser.add_argument("--embed-latency", default="0.3", help="模拟向量接口每次请求延迟分布")
+    parser.add_argument("--skip-app", action="store_true", help="不测量 Streamlit 首次渲染")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+    
+    mock = MockUpstreamServer(embedding_latency=LatencyModel.parse(args.embed_latency))
+    base_url = mock.start()
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(
+        os.environ,
+        PYTHONPATH=AGENT_DIR,
+        DASHSCOPE_API_KEY="mock",
+        AMAP_KEY="mock",
+        DASHSCOPE_HTTP_BASE_URL=base_url + "/api/v1",
+        AMAP_BASE_URL=base_url,
+        CHAT_BASE_URL=base_url + "/v1",
+        RAG_MODE="retrieval",
+        RAG_INDEX_DIR=os.path.join(workdir, "vector_store"),
+        TRACE_EXPORT="",
+    )
+    
+    report = {"config": vars(args)}
+    try:
+        report["imports"] = measure_imports(env, args.repeat)
+        
+        servers = {"cold": [], "warm": []}
+        for _ in range(args.repeat):
+            shutil.rmtree(env["RAG_INDEX_DIR"], ignore_errors=True)
+            for phase in ("cold", "warm"):
+                servers[phase].append(measure_server(env, workdir))
+        report["server"] = {}
+        for phase, runs in servers.items():
+            summary = {
+                key: round(statistics.median(run[key] for run in runs), 3)
+                for key in ("health_s", "first_weather_s", "rag_ready_s")
+            }
+            summary["rag"] = all(run.get("rag") for run in runs)
+            report["server"][phase] = summary
+            print(f"server {phase:<4}  /health {summary['health_s']}s  首个天气回答 {summary['first_weather_s']}s  "
+                  f"知识库就绪 {summary['rag_ready_s']}s")
+        
+        if not args.skip_app:
+            report["app"] = measure_app(env, workdir)
+            print(f"app 首次渲染 {report['app']['first_render_s']}s（脚本运行 {report['app']['script_run_s']}s）"
+                  f"{'，异常: ' + str(report['app']['errors']) if report['app']['errors'] else ''}")
+    finally:
+        mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""基准测试统计工具"""
+import math
+
+
+def percentile(values, p):
+    """
+    计算百分位数（最近秩法）
+    
+    Args:
+        values: 数值列表
+        p: 百分位，0-100
+        
+    Returns:
+        float: 百分位数，空列表返回 0.0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_latencies(values):
+    """
+    汇总一组延迟（秒）为毫秒级的均值和 p50/p95/p99
+    
+    Returns:
+        dict: count / mean_ms / p50_ms / p95_ms / p99_ms / max_ms
+    """
+    if not values:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
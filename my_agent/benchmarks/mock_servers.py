@@ -0,0 +1,409 @@
+"""
+本地模拟上游服务
+
+用标准库 HTTP 服务器模拟 DashScope 向量接口、OpenAI 兼容的对话接口
+和高德地图接口，支持注入延迟分布和服务端限流，
+便于在无网络、无配额的环境下压测。
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+# 对话接口识别的城市（用于脚本化地生成工具调用）
+MOCK_CITIES = ["北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "南京", "西安", "重庆"]
+
+
+class LatencyModel:
+    """延迟分布：fixed / uniform / lognormal（单位：秒）"""
+    
+    def __init__(self, kind="fixed", mean=0.0, spread=0.0):
+        """
+        Args:
+            kind: 分布类型
+            mean: 平均延迟（fixed 时为固定值；lognormal 时为中位数）
+            spread: uniform 时为 ±范围；lognormal 时为 sigma
+        """
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+    
+    @classmethod
+    def parse(cls, spec):
+        """
+        从字符串解析延迟分布，例如 "0.05"、"uniform:0.05:0.02"、"lognormal:0.2:0.5"
+        """
+        parts = str(spec).split(":")
+        if len(parts) == 1:
+            return cls("fixed", float(parts[0]))
+        return cls(parts[0], float(parts[1]), float(parts[2]) if len(parts) > 2 else 0.0)
+    
+    def sample(self):
+        """采样一次延迟"""
+        if self.kind == "uniform":
+            return max(0.0, random.uniform(self.mean - self.spread, self.mean + self.spread))
+        if self.kind == "lognormal":
+            return self.mean * math.exp(random.gauss(0, self.spread)) if self.mean > 0 else 0.0
+        return self.mean
+
+
+class _RateLimiter:
+    """服务端固定窗口限流（每秒请求数）"""
+    
+    def __init__(self, max_rps):
+        self.max_rps = max_rps
+        self.window = int(time.time())
+        self.count = 0
+        self.lock = threading.Lock()
+    
+    def allow(self):
+        if not self.max_rps:
+            return True
+        with self.lock:
+            now = int(time.time())
+            if now != self.window:
+                self.window, self.count = now, 0
+            self.count += 1
+            return self.count <= self.max_rps
+
+
+def fake_embedding(text, dim=1536):
+    """
+    确定性的伪向量：字符二元组哈希到固定维度后 L2 归一化
+    
+    相同文本得到相同向量，字面相近的文本向量也相近，足以验证检索流程。
+    """
+    vector = [0.0] * dim
+    grams = [text[i:i + 2] for i in range(max(1, len(text) - 1))]
+    for gram in grams:
+        digest = hashlib.md5(gram.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def scripted_chat_reply(messages):
+    """
+    脚本化的对话决策，模拟一个会调用工具的模型
+    
+    - 最后一条是工具结果：基于工具结果给出最终回答
+    - 用户问天气：调用 get_weather
+    - 用户找门店/地点：调用 search_nearby
+    - 用户问车辆参数：调用 search_knowledge_base
+    - 其余：直接回答
+    
+    Returns:
+        tuple: (回复文本, 工具调用列表)
+    """
+    last = messages[-1] if messages else {}
+    if last.get("role") == "tool":
+        results = [m.get("content") or "" for m in messages if m.get("role") == "tool"][-3:]
+        return "根据查询结果：" + "；".join(r[:60] for r in results), []
+    
+    text = last.get("content") or ""
+    city = next((c for c in MOCK_CITIES if c in text), "北京")
+    call_id = "call_" + uuid.uuid4().hex[:16]
+    if "天气" in text:
+        return "", [{"id": call_id, "name": "get_weather", "arguments": {"city": city}}]
+    if "小米之家" in text or "附近" in text or "门店" in text:
+        return "", [{"id": call_id, "name": "search_nearby",
+                     "arguments": {"keyword": "小米之家", "city": city}}]
+    if any(k in text for k in ("YU7", "续航", "充电", "价格", "配置", "电池")):
+        return "", [{"id": call_id, "name": "search_knowledge_base", "arguments": {"query": text}}]
+    return f"您好，关于“{text[:20]}”，我是小米汽车智能顾问，很高兴为您服务。", []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分多次写出，关闭 Nagle 避免与延迟 ACK 叠加出 40ms 停顿
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+    
+    def _write_chunk(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+    
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+    
+    def _dispatch(self, method):
+        path = self.path.split("?", 1)[0]
+        handler = self.server.routes.get((method, path))
+        if handler is None:
+            self._send_json(404, {"code": "NotFound", "message": path})
+            return
+        self.server.owner.count("requests")
+        handler(self)
+    
+    def do_GET(self):
+        self._dispatch("GET")
+    
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+class _Server(ThreadingHTTPServer):
+    # 压测时会有大量并发连接，默认 backlog=5 会导致连接被拒
+    request_queue_size = 1024
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        # 客户端提前断开（如对冲落败的流被关闭）是预期行为，不打印堆栈，避免淹没压测报告
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockUpstreamServer:
+    """
+    本地模拟上游服务器
+    
+    用法:
+        server = MockUpstreamServer(embedding_latency=LatencyModel("fixed", 0.05))
+        base_url = server.start()
+        os.environ["DASHSCOPE_HTTP_BASE_URL"] = base_url + "/api/v1"   # 向量接口
+        os.environ["AMAP_BASE_URL"] = base_url                          # 高德接口
+        agent = AgentCore(api_key="mock", base_url=base_url + "/v1")    # 对话接口
+        ...
+        server.stop()
+    """
+    
+    def __init__(self, embedding_latency=None, embedding_max_rps=None, embedding_dim=1536,
+                 chat_latency=None, chat_token_interval=0.0, chat_reply=None,
+                 amap_latency=None, host="127.0.0.1", port=0):
+        """
+        Args:
+            embedding_latency: 向量接口的延迟分布
+            embedding_max_rps: 向量接口每秒请求上限，超过返回 429
+            embedding_dim: 伪向量维度
+            chat_latency: 对话接口首个 token 前的延迟分布
+            chat_token_interval: 对话接口流式输出时每个片段之间的间隔秒数
+            chat_reply: 对话决策函数 chat_reply(messages) -> (文本, 工具调用列表)，
+                默认 scripted_chat_reply
+            amap_latency: 高德接口的延迟分布
+            host: 监听地址
+            port: 监听端口，0 表示随机
+        """
+        self.embedding_latency = embedding_latency or LatencyModel()
+        self.embedding_limiter = _RateLimiter(embedding_max_rps)
+        self.embedding_dim = embedding_dim
+        self.chat_latency = chat_latency or LatencyModel()
+        self.chat_token_interval = chat_token_interval
+        self.chat_reply = chat_reply or scripted_chat_reply
+        self.amap_latency = amap_latency or LatencyModel()
+        self.stats = {"requests": 0, "throttled": 0, "embedded_texts": 0,
+                      "chat_requests": 0, "amap_requests": 0}
+        self.stats_lock = threading.Lock()
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.owner = self
+        self.httpd.routes = {
+            ("POST", "/api/v1/services/embeddings/text-embedding/text-embedding"): self._handle_embedding,
+            ("POST", "/v1/chat/completions"): self._handle_chat,
+            ("GET", "/v3/weather/weatherInfo"): self._handle_weather,
+            ("GET", "/v3/place/text"): self._handle_place,
+            ("GET", "/_mock/stats"): self._handle_stats,
+        }
+        self.thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def count(self, key, amount=1):
+        """线程安全地累加统计计数"""
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+    
+    def start(self):
+        """在后台线程启动服务，返回 base_url"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+    
+    def stop(self):
+        """停止服务"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def _handle_stats(self, handler):
+        """返回服务端统计（服务运行在独立进程时通过该接口读取）"""
+        with self.stats_lock:
+            handler._send_json(200, dict(self.stats))
+    
+    def _handle_embedding(self, handler):
+        """DashScope 文本向量接口"""
+        payload = handler._read_json()
+        if not self.embedding_limiter.allow():
+            self.count("throttled")
+            handler._send_json(429, {
+                "code": "Throttling.RateQuota",
+                "message": "Requests rate limit exceeded, please try again later.",
+                "request_id": str(uuid.uuid4()),
+            })
+            return
+        
+        time.sleep(self.embedding_latency.sample())
+        texts = payload.get("input", {}).get("texts", [])
+        self.count("embedded_texts", len(texts))
+        handler._send_json(200, {
+            "output": {
+                "embeddings": [
+                    {"text_index": i, "embedding": fake_embedding(t, self.embedding_dim)}
+                    for i, t in enumerate(texts)
+                ]
+            },
+            "usage": {"total_tokens": sum(len(t) for t in texts)},
+            "request_id": str(uuid.uuid4()),
+        })
+    
+    def _handle_chat(self, handler):
+        """OpenAI 兼容的 /v1/chat/completions（支持 stream=True 的 SSE 输出）"""
+        payload = handler._read_json()
+        self.count("chat_requests")
+        text, tool_calls = self.chat_reply(payload.get("messages", []))
+        time.sleep(self.chat_latency.sample())
+        
+        completion_id = "chatcmpl-" + uuid.uuid4().hex[:24]
+        created = int(time.time())
+        model = payload.get("model", "mock")
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in payload.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text),
+                 "total_tokens": prompt_tokens + len(text)}
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        
+        if not payload.get("stream"):
+            message = {"role": "assistant", "content": text or None}
+            if tool_calls:
+                message["tool_calls"] = [
+                    {"id": c["id"], "type": "function",
+                     "function": {"name": c["name"], "arguments": json.dumps(c["arguments"], ensure_ascii=False)}}
+                    for c in tool_calls
+                ]
+            handler._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+        
+        def chunk(delta, finish=None, with_usage=False):
+            body = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            if with_usage:
+                body["choices"] = []
+                body["usage"] = usage
+            return "data: " + json.dumps(body, ensure_ascii=False) + "\n\n"
+        
+        handler._start_chunked("text/event-stream")
+        handler._write_chunk(chunk({"role": "assistant", "content": ""}))
+        # 文本按 4 个字符一片输出；工具参数拆成两片，验证客户端的片段拼接
+        for i in range(0, len(text), 4):
+            if i and self.chat_token_interval:
+                time.sleep(self.chat_token_interval)
+            handler._write_chunk(chunk({"content": text[i:i + 4]}))
+        for index, call in enumerate(tool_calls):
+            arguments = json.dumps(call["arguments"], ensure_ascii=False)
+            half = len(arguments) // 2
+            handler._write_chunk(chunk({"tool_calls": [{
+                "index": index, "id": call["id"], "type": "function",
+                "function": {"name": call["name"], "arguments": arguments[:half]}}]}))
+            handler._write_chunk(chunk({"tool_calls": [{
+                "index": index, "function": {"arguments": arguments[half:]}}]}))
+        handler._write_chunk(chunk({}, finish=finish_reason))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            handler._write_chunk(chunk({}, with_usage=True))
+        handler._write_chunk("data: [DONE]\n\n")
+        handler._end_chunked()
+    
+    def _handle_weather(self, handler):
+        """高德天气接口 /v3/weather/weatherInfo"""
+        self.count("amap_requests")
+        query = parse_qs(urlparse(handler.path).query)
+        city = query.get("city", ["北京"])[0]
+        time.sleep(self.amap_latency.sample())
+        handler._send_json(200, {
+            "status": "1", "count": "1", "info": "OK", "infocode": "10000",
+            "lives": [{"province": city, "city": city, "adcode": "110000", "weather": "晴",
+                       "temperature": str(15 + len(city)), "winddirection": "北", "windpower": "≤3",
+                       "humidity": "40", "reporttime": time.strftime("%Y-%m-%d %H:%M:%S")}],
+        })
+    
+    def _handle_place(self, handler):
+        """高德地点搜索接口 /v3/place/text"""
+        self.count("amap_requests")
+        query = parse_qs(urlparse(handler.path).query)
+        city = query.get("city", ["北京"])[0]
+        keyword = query.get("keywords", ["小米之家"])[0]
+        time.sleep(self.amap_latency.sample())
+        handler._send_json(200, {
+            "status": "1", "count": "3", "info": "OK",
+            "pois": [{"name": f"{keyword}({city}{i}号店)", "address": f"{city}市中心路{i * 10}号"}
+                     for i in range(1, 4)],
+        })
+
+
+def _serve_in_process(options, ready):
+    server = MockUpstreamServer(**options)
+    server.start()
+    ready.put(server.base_url)
+    server.thread.join()
+
+
+def start_server_process(**options):
+    """
+    在独立进程中启动模拟服务
+    
+    压测高并发客户端时，服务端线程与被测客户端同处一个进程会争抢 GIL，
+    放到子进程后测得的才是客户端自身的开销。
+    
+    Args:
+        **options: MockUpstreamServer 的构造参数（需可 pickle）
+        
+    Returns:
+        tuple: (base_url, 子进程对象)，结束时调用 process.terminate()
+    """
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=_serve_in_process, args=(options, ready), daemon=True)
+    process.start()
+    return ready.get(timeout=60), process
+
+
+def fetch_stats(base_url):
+    """读取模拟服务的统计计数"""
+    with urlopen(base_url + "/_mock/stats", timeout=10) as response:
+        return json.loads(response.read())
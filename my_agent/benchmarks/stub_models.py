@@ -0,0 +1,75 @@
+"""
+本地桩模型
+
+不访问网络的向量模型与对话模型，可注入 RAGSystem（embeddings= / llm=），
+用于在无配额环境下测量 RAG 流水线本身的速度与检索质量。
+"""
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from benchmarks.mock_servers import LatencyModel, fake_embedding
+
+
+class StubEmbeddings(Embeddings):
+    """确定性伪向量模型（字符二元组哈希），可模拟每次请求的网络延迟"""
+    
+    def __init__(self, dim=256, latency=None):
+        """
+        Args:
+            dim: 向量维度
+            latency: 每次请求的延迟分布 LatencyModel，默认无延迟
+        """
+        self.dim = dim
+        self.latency = latency or LatencyModel()
+        self.calls = 0
+        self.texts = 0
+    
+    def _wait(self):
+        delay = self.latency.sample()
+        if delay > 0:
+            time.sleep(delay)
+    
+    def embed_documents(self, texts):
+        self._wait()
+        self.calls += 1
+        self.texts += len(texts)
+        return [fake_embedding(text, self.dim) for text in texts]
+    
+    def embed_query(self, text):
+        self._wait()
+        self.calls += 1
+        self.texts += 1
+        return fake_embedding(text, self.dim)
+    
+    def embed_queries(self, texts):
+        """一次请求向量化多条查询（模拟批量接口）"""
+        self._wait()
+        self.calls += 1
+        self.texts += len(texts)
+        return [fake_embedding(text, self.dim) for text in texts]
+
+
+def stub_chat_model(latency=None, reply_chars=200):
+    """
+    回显上下文开头的桩对话模型，可直接替换 answer_chain 中的 LLM
+    
+    Args:
+        latency: 每次调用的延迟分布 LatencyModel，默认无延迟
+        reply_chars: 回复截取的提示词字符数
+    
+    Returns:
+        Runnable: 输入提示词、输出 AIMessage
+    """
+    latency = latency or LatencyModel()
+    
+    def reply(prompt_value):
+        delay = latency.sample()
+        if delay > 0:
+            time.sleep(delay)
+        text = prompt_value.to_string()
+        return AIMessage(content=text.strip()[:reply_chars])
+    
+    return RunnableLambda(reply)
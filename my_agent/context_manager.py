@@ -0,0 +1,148 @@
+"""上下文窗口管理 - 按 token 预算裁剪发送给模型的消息列表"""
+import os
+from tools.tokens import estimate_tokens
+
+# 发送给模型的消息总 token 预算
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '6000'))
+
+# 超出预算时，旧工具结果截断到的 token 数
+CONTEXT_TOOL_RESULT_TOKENS = int(os.getenv('CONTEXT_TOOL_RESULT_TOKENS', '300'))
+
+# 每条消息的固定开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_message_tokens(message):
+    """
+    估算单条消息的 token 数（正文 + 工具调用参数）
+    
+    Args:
+        message: 消息字典
+    
+    Returns:
+        int: 估算的 token 数
+    """
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += estimate_tokens(function.get("name", "")) + estimate_tokens(function.get("arguments", ""))
+    return tokens
+
+
+def _truncate_text(text, max_tokens):
+    """按 token 估算截断文本，并注明原始长度"""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    keep = max(1, len(text) * max_tokens // total)
+    return f"{text[:keep]}…（已截断，原文约 {total} tokens）"
+
+
+class ContextManager:
+    """
+    上下文窗口管理器
+    
+    只生成发送给模型的裁剪副本，原始 messages（用于保存和展示）保持完整。
+    超出预算时依次：
+        1. 从最旧开始截断历史轮次的工具结果
+        2. 从最旧开始整组丢弃历史工具调用（assistant tool_calls 与对应 tool 消息一起丢弃，保证 tool_call_id 配对）
+        3. 从最旧开始丢弃历史问答
+        4. 仍超出时截断当前轮的工具结果
+    开头的 system 提示与当前轮（最后一条 user 消息起）始终保留。
+    """
+    
+    def __init__(self, max_tokens=None, tool_result_tokens=None):
+        """
+        Args:
+            max_tokens: token 预算，默认 CONTEXT_TOKEN_BUDGET
+            tool_result_tokens: 旧工具结果截断后的 token 数，默认 CONTEXT_TOOL_RESULT_TOKENS
+        """
+        self.max_tokens = max_tokens or CONTEXT_TOKEN_BUDGET
+        self.tool_result_tokens = tool_result_tokens or CONTEXT_TOOL_RESULT_TOKENS
+    
+    @staticmethod
+    def _group(messages):
+        """将消息划分为不可拆分的组：工具调用与其结果为一组，其余每条消息各为一组"""
+        groups = []
+        for message in messages:
+            if message["role"] == "tool" and groups and groups[-1][0].get("tool_calls"):
+                groups[-1].append(message)
+            else:
+                groups.append([message])
+        return groups
+    
+    def fit(self, messages):
+        """
+        生成符合 token 预算的消息副本
+        
+        Args:
+            messages: 完整的对话消息列表
+        
+        Returns:
+            tuple: (裁剪后的消息列表, 报告字典)
+                报告: prompt_tokens / original_tokens / budget / truncated_tool_results / dropped_messages
+        """
+        pinned_count = 0
+        while pinned_count < len(messages) and messages[pinned_count]["role"] == "system":
+            pinned_count += 1
+        
+        # 当前轮：从最后一条 user 消息开始
+        current_start = len(messages)
+        for i in range(len(messages) - 1, pinned_count - 1, -1):
+            if messages[i]["role"] == "user":
+                current_start = i
+                break
+        
+        pinned = [dict(m) for m in messages[:pinned_count]]
+        history = self._group([dict(m) for m in messages[pinned_count:current_start]])
+        current = self._group([dict(m) for m in messages[current_start:]])
+        
+        original_tokens = sum(count_message_tokens(m) for m in messages)
+        total = original_tokens
+        truncated = 0
+        dropped = 0
+        
+        def truncate_tools(groups):
+            nonlocal total, truncated
+            for group in groups:
+                for message in group:
+                    if total <= self.max_tokens:
+                        return
+                    if message["role"] != "tool":
+                        continue
+                    before = count_message_tokens(message)
+                    message["content"] = _truncate_text(message.get("content") or "", self.tool_result_tokens)
+                    after = count_message_tokens(message)
+                    if after < before:
+                        total -= before - after
+                        truncated += 1
+        
+        def drop_groups(predicate):
+            nonlocal total, dropped
+            kept = []
+            for group in history:
+                if total > self.max_tokens and predicate(group):
+                    total -= sum(count_message_tokens(m) for m in group)
+                    dropped += len(group)
+                else:
+                    kept.append(group)
+            return kept
+        
+        if total > self.max_tokens:
+            truncate_tools(history)
+        if total > self.max_tokens:
+            history = drop_groups(lambda group: bool(group[0].get("tool_calls")))
+        if total > self.max_tokens:
+            history = drop_groups(lambda group: True)
+        if total > self.max_tokens:
+            truncate_tools(current)
+        
+        fitted = pinned + [m for group in history + current for m in group]
+        report = {
+            "prompt_tokens": total,
+            "original_tokens": original_tokens,
+            "budget": self.max_tokens,
+            "truncated_tool_results": truncated,
+            "dropped_messages": dropped
+        }
+        return fitted, report
@@ -1,81 +1,328 @@
 import os
 import json
+import hashlib
+import sqlite3
+import threading
 from datetime import datetime
+from tracing import tracer
 
 # 历史记录存储目录
 HISTORY_DIR = "chat_histories"
 
+# SQLite 数据库（WAL 模式）：会话元数据与消息分表存储
+DB_PATH = os.path.join(HISTORY_DIR, "history.db")
+
+# 每保存多少次执行一次 WAL 检查点，把日志合并回主库并截断
+CHECKPOINT_INTERVAL = 200
+
 # 确保目录存在
 if not os.path.exists(HISTORY_DIR):
     os.makedirs(HISTORY_DIR)
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    messages_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tool_memo (
+    conversation_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    version TEXT,
+    PRIMARY KEY (conversation_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 每个线程一个连接（Streamlit 在不同线程中执行脚本）
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+_save_count = 0
+
+
+def _connect():
+    """获取当前线程的数据库连接，首次使用时建表并迁移旧 JSON 文件"""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在检查点时 fsync，提交只追加日志；掉电最多丢最近几次提交，不会损坏数据库
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                with conn:
+                    conn.executescript(SCHEMA)
+                _migrate_schema(conn)
+                _migrate_json_files(conn)
+                _initialized = True
+    return conn
+
+
+def _migrate_schema(conn):
+    """为旧版本建的库补上新增的列（旧对话没有 messages_hash，下次保存时整体重写一次）"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(tool_memo)")}
+    if "version" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE tool_memo ADD COLUMN version TEXT")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+    if "messages_hash" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE conversations ADD COLUMN messages_hash TEXT")
+
+
+def _make_title(messages):
+    """自动生成标题：取第一条用户消息的前20个字"""
+    for msg in messages:
+        if msg["role"] == "user":
+            return msg["content"][:20]
+    return "新对话"
+
+
+def _serialize(messages):
+    return [json.dumps(msg, ensure_ascii=False) for msg in messages]
+
+
+def _messages_hash(serialized):
+    """已序列化消息列表的摘要，用于校验库中已保存的前缀是否被改动"""
+    digest = hashlib.sha256()
+    for data in serialized:
+        digest.update(data.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _upsert_conversation(conn, conversation_id, serialized, title, timestamp):
+    conn.execute(
+        "INSERT INTO conversations (id, title, timestamp, message_count, messages_hash) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET title = excluded.title, timestamp = excluded.timestamp, "
+        "message_count = excluded.message_count, messages_hash = excluded.messages_hash",
+        (conversation_id, title, timestamp, len(serialized), _messages_hash(serialized))
+    )
+
+
+def _write_conversation(conn, conversation_id, messages, title, timestamp, serialized=None):
+    """在调用方事务中整体写入一条对话"""
+    serialized = serialized if serialized is not None else _serialize(messages)
+    _upsert_conversation(conn, conversation_id, serialized, title, timestamp)
+    conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+    conn.executemany(
+        "INSERT INTO messages (conversation_id, seq, data) VALUES (?, ?, ?)",
+        [(conversation_id, seq, data) for seq, data in enumerate(serialized)]
+    )
+
+
+def _append_messages(conn, conversation_id, messages, title, timestamp):
+    """
+    增量写入：库中已有的前缀不变时只插入新增消息，否则整体重写
+
+    Returns:
+        int: 实际写入的消息条数
+    """
+    row = conn.execute(
+        "SELECT message_count, messages_hash FROM conversations WHERE id = ?", (conversation_id,)
+    ).fetchone()
+    stored, stored_hash = row if row else (0, None)
+    serialized = _serialize(messages)
+
+    # 用整段前缀的摘要校验库中已有消息是否一致（例如前端重置或改动了较早的消息）
+    if 0 < stored <= len(messages):
+        if stored_hash != _messages_hash(serialized[:stored]):
+            stored = -1
+    elif stored > len(messages):
+        stored = -1
+
+    if stored < 0:
+        _write_conversation(conn, conversation_id, messages, title, timestamp, serialized)
+        return len(messages)
+
+    _upsert_conversation(conn, conversation_id, serialized, title, timestamp)
+    conn.executemany(
+        "INSERT INTO messages (conversation_id, seq, data) VALUES (?, ?, ?)",
+        [(conversation_id, seq, serialized[seq]) for seq in range(stored, len(messages))]
+    )
+    return len(messages) - stored
+
+
+def _maybe_checkpoint(conn):
+    """定期合并 WAL 日志，避免 -wal 文件无限增长"""
+    global _save_count
+    _save_count += 1
+    if _save_count % CHECKPOINT_INTERVAL == 0:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _migrate_json_files(conn):
+    """将旧版 chat_*.json 文件导入数据库（只执行一次，原文件保留）"""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+
+    migrated = 0
+    with conn:
+        for name in sorted(os.listdir(HISTORY_DIR)):
+            if not (name.startswith("chat_") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(HISTORY_DIR, name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"迁移跳过 {name}: {e}")
+                continue
+
+            conversation_id = data.get("id") or name[len("chat_"):-len(".json")]
+            exists = conn.execute(
+                "SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if exists:
+                continue
+            messages = data.get("messages", [])
+            _write_conversation(
+                conn, conversation_id, messages,
+                data.get("title") or _make_title(messages),
+                data.get("timestamp", "")
+            )
+            migrated += 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                     (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+
+    if migrated:
+        print(f"📦 已从 JSON 文件迁移 {migrated} 条历史对话")
+
 
 def save_conversation(conversation_id, messages):
-    """保存对话到 JSON 文件"""
+    """保存对话到数据库（只追加上次保存之后的新消息，单个事务内原子提交）"""
     if not conversation_id:
         return
 
-    file_path = os.path.join(HISTORY_DIR, f"chat_{conversation_id}.json")
+    with tracer.span("history.save", messages=len(messages)) as span:
+        try:
+            conn = _connect()
+            with conn:
+                written = _append_messages(
+                    conn, conversation_id, messages,
+                    _make_title(messages),
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                )
+            span.set(written=written)
+            _maybe_checkpoint(conn)
+        except Exception as e:
+            span.record_error(e)
+            print(f"保存失败: {e}")
 
-    # 自动生成标题：取第一条用户消息的前20个字
-    title = "新对话"
-    for msg in messages:
-        if msg["role"] == "user":
-            title = msg["content"][:20]
-            break
 
-    data = {
-        "id": conversation_id,
-        "title": title,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "messages": messages
-    }
+def iter_messages(conversation_id, batch_size=100):
+    """
+    按顺序流式读取对话消息，不一次性载入整段对话
 
-    try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"保存失败: {e}")
+    Args:
+        conversation_id: 对话 ID
+        batch_size: 每次从数据库取出的条数
+
+    Yields:
+        dict: 单条消息
+    """
+    cursor = _connect().execute(
+        "SELECT data FROM messages WHERE conversation_id = ? ORDER BY seq",
+        (conversation_id,)
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for (data,) in rows:
+            yield json.loads(data)
 
 
 def load_conversation(conversation_id):
     """读取指定 ID 的对话"""
-    file_path = os.path.join(HISTORY_DIR, f"chat_{conversation_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("messages", [])
-    return []
+    with tracer.span("history.load") as span:
+        messages = list(iter_messages(conversation_id))
+        span.set(messages=len(messages))
+        return messages
 
 
-def get_all_conversations():
-    """获取所有历史对话列表（按时间倒序）"""
-    if not os.path.exists(HISTORY_DIR):
-        return []
+def get_all_conversations(limit=None, offset=0):
+    """
+    获取历史对话列表（按时间倒序，只读元数据表）
 
-    files = [f for f in os.listdir(HISTORY_DIR) if f.endswith(".json")]
-    conversations = []
+    Args:
+        limit: 最多返回条数，None 表示全部
+        offset: 跳过的条数（分页）
 
-    for f in files:
-        file_path = os.path.join(HISTORY_DIR, f)
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                conversations.append({
-                    "id": data.get("id"),
-                    "title": data.get("title", "无标题"),
-                    "timestamp": data.get("timestamp", "")
-                })
-        except:
-            continue
+    Returns:
+        list: [{"id", "title", "timestamp"}, ...]
+    """
+    with tracer.span("history.list", limit=limit, offset=offset):
+        rows = _connect().execute(
+            "SELECT id, title, timestamp FROM conversations ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset)
+        )
+        return [{"id": id_, "title": title, "timestamp": timestamp} for id_, title, timestamp in rows]
 
-    # 按时间倒序排列
-    conversations.sort(key=lambda x: x["timestamp"], reverse=True)
-    return conversations
+
+def load_tool_memo(conversation_id):
+    """
+    读取对话的工具结果记忆
+
+    Returns:
+        dict: {键: {"tool", "result", "created_at", "version"}}，可直接用于构造 ToolMemo
+    """
+    rows = _connect().execute(
+        "SELECT key, tool, result, created_at, version FROM tool_memo WHERE conversation_id = ?",
+        (conversation_id,)
+    )
+    return {key: {"tool": tool, "result": result, "created_at": created_at, "version": version}
+            for key, tool, result, created_at, version in rows}
+
+
+def save_tool_memo(conversation_id, memo):
+    """保存对话的工具结果记忆（整体替换；记忆未变化时不写库）"""
+    if not conversation_id or not memo.dirty:
+        return
+
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute("DELETE FROM tool_memo WHERE conversation_id = ?", (conversation_id,))
+            conn.executemany(
+                "INSERT INTO tool_memo (conversation_id, key, tool, result, created_at, version) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(conversation_id, key, entry["tool"], entry["result"], entry["created_at"], entry.get("version"))
+                 for key, entry in memo.entries.items()]
+            )
+        memo.dirty = False
+    except Exception as e:
+        print(f"工具记忆保存失败: {e}")
 
 
 def delete_conversation(conversation_id):
     """删除对话"""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        conn.execute("DELETE FROM tool_memo WHERE conversation_id = ?", (conversation_id,))
+        conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    # 同时删除迁移前的 JSON 文件，避免误以为记录仍在
     file_path = os.path.join(HISTORY_DIR, f"chat_{conversation_id}.json")
     if os.path.exists(file_path):
-        os.remove(file_path)
\ No newline at end of file
+        os.remove(file_path)
@@ -0,0 +1,178 @@
+"""知识库预取 - 用户消息到达时就开始检索，与首轮模型决策并行"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from tools.bm25 import tokenize
+from tracing import tracer
+
+
+# 是否开启预取（未命中的预取会多消耗一次检索，answer 模式下还会多一次内部 LLM 调用）
+SPECULATIVE_RAG = os.getenv("SPECULATIVE_RAG", "0") == "1"
+
+# 模型查询与用户原文的检索词 Jaccard 相似度不低于该值时复用预取结果
+SPECULATIVE_RAG_SIMILARITY = float(os.getenv("SPECULATIVE_RAG_SIMILARITY", "0.3"))
+
+# 过短的消息（如问候）不预取
+SPECULATIVE_RAG_MIN_CHARS = 4
+
+
+def query_similarity(a, b):
+    """
+    两个查询的相似度：BM25 检索词（中文字二元组 + 英文 / 数字词）集合的 Jaccard 系数
+    
+    Returns:
+        float: 0 ~ 1
+    """
+    terms_a, terms_b = set(tokenize(a)), set(tokenize(b))
+    if not terms_a or not terms_b:
+        return 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+class Prefetch:
+    """
+    一次预取：用户原文、检索任务与认领情况
+    
+    outcome 在对话轮结束时（KnowledgePrefetcher.finish）确定：
+    hit（认领并取得结果）/ failed（认领后超时、出错或取消）/
+    miss（有知识库查询但都不够相似）/ unused（未调用知识库）
+    """
+    
+    def __init__(self, question, future, started_at):
+        self.question = question
+        self.future = future
+        self.started_at = started_at
+        self.finished_at = None
+        self.claimed = False
+        self.succeeded = False
+        self.mismatched = False
+        self.outcome = None
+
+
+class KnowledgePrefetcher:
+    """
+    知识库预取器
+    
+    每轮对话开始时用用户原文在后台检索；模型随后请求 search_knowledge_base 且查询
+    与原文足够相似时直接等待并复用预取结果。统计命中率与节省的时间：
+    节省 = 检索耗时 - 认领后仍需等待的时间。
+    """
+    
+    def __init__(self, search_fn, similarity_threshold=SPECULATIVE_RAG_SIMILARITY, max_workers=2):
+        """
+        Args:
+            search_fn: 检索函数 search_fn(query) -> str
+            similarity_threshold: 复用预取结果的最低相似度
+            max_workers: 预取线程数
+        """
+        self.search_fn = search_fn
+        self.similarity_threshold = similarity_threshold
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._stats = {"launched": 0, "hits": 0, "failed": 0, "misses": 0, "unused": 0, "saved_seconds": 0.0}
+    
+    def _run(self, prefetch, parent):
+        with tracer.span("rag.prefetch", parent=parent):
+            try:
+                return self.search_fn(prefetch.question)
+            finally:
+                prefetch.finished_at = time.monotonic()
+    
+    def start(self, question, parent=None):
+        """
+        开始预取
+        
+        Args:
+            question: 用户原文
+            parent: 预取 span 的父 span
+        
+        Returns:
+            Prefetch | None: 消息过短时不预取
+        """
+        if not isinstance(question, str) or len(question.strip()) < SPECULATIVE_RAG_MIN_CHARS:
+            return None
+        prefetch = Prefetch(question, None, time.monotonic())
+        prefetch.future = self.pool.submit(self._run, prefetch, parent)
+        with self._lock:
+            self._stats["launched"] += 1
+        return prefetch
+    
+    def match(self, prefetch, query):
+        """
+        模型请求知识库时判断能否认领预取结果（每次预取只能认领一次）
+        
+        Returns:
+            bool: 是否认领
+        """
+        if prefetch is None or prefetch.claimed:
+            return False
+        if query_similarity(prefetch.question, query) >= self.similarity_threshold:
+            prefetch.claimed = True
+            return True
+        prefetch.mismatched = True
+        return False
+    
+    def record_hit(self, prefetch, claimed_at):
+        """认领的预取完成后记录节省的时间（命中数在 finish 时统计）"""
+        finished_at = prefetch.finished_at or time.monotonic()
+        duration = finished_at - prefetch.started_at
+        saved = duration - max(0.0, finished_at - claimed_at)
+        prefetch.succeeded = True
+        with self._lock:
+            self._stats["saved_seconds"] += saved
+        return saved
+    
+    def wait(self, prefetch, claimed_at, timeout, cancel_event=None):
+        """
+        等待认领的预取结果（同步版本，超时与取消的提示文本与 ToolExecutor 一致）
+        
+        Args:
+            prefetch: 已认领的预取
+            claimed_at: 认领时刻（time.monotonic）
+            timeout: 截止秒数（从认领算起）
+            cancel_event: threading.Event，置位后放弃等待
+        
+        Returns:
+            tuple: (工具结果, 节省的秒数)
+        """
+        deadline = claimed_at + timeout
+        while True:
+            try:
+                result = prefetch.future.result(timeout=0.1)
+                return result, self.record_hit(prefetch, claimed_at)
+            except FutureTimeoutError:
+                if cancel_event and cancel_event.is_set():
+                    return "工具调用已取消", 0.0
+                if time.monotonic() >= deadline:
+                    return f"工具调用超时（{timeout}s）", 0.0
+            except Exception as e:
+                return f"工具调用出错: {e}", 0.0
+    
+    def finish(self, prefetch):
+        """对话轮结束时确定预取的去向并计数（每次预取恰好计入 hits / failed / misses / unused 之一）"""
+        if prefetch is None:
+            return
+        if prefetch.claimed:
+            prefetch.outcome = "hit" if prefetch.succeeded else "failed"
+        else:
+            prefetch.outcome = "miss" if prefetch.mismatched else "unused"
+        key = {"hit": "hits", "failed": "failed", "miss": "misses", "unused": "unused"}[prefetch.outcome]
+        with self._lock:
+            self._stats[key] += 1
+    
+    def stats(self):
+        """
+        预取统计
+        
+        Returns:
+            dict: launched / hits / failed（认领后超时、出错或取消）/ misses（模型查询与原文不够相似）/
+                unused（未调用知识库）/
+                hit_rate / saved_seconds / mean_saved_ms（每次命中）
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["launched"], 3) if stats["launched"] else 0.0
+        stats["mean_saved_ms"] = round(stats["saved_seconds"] * 1000 / stats["hits"], 1) if stats["hits"] else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        return stats
@@ -0,0 +1,440 @@
+"""上游调用韧性 - 按端点统计延迟，自适应超时、对冲请求与熔断"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+import openai
+import requests
+
+
+# 每个端点保留的最近成功延迟样本数
+RESILIENCE_WINDOW = int(os.getenv("RESILIENCE_WINDOW", "200"))
+
+# 样本少于该值时不做自适应（使用端点配置的最大超时，也不对冲）
+RESILIENCE_MIN_SAMPLES = 20
+
+# 自适应超时 = p99 × 倍数，限制在端点配置的 [min_timeout, timeout] 之间
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3"))
+
+# 对冲请求：首个请求超过该分位延迟仍未返回时再发一个相同请求，先返回者胜出
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+
+# 对冲预算：对冲次数不超过调用次数的该比例，避免上游整体变慢时对冲请求放大负载
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+
+# 熔断：连续失败达到阈值后打开，冷却后半开放行一个探测请求，探测成功即关闭
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# 各端点的超时范围（秒）与是否对冲；未列出的端点使用 DEFAULT_POLICY
+ENDPOINT_POLICIES = {
+    "llm.chat": {"timeout": 60, "min_timeout": 5, "hedge": True},
+    "amap.weather": {"timeout": 10, "min_timeout": 1, "hedge": True},
+    "amap.place": {"timeout": 10, "min_timeout": 1, "hedge": True},
+}
+DEFAULT_POLICY = {"timeout": 30, "min_timeout": 1, "hedge": False}
+
+# 计入熔断的异常：超时与连接错误；带状态码的错误只有 429 / 5xx 计入
+UPSTREAM_ERRORS = (
+    TimeoutError, asyncio.TimeoutError, ConnectionError,
+    requests.Timeout, requests.ConnectionError,
+    httpx.TimeoutException, httpx.TransportError,
+    openai.APITimeoutError, openai.APIConnectionError,
+)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间的快速失败"""
+    
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(error):
+    """
+    判断异常是否说明上游不健康（超时、连接错误、429、5xx）
+    
+    4xx 等客户端错误说明上游正常响应，只与本次请求有关，不计入熔断。
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, UPSTREAM_ERRORS)
+
+
+class LatencyTracker:
+    """滑动窗口延迟统计（线程安全）"""
+    
+    def __init__(self, window=RESILIENCE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+    
+    def percentile(self, p):
+        """
+        Returns:
+            float | None: 第 p 百分位延迟（秒），样本不足时返回 None
+        """
+        with self._lock:
+            if len(self.samples) < RESILIENCE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(len(ordered) * p / 100.0 + 0.5) - 1))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    熔断器：closed（正常）→ open（快速失败）→ half_open（放行一个探测请求）
+    """
+    
+    def __init__(self, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        """
+        Args:
+            failure_threshold: 打开熔断所需的连续失败次数
+            cooldown: 打开后多少秒进入半开状态
+            clock: 时间函数
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """本次调用是否放行（半开状态只放行一个探测请求）"""
+        with self._lock:
+            if self.state == "open" and self.clock() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+    
+    def retry_after(self):
+        """距离进入半开状态的秒数"""
+        with self._lock:
+            return max(0.0, self.opened_at + self.cooldown - self.clock()) if self.state == "open" else 0.0
+    
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = self.clock()
+                self.opens += 1
+            self._probing = False
+
+
+# 同步对冲请求使用的共享线程池
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+    return _hedge_pool
+
+
+def _discard(discard, value):
+    """释放落败请求的结果（如关闭未读完的流），异常一律忽略"""
+    if discard is None:
+        return
+    try:
+        result = discard(value)
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+    except Exception:
+        pass
+
+
+class Endpoint:
+    """
+    单个上游端点的韧性策略
+    
+    - 自适应超时：近期成功延迟的 p99 × ADAPTIVE_TIMEOUT_MULTIPLIER，限制在 [min_timeout, timeout]
+    - 对冲请求：首个请求超过 HEDGE_PERCENTILE 分位延迟仍未返回时再发一个（受 HEDGE_BUDGET 限制），
+      先成功者胜出，落败请求的结果交给 discard 释放
+    - 熔断：连续失败 BREAKER_FAILURES 次后打开，期间直接抛出 CircuitOpenError；
+      只有 is_upstream_failure 的异常计为失败，客户端错误照常抛出但视为上游正常响应
+    """
+    
+    def __init__(self, name, timeout, min_timeout=1, hedge=False, breaker=None):
+        """
+        Args:
+            name: 端点名（如 llm.chat、amap.weather、tool.get_weather）
+            timeout: 最大超时秒数（样本不足时使用）
+            min_timeout: 自适应超时的下限
+            hedge: 是否对冲
+            breaker: 熔断器，默认新建 CircuitBreaker
+        """
+        self.name = name
+        self.max_timeout = timeout
+        self.min_timeout = min_timeout
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0}
+    
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+    
+    def _take_hedge(self):
+        """在对冲预算内则计入一次对冲并返回 True"""
+        with self._lock:
+            if self._stats["hedges"] + 1 > self._stats["calls"] * HEDGE_BUDGET:
+                return False
+            self._stats["hedges"] += 1
+            return True
+    
+    def timeout(self):
+        """当前的自适应超时（秒）"""
+        p99 = self.latency.percentile(99)
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * ADAPTIVE_TIMEOUT_MULTIPLIER))
+    
+    def hedge_delay(self):
+        """发出对冲请求前的等待秒数，None 表示不对冲"""
+        if not (self.hedge and HEDGE_REQUESTS):
+            return None
+        return self.latency.percentile(HEDGE_PERCENTILE)
+    
+    def allow(self):
+        """
+        熔断检查（调用方自行执行请求时使用）
+        
+        Returns:
+            bool: 是否放行；不放行时计入 rejected
+        """
+        self._count("calls")
+        if self.breaker.allow():
+            return True
+        self._count("rejected")
+        return False
+    
+    def record_success(self, seconds):
+        self.latency.record(seconds)
+        self.breaker.record_success()
+    
+    def record_failure(self):
+        self._count("failures")
+        self.breaker.record_failure()
+    
+    def record_error(self, error):
+        """按异常类型更新熔断：上游故障计为失败，客户端错误视为上游正常响应"""
+        if is_upstream_failure(error):
+            self.record_failure()
+        else:
+            self.breaker.record_success()
+    
+    def _rejected_error(self):
+        retry_after = self.breaker.retry_after()
+        return CircuitOpenError(f"{self.name} 暂时不可用（熔断中，{retry_after:.0f}s 后重试）", retry_after)
+    
+    def _timed(self, fn, timeout):
+        """执行一次请求，成功时记录其自身的延迟（对冲落败的请求也计入延迟分布）"""
+        started = time.monotonic()
+        value = fn(timeout)
+        self.latency.record(time.monotonic() - started)
+        return value
+    
+    def call(self, fn, discard=None):
+        """
+        同步调用
+        
+        Args:
+            fn: 请求函数 fn(timeout) -> 结果，失败时抛出异常
+            discard: 对冲落败请求结果的释放函数 discard(结果)
+        
+        Returns:
+            请求结果
+        
+        Raises:
+            CircuitOpenError: 熔断打开
+        """
+        if not self.allow():
+            raise self._rejected_error()
+        timeout = self.timeout()
+        delay = self.hedge_delay()
+        try:
+            if delay is None:
+                value = self._timed(fn, timeout)
+            else:
+                value = self._hedged_call(fn, timeout, delay, discard)
+        except Exception as e:
+            self.record_error(e)
+            raise
+        self.breaker.record_success()
+        return value
+    
+    def _hedged_call(self, fn, timeout, delay, discard):
+        pool = _get_hedge_pool()
+        primary = pool.submit(self._timed, fn, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge():
+            return primary.result()
+        
+        backup = pool.submit(self._timed, fn, timeout)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is backup:
+                    self._count("hedge_wins")
+                for loser in pending:
+                    loser.add_done_callback(
+                        lambda f: f.exception() is None and _discard(discard, f.result())
+                    )
+                return future.result()
+        raise error
+    
+    async def acall(self, factory, discard=None):
+        """
+        异步调用，语义与 call 一致
+        
+        Args:
+            factory: 协程工厂 factory(timeout) -> 结果，失败时抛出异常
+            discard: 对冲落败请求结果的释放函数（可以是协程函数）
+        """
+        if not self.allow():
+            raise self._rejected_error()
+        timeout = self.timeout()
+        delay = self.hedge_delay()
+        try:
+            value = await self._ahedged_call(factory, timeout, delay, discard)
+        except Exception as e:
+            self.record_error(e)
+            raise
+        self.breaker.record_success()
+        return value
+    
+    async def _atimed(self, factory, timeout):
+        started = time.monotonic()
+        value = await factory(timeout)
+        self.latency.record(time.monotonic() - started)
+        return value
+    
+    async def _ahedged_call(self, factory, timeout, delay, discard):
+        primary = asyncio.ensure_future(self._atimed(factory, timeout))
+        if delay is None:
+            return await primary
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._take_hedge():
+                winner = primary
+                return await primary
+            
+            backup = asyncio.ensure_future(self._atimed(factory, timeout))
+            tasks.append(backup)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is backup:
+                        self._count("hedge_wins")
+                    winner = task
+                    return task.result()
+            raise error
+        finally:
+            # 未完成的请求直接取消；已完成但落败的结果交给 discard 释放
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif task is not winner and not task.cancelled() and task.exception() is None:
+                    _discard(discard, task.result())
+    
+    def metrics(self):
+        """
+        Returns:
+            dict: state / timeout_s / p50_ms / p95_ms / p99_ms / samples / calls / failures / rejected /
+                hedges / hedge_wins / hedge_win_rate / opens
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        for p in (50, 95, 99):
+            value = self.latency.percentile(p)
+            stats[f"p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+        stats["samples"] = len(self.latency.samples)
+        stats["state"] = self.breaker.state
+        stats["opens"] = self.breaker.opens
+        stats["timeout_s"] = round(self.timeout(), 3)
+        stats["hedge_win_rate"] = round(stats["hedge_wins"] / stats["hedges"], 3) if stats["hedges"] else 0.0
+        return stats
+
+
+# 端点名 -> Endpoint（进程内共享）
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name, **policy):
+    """
+    获取（首次使用时创建）端点
+    
+    Args:
+        name: 端点名
+        **policy: 首次创建时覆盖 ENDPOINT_POLICIES 中的 timeout / min_timeout / hedge
+    
+    Returns:
+        Endpoint: 进程内共享实例
+    """
+    endpoint = _endpoints.get(name)
+    if endpoint is None:
+        with _endpoints_lock:
+            endpoint = _endpoints.get(name)
+            if endpoint is None:
+                options = dict(ENDPOINT_POLICIES.get(name, DEFAULT_POLICY), **policy)
+                endpoint = _endpoints[name] = Endpoint(name, **options)
+    return endpoint
+
+
+def resilience_metrics():
+    """
+    各端点的延迟、超时、熔断状态与对冲胜率
+    
+    Returns:
+        dict: {端点名: Endpoint.metrics()}
+    """
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return {endpoint.name: endpoint.metrics() for endpoint in sorted(endpoints, key=lambda e: e.name)}
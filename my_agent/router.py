@@ -0,0 +1,282 @@
+"""意图路由 - 明确的天气 / 地点问题在本地识别并直接调用工具，省去模型规划轮"""
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from tools.bm25 import tokenize
+
+
+# 是否在 Agent 前启用本地路由
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "0") == "1"
+
+# 走快速路径所需的最低置信度，以及规则命中在置信度中的权重（其余为分类器概率）
+ROUTER_CONFIDENCE = float(os.getenv("ROUTER_CONFIDENCE", "0.8"))
+ROUTER_RULE_WEIGHT = float(os.getenv("ROUTER_RULE_WEIGHT", "0.5"))
+
+# 快速路径的回答方式：template = 模板直接组织；llm = 一次不带工具的精简模型调用
+ROUTER_ANSWER = os.getenv("ROUTER_ANSWER", "template")
+
+# 超过该长度的消息通常包含多个诉求，交给模型规划
+ROUTER_MAX_CHARS = 30
+
+# 城市词表（匹配时取最长的城市名）
+CITIES = [
+    "北京", "上海", "天津", "重庆", "广州", "深圳", "杭州", "南京", "苏州", "成都",
+    "武汉", "西安", "长沙", "郑州", "济南", "青岛", "沈阳", "大连", "哈尔滨", "长春",
+    "石家庄", "太原", "呼和浩特", "合肥", "福州", "厦门", "南昌", "南宁", "海口", "三亚",
+    "贵阳", "昆明", "拉萨", "兰州", "西宁", "银川", "乌鲁木齐", "宁波", "温州", "无锡",
+    "常州", "南通", "徐州", "佛山", "东莞", "珠海", "中山", "惠州", "泉州", "烟台",
+    "潍坊", "唐山", "保定", "洛阳", "宜昌", "襄阳", "绵阳", "桂林", "扬州", "嘉兴",
+    "绍兴", "金华", "台州", "芜湖", "赣州", "柳州", "遵义", "大理", "丽江", "香港", "澳门",
+]
+
+# 常见地标 -> 所在城市
+LANDMARK_CITIES = {
+    "天安门": "北京", "故宫": "北京", "中关村": "北京", "望京": "北京", "亦庄": "北京",
+    "外滩": "上海", "陆家嘴": "上海", "西湖": "杭州", "春熙路": "成都", "解放碑": "重庆",
+}
+
+# 地点搜索关键词（按长度优先匹配）
+POI_KEYWORDS = [
+    "小米汽车店", "小米之家", "小米汽车", "交付中心", "服务中心", "超充站", "充电站", "充电桩",
+    "加油站", "停车场", "卫生间", "洗手间", "厕所", "餐厅", "饭店", "酒店", "咖啡", "医院",
+    "药店", "银行", "超市", "商场", "地铁站",
+]
+
+_WEATHER_RULE = re.compile(r"天气|气温|温度|下雨|下雪|降温|冷不冷|热不热|刮风|雾霾|空气质量")
+_MAP_RULE = re.compile(r"附近|周边|哪里有|在哪|怎么走|门店|推荐一家|找一家|找个|地址")
+# 出现车辆相关词时问题往往需要知识库，不走快速路径
+_KNOWLEDGE_RULE = re.compile(r"yu7|su7|续航|价格|售价|配置|参数|电池|充电速度|座椅|内饰|智驾|对比|介绍", re.I)
+# 天气工具只提供实时天气，问未来的天气交给模型
+_FUTURE_RULE = re.compile(r"明天|后天|下周|周末|未来|这周|预报")
+_POI_FALLBACK = re.compile(r"(?:附近|周边)(?:的|有)?(?:什么|哪些|哪家)?([一-鿿]{2,6}?)(?:吗|呢|啊|$)")
+
+# 意图 -> 工具
+INTENT_TOOLS = {"weather": "get_weather", "map": "search_nearby"}
+
+# 快速路径的回答模板
+ROUTE_TEMPLATES = {
+    "get_weather": "为您查询到{city}的实时天气：{result}",
+    "search_nearby": "为您在{city}找到以下{keyword}：\n{result}",
+}
+
+# 工具没有查到内容时交回模型处理（由模型换个说法或追问），不套模板
+ROUTE_EMPTY_RESULTS = ("无数据", "未找到相关地点")
+
+# 分类器的内置训练语料
+SEED_EXAMPLES = {
+    "weather": [
+        "北京今天天气怎么样", "上海天气如何", "杭州现在多少度", "深圳今天热不热", "成都下雨了吗",
+        "广州的气温", "查一下武汉的天气", "南京今天冷不冷", "西安空气质量怎么样", "今天天气咋样",
+        "重庆现在温度多少", "天津刮风吗", "苏州天气", "长沙今天会下雨吗", "青岛天气好吗",
+    ],
+    "map": [
+        "北京附近的小米之家", "帮我找一下上海的小米之家", "杭州哪里有充电站", "深圳的小米汽车店在哪",
+        "成都附近有停车场吗", "广州周边的超充站", "武汉的小米服务中心地址", "南京哪里有加油站",
+        "西安附近的餐厅", "我在天安门附近想找厕所", "推荐一家北京的小米汽车店", "重庆哪里可以试驾小米",
+        "苏州的交付中心怎么走", "天津附近的酒店", "长沙找个咖啡店",
+    ],
+    "knowledge": [
+        "YU7的续航是多少", "YU7售价多少", "小米YU7有哪些配置", "YU7的电池容量", "YU7充电要多久",
+        "详细介绍下小米YU7", "YU7和特斯拉Model Y对比", "YU7的座椅怎么样", "YU7有几个版本", "YU7的智驾能力",
+        "YU7的加速成绩", "YU7轴距多少", "YU7支持哪些颜色", "YU7的后备箱多大", "YU7保修政策",
+    ],
+    "chat": [
+        "你好", "你是谁", "你有什么工具", "你是什么模型", "谢谢", "现在几点了", "选择第一个",
+        "再说一遍", "好的", "帮我规划一下", "你能做什么", "我不想要小米的", "介绍下奔驰吧",
+        "讲个笑话", "再见",
+    ],
+}
+
+
+class NaiveBayesClassifier:
+    """多项式朴素贝叶斯（特征为 BM25 检索词：中文字二元组 + 英文 / 数字词）"""
+    
+    def __init__(self, alpha=1.0):
+        """
+        Args:
+            alpha: 拉普拉斯平滑系数
+        """
+        self.alpha = alpha
+        self.term_counts = defaultdict(Counter)
+        self.label_counts = Counter()
+        self.vocabulary = set()
+    
+    def fit(self, examples):
+        """
+        训练（可多次调用追加语料）
+        
+        Args:
+            examples: [(文本, 标签), ...]
+        """
+        for text, label in examples:
+            terms = tokenize(text)
+            self.term_counts[label].update(terms)
+            self.label_counts[label] += 1
+            self.vocabulary.update(terms)
+        return self
+    
+    def predict_proba(self, text):
+        """
+        Returns:
+            dict: {标签: 后验概率}
+        """
+        terms = [t for t in tokenize(text) if t in self.vocabulary]
+        total = sum(self.label_counts.values())
+        scores = {}
+        for label, count in self.label_counts.items():
+            counts = self.term_counts[label]
+            denominator = sum(counts.values()) + self.alpha * len(self.vocabulary)
+            score = math.log(count / total)
+            for term in terms:
+                score += math.log((counts[term] + self.alpha) / denominator)
+            scores[label] = score
+        if not scores:
+            return {}
+        peak = max(scores.values())
+        exp_scores = {label: math.exp(score - peak) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+class Route:
+    """一次路由结果"""
+    
+    def __init__(self, intent, confidence, slots, fast_path, reason=""):
+        self.intent = intent
+        self.confidence = confidence
+        self.slots = slots
+        self.fast_path = fast_path
+        self.reason = reason
+    
+    @property
+    def tool(self):
+        return INTENT_TOOLS.get(self.intent)
+    
+    @property
+    def args(self):
+        """工具参数（与 TOOLS_SCHEMA 一致）"""
+        if self.intent == "weather":
+            return {"city": self.slots["city"]}
+        if self.intent == "map":
+            return {"keyword": self.slots["keyword"], "city": self.slots["city"]}
+        return {}
+    
+    def as_dict(self):
+        return {"intent": self.intent, "confidence": round(self.confidence, 3), "slots": self.slots,
+                "fast_path": self.fast_path, "reason": self.reason}
+
+
+def extract_city(text):
+    """抽取城市槽位：城市词表优先（取最长匹配），其次地标"""
+    matches = [city for city in CITIES if city in text]
+    if matches:
+        return max(matches, key=len)
+    for landmark, city in LANDMARK_CITIES.items():
+        if landmark in text:
+            return city
+    return None
+
+
+def extract_keyword(text):
+    """抽取地点搜索关键词：关键词表优先，其次“附近的 XX”句式"""
+    for keyword in POI_KEYWORDS:
+        if keyword in text:
+            return keyword
+    match = _POI_FALLBACK.search(text)
+    return match.group(1) if match else None
+
+
+class IntentRouter:
+    """
+    本地意图路由器
+    
+    规则（关键词正则）与朴素贝叶斯分类器共同打分：
+    置信度 = 规则权重 × 规则是否命中 + (1 - 规则权重) × 分类器概率。
+    只有单一工具意图、槽位齐全、且没有车辆 / 未来日期等需要模型判断的信号时才走快速路径。
+    """
+    
+    def __init__(self, threshold=None, rule_weight=None, answer_mode=None, examples=None):
+        """
+        Args:
+            threshold: 快速路径最低置信度，默认 ROUTER_CONFIDENCE
+            rule_weight: 规则命中的权重，默认 ROUTER_RULE_WEIGHT
+            answer_mode: 回答方式 "template" | "llm"，默认 ROUTER_ANSWER
+            examples: 额外训练语料 [(文本, 标签), ...]（如从历史对话中标注）
+        """
+        self.threshold = ROUTER_CONFIDENCE if threshold is None else threshold
+        self.rule_weight = ROUTER_RULE_WEIGHT if rule_weight is None else rule_weight
+        self.answer_mode = answer_mode or ROUTER_ANSWER
+        self.classifier = NaiveBayesClassifier().fit(
+            (text, label) for label, texts in SEED_EXAMPLES.items() for text in texts
+        )
+        if examples:
+            self.classifier.fit(examples)
+        self._lock = threading.Lock()
+        self._stats = Counter()
+    
+    def route(self, text):
+        """
+        判断一条用户消息能否走快速路径
+        
+        Args:
+            text: 用户消息
+        
+        Returns:
+            Route: 意图、置信度、槽位，以及是否走快速路径（否则 reason 说明原因）
+        """
+        text = (text or "").strip()
+        rules = set()
+        if _WEATHER_RULE.search(text):
+            rules.add("weather")
+        if _MAP_RULE.search(text) or any(keyword in text for keyword in POI_KEYWORDS):
+            rules.add("map")
+        
+        probabilities = self.classifier.predict_proba(text)
+        scores = {
+            label: self.rule_weight * (label in rules) + (1 - self.rule_weight) * probability
+            for label, probability in probabilities.items()
+        }
+        intent = max(scores, key=scores.get) if scores else "chat"
+        confidence = scores.get(intent, 0.0)
+        slots = {"city": extract_city(text)}
+        if intent == "map":
+            slots["keyword"] = extract_keyword(text)
+        
+        reason = ""
+        if intent not in INTENT_TOOLS:
+            reason = "非工具意图"
+        elif len(rules) > 1:
+            reason = "多个意图"
+        elif len(text) > ROUTER_MAX_CHARS:
+            reason = "消息过长"
+        elif _KNOWLEDGE_RULE.search(text):
+            reason = "涉及车辆知识"
+        elif intent == "weather" and _FUTURE_RULE.search(text):
+            reason = "非实时天气"
+        elif not all(slots.values()):
+            reason = "槽位不全"
+        elif confidence < self.threshold:
+            reason = "置信度不足"
+        with self._lock:
+            self._stats["routed"] += 1
+            self._stats["fast_path" if not reason else "fallback"] += 1
+        return Route(intent, confidence, slots, fast_path=not reason, reason=reason)
+    
+    def stats(self):
+        """
+        路由统计
+        
+        Returns:
+            dict: routed / fast_path / fallback / coverage（走快速路径的比例）
+        """
+        with self._lock:
+            stats = {key: self._stats[key] for key in ("routed", "fast_path", "fallback")}
+        stats["coverage"] = round(stats["fast_path"] / stats["routed"], 3) if stats["routed"] else 0.0
+        return stats
+    
+    @staticmethod
+    def render(route, result):
+        """按模板组织快速路径的回答"""
+        return ROUTE_TEMPLATES[route.tool].format(result=result, **route.slots)
@@ -0,0 +1,205 @@
+"""
+HTTP 服务模式 - 不依赖 Streamlit 的 ASGI 接口
+
+- POST   /v1/chat                     对话（默认 SSE 流式推送 Agent 事件）
+- GET    /v1/conversations            历史对话列表（limit / offset 分页）
+- GET    /v1/conversations/{id}       读取对话消息
+- DELETE /v1/conversations/{id}       删除对话
+- GET    /health                      存活、知识库状态与上游韧性指标
+
+每个 worker 进程启动时创建一个常驻的 AsyncAgentCore，并在后台线程预热知识库索引
+（预热期间即可接受请求，天气 / 地图问题不受影响），所有请求共享；
+多 worker 启动前由主进程先同步磁盘索引并发布共享快照，worker 只读映射同一份数据。
+
+用法（在 my_agent 目录下）:
+    python server.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import history_utils
+from agent_core import SYSTEM_PROMPT, trim_unanswered_tool_calls
+from async_agent_core import AsyncAgentCore
+from resilience import resilience_metrics
+from tool_memo import ToolMemo
+from tools.rag import init_rag_system, start_rag_warmup, rag_status
+
+load_dotenv()
+
+API_KEY = os.getenv('DASHSCOPE_API_KEY')
+
+# 对话接口地址（压测时可指向本地模拟服务）
+CHAT_BASE_URL = os.getenv('CHAT_BASE_URL', "https://dashscope.aliyuncs.com/compatible-mode/v1")
+
+DEFAULT_MODEL = os.getenv('CHAT_MODEL', "qwen-plus")
+
+# 知识库文档目录
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 推送给客户端的事件（'context' 只用于界面提示，不对外推送）
+SSE_EVENTS = ('thinking', 'delta', 'tool_call', 'tool_result', 'response', 'error')
+
+
+def _sse(event_type, data):
+    """编码一条 SSE 消息"""
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _error(status, message):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def _save_turn(conversation_id, messages, memo):
+    history_utils.save_conversation(conversation_id, messages)
+    history_utils.save_tool_memo(conversation_id, memo)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """worker 启动时开始预热知识库并创建共享 Agent，退出时关闭连接池"""
+    start_rag_warmup(DATA_DIR, API_KEY)
+    app.state.agent = AsyncAgentCore(api_key=API_KEY, base_url=CHAT_BASE_URL)
+    try:
+        yield
+    finally:
+        await app.state.agent.aclose()
+
+
+async def chat(request):
+    """
+    对话接口
+    
+    请求体: {"message": str, "conversation_id": str?, "model": str?, "stream": bool?}
+    conversation_id 为空时新建对话。stream 为 true（默认）时以 SSE 推送事件，
+    最后一条为 done 事件 {"conversation_id", "response"}；否则返回 JSON。
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "请求体不是合法 JSON")
+    message = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        return _error(400, "message 不能为空")
+    
+    conversation_id = body.get("conversation_id") or str(uuid.uuid4())
+    model = body.get("model") or DEFAULT_MODEL
+    messages = await asyncio.to_thread(history_utils.load_conversation, conversation_id)
+    if not messages:
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    messages.append({"role": "user", "content": message})
+    await asyncio.to_thread(history_utils.save_conversation, conversation_id, messages)
+    memo = ToolMemo(await asyncio.to_thread(history_utils.load_tool_memo, conversation_id))
+    
+    agent = request.app.state.agent
+    if not body.get("stream", True):
+        response, messages = await agent.run_agent(messages, model=model, memo=memo)
+        await asyncio.to_thread(_save_turn, conversation_id, messages, memo)
+        return JSONResponse({"conversation_id": conversation_id, "response": response})
+    
+    async def events():
+        response = None
+        try:
+            async for event_type, data in agent.astream_agent(messages, model=model, memo=memo):
+                if event_type in ('response', 'error'):
+                    response = data
+                if event_type in SSE_EVENTS:
+                    yield _sse(event_type, data)
+            yield _sse('done', {"conversation_id": conversation_id, "response": response})
+        finally:
+            # 客户端中途断开时也保存已完成的部分：先去掉还没有工具结果的 tool_calls，
+            # 否则之后的请求会因未应答的工具调用被接口拒绝；shield 保证断开引发的取消不会打断写入
+            trim_unanswered_tool_calls(messages)
+            await asyncio.shield(asyncio.to_thread(_save_turn, conversation_id, messages, memo))
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def list_conversations(request):
+    """历史对话列表，?limit=50&offset=0"""
+    try:
+        limit = int(request.query_params.get("limit", 50))
+        offset = int(request.query_params.get("offset", 0))
+    except ValueError:
+        return _error(400, "limit / offset 必须为整数")
+    conversations = await asyncio.to_thread(history_utils.get_all_conversations, limit, offset)
+    return JSONResponse({"conversations": conversations})
+
+
+async def get_conversation(request):
+    """读取对话消息"""
+    conversation_id = request.path_params["conversation_id"]
+    messages = await asyncio.to_thread(history_utils.load_conversation, conversation_id)
+    if not messages:
+        return _error(404, "对话不存在")
+    return JSONResponse({"conversation_id": conversation_id, "messages": messages})
+
+
+async def delete_conversation(request):
+    """删除对话"""
+    conversation_id = request.path_params["conversation_id"]
+    await asyncio.to_thread(history_utils.delete_conversation, conversation_id)
+    return JSONResponse({"conversation_id": conversation_id, "deleted": True})
+
+
+async def health(request):
+    """存活检查，附带知识库状态（rag_status: warming / ready / failed）、预取与本地路由统计，
+    以及各上游端点的延迟、自适应超时、熔断状态与对冲胜率"""
+    state, rag_error = rag_status()
+    prefetcher = request.app.state.agent.prefetcher
+    router = request.app.state.agent.router
+    return JSONResponse({
+        "status": "ok", "rag": state == "ready", "rag_status": state, "rag_error": rag_error,
+        "prefetch": prefetcher.stats() if prefetcher else None,
+        "router": router.stats() if router else None,
+        "resilience": resilience_metrics(),
+    })
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/chat", chat, methods=["POST"]),
+        Route("/v1/conversations", list_conversations, methods=["GET"]),
+        Route("/v1/conversations/{conversation_id}", get_conversation, methods=["GET"]),
+        Route("/v1/conversations/{conversation_id}", delete_conversation, methods=["DELETE"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description="小米 YU7 助手 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=1, help="worker 进程数")
+    args = parser.parse_args()
+    
+    if not API_KEY:
+        print("⚠️ 未设置 DASHSCOPE_API_KEY")
+    if args.workers > 1:
+        # 先在主进程中同步磁盘索引并发布共享快照，worker 只读映射同一份数据，
+        # 避免多个 worker 同时向量化，内存也不随 worker 数成倍增长
+        init_rag_system(DATA_DIR, API_KEY, shared=True)
+        os.environ["RAG_SHARED_INDEX"] = "1"
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
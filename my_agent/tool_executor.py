@@ -0,0 +1,128 @@
+"""并行工具执行器 - 同一轮的多个工具调用并发执行"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# 各工具的最大并发数（未列出的工具使用 DEFAULT_TOOL_CONCURRENCY）
+TOOL_CONCURRENCY = {
+    "search_knowledge_base": 2,
+    "get_weather": 4,
+    "search_nearby": 4,
+}
+DEFAULT_TOOL_CONCURRENCY = 4
+
+# 单次工具调用的截止时间（秒）
+TOOL_TIMEOUTS = {
+    "search_knowledge_base": 30,
+}
+DEFAULT_TOOL_TIMEOUT = 15
+
+
+class ToolExecutor:
+    """
+    并行工具执行器
+    
+    同一轮模型决策产生的工具调用提交到共享线程池并发执行，
+    每个工具受独立的并发上限约束，每次调用有各自的截止时间。
+    结果按完成顺序产出，由调用方按原始顺序写回消息列表。
+    """
+    
+    def __init__(self, max_workers=8, concurrency_limits=None, timeouts=None,
+                 default_timeout=DEFAULT_TOOL_TIMEOUT):
+        """
+        Args:
+            max_workers: 线程池大小
+            concurrency_limits: {工具名: 最大并发数}，默认 TOOL_CONCURRENCY
+            timeouts: {工具名: 截止秒数}，默认 TOOL_TIMEOUTS
+            default_timeout: 未单独配置的工具的截止秒数
+        """
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.concurrency_limits = concurrency_limits or TOOL_CONCURRENCY
+        self.timeouts = timeouts or TOOL_TIMEOUTS
+        self.default_timeout = default_timeout
+        self._semaphores = {}
+        self._lock = threading.Lock()
+    
+    def _semaphore(self, name):
+        with self._lock:
+            if name not in self._semaphores:
+                limit = self.concurrency_limits.get(name, DEFAULT_TOOL_CONCURRENCY)
+                self._semaphores[name] = threading.BoundedSemaphore(limit)
+            return self._semaphores[name]
+    
+    def _run_one(self, name, args, call_fn, cancel_event, deadline):
+        """在工作线程中执行单个工具调用（排队等待并发名额时可被取消）"""
+        semaphore = self._semaphore(name)
+        while not semaphore.acquire(timeout=0.05):
+            if (cancel_event and cancel_event.is_set()) or time.monotonic() >= deadline:
+                return None
+        try:
+            if cancel_event and cancel_event.is_set():
+                return None
+            return call_fn(name, args)
+        finally:
+            semaphore.release()
+    
+    def execute(self, calls, call_fn, cancel_event=None):
+        """
+        并发执行一组工具调用
+        
+        超过截止时间或被取消的调用返回提示文本；仍在运行的线程不会被强杀，
+        其结果会被丢弃。生成器被提前关闭时，尚未开始的调用会被取消。
+        
+        Args:
+            calls: [(工具名, 参数字典), ...]
+            call_fn: 执行函数 call_fn(name, args) -> str
+            cancel_event: threading.Event，置位后放弃所有未完成的调用
+            
+        Yields:
+            tuple: (调用在 calls 中的位置, 工具结果)，按完成顺序
+        """
+        futures = {}
+        deadlines = {}
+        now = time.monotonic()
+        for position, (name, args) in enumerate(calls):
+            deadline = now + self.timeouts.get(name, self.default_timeout)
+            future = self.pool.submit(self._run_one, name, args, call_fn, cancel_event, deadline)
+            futures[future] = position
+            deadlines[future] = deadline
+        
+        pending = set(futures)
+        try:
+            while pending:
+                if cancel_event and cancel_event.is_set():
+                    for future in sorted(pending, key=futures.get):
+                        future.cancel()
+                        yield futures[future], "工具调用已取消"
+                    pending = set()
+                    return
+                
+                now = time.monotonic()
+                for future in sorted(pending, key=futures.get):
+                    if deadlines[future] <= now:
+                        future.cancel()
+                        pending.discard(future)
+                        name = calls[futures[future]][0]
+                        timeout = self.timeouts.get(name, self.default_timeout)
+                        yield futures[future], f"工具调用超时（{timeout}s）"
+                if not pending:
+                    return
+                
+                wait_for = min(deadlines[f] for f in pending) - time.monotonic()
+                done, pending = wait(pending, timeout=max(0.0, min(wait_for, 0.1)),
+                                     return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=futures.get):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = f"工具调用出错: {e}"
+                    yield futures[future], result if result is not None else "工具调用已取消"
+        finally:
+            # 调用方提前停止迭代（如客户端断开）时取消尚未开始的调用
+            for future in pending:
+                future.cancel()
+    
+    def shutdown(self):
+        """关闭线程池"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
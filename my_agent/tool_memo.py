@@ -0,0 +1,73 @@
+"""工具结果记忆 - 同一对话内相同的工具调用直接复用上次结果"""
+import json
+import time
+
+
+class ToolMemo:
+    """
+    单个对话的工具结果记忆
+    
+    以（工具名, 规范化后的参数 JSON）为键保存工具结果，随对话一起持久化
+    （见 history_utils.load_tool_memo / save_tool_memo）。哪些工具可以记忆、
+    结果保存多久由调用方按工具策略决定（见 agent_core.TOOL_CACHE_POLICY）。
+    """
+    
+    def __init__(self, entries=None, clock=time.time):
+        """
+        Args:
+            entries: 已持久化的记忆 {键: {"tool", "result", "created_at", "version"}}
+            clock: 时间函数（秒，跨进程持久化需使用墙上时间）
+        """
+        self.entries = dict(entries or {})
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+    
+    @staticmethod
+    def key(name, args):
+        """
+        记忆键：参数按键排序、字符串去除首尾空白后序列化，
+        {"city": "北京 "} 与 {"city":"北京"} 得到同一个键
+        """
+        canonical = {k: v.strip() if isinstance(v, str) else v for k, v in args.items()}
+        return name + ":" + json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    
+    def get(self, name, args, ttl, version=None):
+        """
+        查找未过期的记忆
+        
+        Args:
+            name: 工具名
+            args: 参数字典
+            ttl: 存活秒数
+            version: 当前数据版本（如知识库索引版本），与写入时的版本不同视为失效
+        
+        Returns:
+            str | None: 记忆的工具结果，未命中或已过期时返回 None
+        """
+        key = self.key(name, args)
+        entry = self.entries.get(key)
+        if entry is not None and (self.clock() - entry["created_at"] > ttl or entry.get("version") != version):
+            del self.entries[key]
+            self.dirty = True
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["result"]
+    
+    def put(self, name, args, result, version=None):
+        """记录一次工具结果（version 为结果对应的数据版本）"""
+        self.entries[self.key(name, args)] = {
+            "tool": name,
+            "result": result,
+            "created_at": self.clock(),
+            "version": version,
+        }
+        self.dirty = True
+    
+    def stats(self):
+        """命中统计"""
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
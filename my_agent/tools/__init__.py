@@ -1,6 +1,24 @@
-"""工具函数包"""
-from .weather import get_weather
-from .map import search_nearby
-from .rag import search_knowledge_base
+"""工具函数包（按需加载子模块：只用天气 / 地图工具时不会导入知识库依赖）"""
+import importlib
 
-__all__ = ['get_weather', 'search_nearby', 'search_knowledge_base']
+# 导出名 -> 所在子模块
+_EXPORTS = {
+    'get_weather': '.weather',
+    'get_weather_async': '.weather',
+    'search_nearby': '.map',
+    'search_nearby_async': '.map',
+    'search_knowledge_base': '.rag',
+}
+
+__all__ = ['get_weather', 'get_weather_async', 'search_nearby', 'search_nearby_async',
+           'search_knowledge_base']
+
+
+def __getattr__(name):
+    """首次访问导出名时才导入对应子模块"""
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,331 @@
+"""高德开放平台共享客户端：连接池 + 重试 + TTL 缓存 + 同键请求合并"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from resilience import get_endpoint
+from tracing import tracer
+
+# 高德开放平台地址（压测时可指向本地模拟服务）
+AMAP_BASE_URL = os.getenv('AMAP_BASE_URL', 'https://restapi.amap.com')
+
+WEATHER_ENDPOINT = "/v3/weather/weatherInfo"
+PLACE_TEXT_ENDPOINT = "/v3/place/text"
+
+# 各接口的缓存时长（秒，设为 0 关闭）：实时天气几分钟内有效，地点信息几小时内基本不变
+CACHE_TTLS = {
+    WEATHER_ENDPOINT: float(os.getenv('AMAP_WEATHER_CACHE_TTL', '600')),
+    PLACE_TEXT_ENDPOINT: float(os.getenv('AMAP_POI_CACHE_TTL', str(6 * 3600))),
+}
+
+# 各接口在 resilience 中的端点名（独立统计延迟、自适应超时、对冲与熔断）
+RESILIENCE_ENDPOINTS = {
+    WEATHER_ENDPOINT: "amap.weather",
+    PLACE_TEXT_ENDPOINT: "amap.place",
+}
+
+# 需要重试的 HTTP 状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class AMapRequestError(Exception):
+    """高德接口返回非 200 状态码"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class _Flight:
+    """一次进行中的上游请求，同键的并发调用共享其结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AMapClient:
+    """
+    高德接口共享客户端
+
+    所有工具调用复用同一个 requests.Session（keep-alive 连接池 + 自动重试），
+    响应按 (接口, 归一化参数) 缓存；缓存未命中时，同键的并发请求
+    只会有一个真正发往上游，其余等待并共享结果。
+    """
+
+    def __init__(self, base_url=None, key=None, pool_size=20, max_retries=2,
+                 timeout=10, cache_size=1024):
+        """
+        Args:
+            base_url: 接口地址，默认 AMAP_BASE_URL
+            key: 高德 API Key，默认首次使用时读取环境变量 AMAP_KEY
+            pool_size: 连接池大小
+            max_retries: 连接错误 / 429 / 5xx 的重试次数
+            timeout: 单次请求超时上限（实际超时按观测延迟自适应，见 resilience）
+            cache_size: 缓存条目上限（LRU 淘汰）
+        """
+        self.base_url = (base_url or AMAP_BASE_URL).rstrip("/")
+        self._key = key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache_size = cache_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=0.3,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=("GET",),
+                raise_on_status=False
+            )
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # cache_key -> (expires_at, data)
+        self._inflight = {}          # cache_key -> _Flight
+        self._async_inflight = {}    # (loop id, cache_key) -> asyncio.Task
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "upstream_requests": 0, "errors": 0}
+
+    @property
+    def key(self):
+        """API Key（只在未配置时重新读取环境变量）"""
+        if not self._key:
+            self._key = os.getenv('AMAP_KEY')
+        return self._key
+
+    @staticmethod
+    def _cache_key(endpoint, params):
+        """缓存键：接口 + 去除首尾空白后排序的参数"""
+        items = tuple(sorted((k, str(v).strip()) for k, v in params.items() if k != "key"))
+        return endpoint, items
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _cache_get(self, cache_key):
+        with self._lock:
+            entry = self._cache.get(cache_key)
+            if entry and entry[0] > time.monotonic():
+                self._cache.move_to_end(cache_key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._cache[cache_key]
+            self.stats["misses"] += 1
+            return None
+
+    def _cache_put(self, cache_key, data, ttl):
+        # 只缓存业务成功的响应（status == "1"），Key 失效等错误不缓存
+        if ttl <= 0 or str(data.get("status", "1")) != "1":
+            return
+        with self._lock:
+            self._cache[cache_key] = (time.monotonic() + ttl, data)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _resilience(self, endpoint):
+        name = RESILIENCE_ENDPOINTS.get(endpoint, "amap" + endpoint.replace("/", "."))
+        return get_endpoint(name, timeout=self.timeout)
+
+    def _fetch(self, endpoint, params):
+        """同步请求上游（自适应超时 + 对冲 + 熔断）"""
+        return self._resilience(endpoint).call(
+            lambda timeout: self._fetch_once(endpoint, params, timeout)
+        )
+
+    def _fetch_once(self, endpoint, params, timeout):
+        """单次同步请求（重试由 Session 的 HTTPAdapter 负责）"""
+        self._count("upstream_requests")
+        response = self.session.get(
+            self.base_url + endpoint,
+            params={"key": self.key, **params},
+            timeout=timeout
+        )
+        if response.status_code != 200:
+            raise AMapRequestError(response.status_code)
+        return response.json()
+
+    def get_json(self, endpoint, params, ttl=None):
+        """
+        请求高德接口（带缓存与请求合并）
+
+        Args:
+            endpoint: 接口路径，如 WEATHER_ENDPOINT
+            params: 查询参数（不含 key）
+            ttl: 缓存秒数，默认按 CACHE_TTLS 配置
+
+        Returns:
+            dict: 接口返回的 JSON
+        """
+        with tracer.span("amap.request", endpoint=endpoint) as span:
+            data = self._get_json(endpoint, params, ttl, span)
+            span.set(status=str(data.get("status")))
+            return data
+
+    def _get_json(self, endpoint, params, ttl, span):
+        ttl = CACHE_TTLS.get(endpoint, 0) if ttl is None else ttl
+        cache_key = self._cache_key(endpoint, params)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            span.set(cache="hit")
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[cache_key] = _Flight()
+            else:
+                self.stats["coalesced"] += 1
+
+        span.set(cache="miss" if leader else "coalesced")
+        if not leader:
+            # 同键请求正在进行，等待其结果
+            if not flight.event.wait(self.timeout * (self.max_retries + 1)):
+                raise TimeoutError("等待合并请求超时")
+            if flight.error:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._fetch(endpoint, params)
+            self._cache_put(cache_key, flight.result, ttl)
+            return flight.result
+        except Exception as e:
+            self._count("errors")
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            flight.event.set()
+
+    async def _afetch(self, endpoint, params, http_client):
+        """异步请求上游（自适应超时 + 对冲 + 熔断）"""
+        return await self._resilience(endpoint).acall(
+            lambda timeout: self._afetch_once(endpoint, params, http_client, timeout)
+        )
+
+    async def _afetch_once(self, endpoint, params, http_client, timeout):
+        """单次异步请求，连接错误 / 429 / 5xx 时指数退避重试"""
+        attempt = 0
+        while True:
+            self._count("upstream_requests")
+            try:
+                response = await http_client.get(
+                    self.base_url + endpoint,
+                    params={"key": self.key, **params},
+                    timeout=timeout
+                )
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    raise AMapRequestError(response.status_code)
+            except AMapRequestError:
+                raise
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+            await asyncio.sleep(0.3 * (2 ** attempt))
+            attempt += 1
+
+    async def aget_json(self, endpoint, params, http_client, ttl=None):
+        """
+        get_json 的异步版本，与同步调用共享缓存
+
+        Args:
+            endpoint: 接口路径
+            params: 查询参数（不含 key）
+            http_client: 共享的 httpx.AsyncClient
+            ttl: 缓存秒数，默认按 CACHE_TTLS 配置
+
+        Returns:
+            dict: 接口返回的 JSON
+        """
+        with tracer.span("amap.request", endpoint=endpoint) as span:
+            data = await self._aget_json(endpoint, params, http_client, ttl, span)
+            span.set(status=str(data.get("status")))
+            return data
+
+    async def _aget_json(self, endpoint, params, http_client, ttl, span):
+        ttl = CACHE_TTLS.get(endpoint, 0) if ttl is None else ttl
+        cache_key = self._cache_key(endpoint, params)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            span.set(cache="hit")
+            return cached
+
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), cache_key)
+        task = self._async_inflight.get(flight_key)
+        if task is not None:
+            self._count("coalesced")
+            span.set(cache="coalesced")
+        else:
+            span.set(cache="miss")
+            task = self._async_inflight[flight_key] = loop.create_task(
+                self._afetch_flight(endpoint, params, http_client, ttl, cache_key)
+            )
+            task.add_done_callback(lambda done: self._finish_flight(flight_key, done))
+        # 上游请求由 in-flight 表中的任务持有，所有调用方（含发起方）经 shield 等待：
+        # 某个调用方被取消（客户端断开、对冲落败）只取消它自己的等待，不影响同键的其他请求
+        return await asyncio.shield(task)
+
+    async def _afetch_flight(self, endpoint, params, http_client, ttl, cache_key):
+        """同键异步请求共享的上游请求任务，成功时写入缓存"""
+        try:
+            data = await self._afetch(endpoint, params, http_client)
+        except Exception:
+            self._count("errors")
+            raise
+        self._cache_put(cache_key, data, ttl)
+        return data
+
+    def _finish_flight(self, flight_key, task):
+        if self._async_inflight.get(flight_key) is task:
+            del self._async_inflight[flight_key]
+        # 所有等待者都已取消时取走异常，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def cache_stats(self):
+        """
+        Returns:
+            dict: 命中 / 未命中 / 合并 / 上游请求 / 错误计数及当前缓存条目数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._cache)
+            return stats
+
+
+# 全局共享客户端
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_amap_client():
+    """
+    获取全局共享的高德客户端
+
+    Returns:
+        AMapClient: 共享实例
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AMapClient()
+    return _client
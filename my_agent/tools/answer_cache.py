@@ -0,0 +1,184 @@
+"""知识库问答缓存：精确匹配 + 语义近邻两级缓存"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+# 归一化时去掉的标点与空白
+_STRIP_PATTERN = re.compile(r"[\s　,.!?;:'\"，。！？；：、“”‘’（）()《》【】\[\]~～…-]+")
+
+
+def normalize_query(question):
+    """
+    归一化查询文本：全角转半角、小写、去除空白和标点
+    
+    Args:
+        question: 原始问题
+        
+    Returns:
+        str: 归一化后的文本
+    """
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    return _STRIP_PATTERN.sub("", text)
+
+
+class AnswerCache:
+    """
+    两级问答缓存
+    
+    第一级按归一化问题精确匹配；第二级在问题向量上做最近邻查找，
+    余弦相似度不低于阈值即视为命中。两级都按 LRU 淘汰并带 TTL，
+    索引版本变化时整体失效。
+    """
+    
+    def __init__(self, max_entries=256, ttl=3600, similarity_threshold=0.92):
+        """
+        Args:
+            max_entries: 每一级的最大条目数
+            ttl: 条目存活秒数
+            similarity_threshold: 语义命中的最低余弦相似度
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self.lock = threading.Lock()
+        self._exact = OrderedDict()     # key -> (answer, expires_at)
+        self._semantic = OrderedDict()  # key -> (vector, answer, expires_at)
+        self._matrix = None
+        self._matrix_keys = []
+        self.counters = {
+            "exact_hits": 0,
+            "exact_misses": 0,
+            "semantic_hits": 0,
+            "semantic_misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        self.last_similarity = None
+    
+    def ensure_version(self, version):
+        """索引版本变化时清空缓存"""
+        with self.lock:
+            if version == self.version:
+                return
+            if self._exact or self._semantic:
+                self.counters["invalidations"] += 1
+            self.version = version
+            self._exact.clear()
+            self._semantic.clear()
+            self._matrix = None
+    
+    def get_exact(self, question):
+        """
+        第一级：归一化问题精确匹配
+        
+        Returns:
+            str | None: 命中的答案
+        """
+        key = normalize_query(question)
+        with self.lock:
+            entry = self._exact.get(key)
+            if entry and entry[1] > time.time():
+                self._exact.move_to_end(key)
+                self.counters["exact_hits"] += 1
+                return entry[0]
+            if entry:
+                del self._exact[key]
+                self.counters["expirations"] += 1
+            self.counters["exact_misses"] += 1
+            return None
+    
+    def get_similar(self, vector):
+        """
+        第二级：问题向量最近邻查找
+        
+        Args:
+            vector: 问题向量
+            
+        Returns:
+            str | None: 相似度达到阈值时返回缓存的答案
+        """
+        query = self._normalize_vector(vector)
+        with self.lock:
+            self._purge_expired_semantic()
+            if not self._semantic:
+                self.counters["semantic_misses"] += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = list(self._semantic.keys())
+                self._matrix = np.stack([self._semantic[k][0] for k in self._matrix_keys])
+            
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            self.last_similarity = float(scores[best])
+            if self.last_similarity < self.similarity_threshold:
+                self.counters["semantic_misses"] += 1
+                return None
+            
+            key = self._matrix_keys[best]
+            self._semantic.move_to_end(key)
+            self.counters["semantic_hits"] += 1
+            return self._semantic[key][1]
+    
+    def put(self, question, vector, answer):
+        """
+        写入两级缓存
+        
+        Args:
+            question: 原始问题
+            vector: 问题向量，None 时只写入精确匹配级
+            answer: 答案
+        """
+        key = normalize_query(question)
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self._exact[key] = (answer, expires_at)
+            self._exact.move_to_end(key)
+            self._evict(self._exact)
+            
+            if vector is not None:
+                self._semantic[key] = (self._normalize_vector(vector), answer, expires_at)
+                self._semantic.move_to_end(key)
+                self._evict(self._semantic)
+                self._matrix = None
+    
+    def stats(self):
+        """
+        Returns:
+            dict: 命中/未命中计数、命中率、当前条目数及最近一次语义相似度
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            exact_total = stats["exact_hits"] + stats["exact_misses"]
+            semantic_total = stats["semantic_hits"] + stats["semantic_misses"]
+            stats["exact_hit_rate"] = round(stats["exact_hits"] / exact_total, 4) if exact_total else 0.0
+            stats["semantic_hit_rate"] = round(stats["semantic_hits"] / semantic_total, 4) if semantic_total else 0.0
+            stats["exact_entries"] = len(self._exact)
+            stats["semantic_entries"] = len(self._semantic)
+            stats["similarity_threshold"] = self.similarity_threshold
+            stats["last_similarity"] = self.last_similarity
+            return stats
+    
+    @staticmethod
+    def _normalize_vector(vector):
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+    
+    def _evict(self, store):
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+            self.counters["evictions"] += 1
+    
+    def _purge_expired_semantic(self):
+        now = time.time()
+        expired = [k for k, entry in self._semantic.items() if entry[2] <= now]
+        for key in expired:
+            del self._semantic[key]
+            self.counters["expirations"] += 1
+        if expired:
+            self._matrix = None
@@ -0,0 +1,124 @@
+"""面向中文的 BM25 倒排索引（本地关键词检索，无需向量接口）"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+# 中日韩字符连续段按二元组切分；英文与数字按词切分，保留 "96.3" 这类小数
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]+|[a-z0-9]+(?:\.[0-9]+)*")
+_ALNUM_PARTS = re.compile(r"[a-z]+|[0-9]+(?:\.[0-9]+)*")
+
+
+def tokenize(text):
+    """
+    切分文本为检索词
+    
+    中文连续段切为字二元组（单字段保留单字）；字母数字混合的词
+    同时保留整体与拆分后的字母、数字部分，如 "yu7" -> yu7 / yu / 7。
+    
+    Args:
+        text: 文本
+    
+    Returns:
+        list: 检索词列表（可重复）
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if run[0].isascii():
+            tokens.append(run)
+            parts = _ALNUM_PARTS.findall(run)
+            if len(parts) > 1:
+                tokens.extend(parts)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """BM25 倒排索引"""
+    
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        Args:
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc_id: tf}
+        self.doc_lengths = {}
+        self.doc_terms = {}  # doc_id -> 该文档包含的检索词（用于删除）
+        self.total_length = 0
+    
+    def __len__(self):
+        return len(self.doc_lengths)
+    
+    def add(self, doc_id, text):
+        """
+        加入一个文档（同 ID 重复加入会先移除旧内容）
+        
+        Args:
+            doc_id: 文档 ID
+            text: 文档文本
+        """
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        self.doc_terms[doc_id] = list(counts)
+        length = sum(counts.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+    
+    def remove(self, doc_id):
+        """移除一个文档"""
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+    
+    def idf(self, term):
+        """检索词的逆文档频率（未出现的词取最大值）"""
+        n = len(self.postings.get(term, ()))
+        total = len(self.doc_lengths)
+        return math.log(1 + (total - n + 0.5) / (n + 0.5))
+    
+    def search(self, query, k=10):
+        """
+        BM25 检索
+        
+        Args:
+            query: 查询文本
+            k: 返回的文档数
+        
+        Returns:
+            list: [(doc_id, bm25 分数, 覆盖率), ...]，按分数降序；
+                覆盖率为该文档命中的检索词 idf 之和占全部检索词 idf 之和的比例
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_lengths:
+            return []
+        
+        avg_length = self.total_length / len(self.doc_lengths)
+        total_idf = sum(self.idf(term) for term in terms)
+        scores = defaultdict(float)
+        matched_idf = defaultdict(float)
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            weight = self.idf(term)
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += weight * tf * (self.k1 + 1) / (tf + norm)
+                matched_idf[doc_id] += weight
+        
+        ranked = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score, matched_idf[doc_id] / total_idf) for doc_id, score in ranked]
@@ -0,0 +1,265 @@
+"""批量并发向量化管线"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from .tokens import estimate_tokens
+
+
+def _is_throttled(exc):
+    """判断异常是否为上游限流（HTTP 429 / Throttling）"""
+    message = str(exc)
+    return "429" in message or "Throttling" in message or "rate limit" in message.lower()
+
+
+def _is_retryable(exc):
+    """判断异常是否值得重试：参数/鉴权错误（ValueError）直接失败"""
+    return not isinstance(exc, ValueError)
+
+
+def _query_batch_function(embeddings):
+    """
+    底层向量模型按批向量化查询的函数
+    
+    DashScope 区分 query / document 两种文本类型，批量接口同样可以指定 query；
+    没有批量查询接口的模型在批内逐条调用 embed_query。
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries
+    if type(embeddings).__name__ == "DashScopeEmbeddings":
+        from langchain_community.embeddings.dashscope import embed_with_retry
+        
+        def embed(texts):
+            items = embed_with_retry(embeddings, input=texts, text_type="query", model=embeddings.model)
+            return [item["embedding"] for item in items]
+        return embed
+    return lambda texts: [embeddings.embed_query(text) for text in texts]
+
+
+class TokenBucket:
+    """令牌桶限速器（线程安全）"""
+    
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量，默认等于 rate（即允许 1 秒的突发）
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, amount=1):
+        """
+        取出指定数量的令牌，不足时阻塞等待
+        
+        超过桶容量的请求在桶满时放行并记为欠账，后续请求会相应等待更久。
+        
+        Args:
+            amount: 需要的令牌数
+        
+        Returns:
+            float: 本次等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return waited
+                delay = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class EmbeddingStats:
+    """向量化吞吐统计"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.tokens = 0
+        self.batches = 0
+        self.retries = 0
+        self.throttled = 0
+        self.elapsed = 0.0
+    
+    def record_batch(self, chunks, tokens):
+        with self.lock:
+            self.chunks += chunks
+            self.tokens += tokens
+            self.batches += 1
+    
+    def record_retry(self, throttled):
+        with self.lock:
+            self.retries += 1
+            if throttled:
+                self.throttled += 1
+    
+    def as_dict(self):
+        """
+        Returns:
+            dict: 累计块数、token 数、批次数、重试次数及吞吐（块/秒、tokens/秒）
+        """
+        elapsed = self.elapsed or 1e-9
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "batches": self.batches,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "chunks_per_second": round(self.chunks / elapsed, 2),
+            "tokens_per_second": round(self.tokens / elapsed, 2),
+        }
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    批量并发向量化包装器
+    
+    将文档按批切分，用有界线程池并发调用底层向量模型；
+    请求数与 token 数分别经过令牌桶限速，遇到限流时所有工作线程
+    一起按指数退避冷却，避免雪崩式重试。可直接传给 FAISS 使用。
+    """
+    
+    def __init__(self, embeddings, batch_size=25, max_workers=4,
+                 requests_per_second=None, tokens_per_second=None,
+                 max_retries=5, backoff_base=1.0, backoff_max=30.0):
+        """
+        Args:
+            embeddings: 底层向量模型（如 DashScopeEmbeddings）
+            batch_size: 每次请求的文本条数
+            max_workers: 并发请求数上限
+            requests_per_second: 每秒请求数上限，None 表示不限
+            tokens_per_second: 每秒 token 数上限，None 表示不限
+            max_retries: 单批最大重试次数
+            backoff_base: 指数退避的初始等待秒数
+            backoff_max: 单次退避的最大等待秒数
+        """
+        self.embeddings = embeddings
+        self.batch_size = max(1, int(batch_size))
+        self.max_workers = max(1, int(max_workers))
+        self.request_bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.token_bucket = TokenBucket(tokens_per_second) if tokens_per_second else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = EmbeddingStats()
+        self._cooldown_lock = threading.Lock()
+        self._cooldown_until = 0.0
+    
+    def _wait_for_capacity(self, tokens):
+        """等待限流冷却结束并取得请求/token 配额"""
+        while True:
+            with self._cooldown_lock:
+                remaining = self._cooldown_until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(tokens)
+    
+    def _call_with_retry(self, func, texts, record=True):
+        """
+        带限速与指数退避地调用底层向量模型
+        
+        Args:
+            func: 实际执行向量化的函数
+            texts: 本批文本
+            record: 是否计入吞吐统计（查询向量化不计入）
+        """
+        tokens = sum(estimate_tokens(t) for t in texts)
+        attempt = 0
+        while True:
+            self._wait_for_capacity(tokens)
+            try:
+                result = func(texts)
+                if record:
+                    self.stats.record_batch(len(texts), tokens)
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                throttled = _is_throttled(e)
+                self.stats.record_retry(throttled)
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.0)
+                if throttled:
+                    # 限流是全局信号：让所有工作线程一起冷却
+                    with self._cooldown_lock:
+                        self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+    
+    def _embed_batches(self, func, texts, record):
+        """按批并发调用 func，结果顺序与输入一致"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.max_workers == 1:
+            results = [self._call_with_retry(func, b, record) for b in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                results = list(pool.map(lambda b: self._call_with_retry(func, b, record), batches))
+        
+        vectors = []
+        for batch_vectors in results:
+            vectors.extend(batch_vectors)
+        return vectors
+    
+    def embed_documents(self, texts):
+        """
+        批量并发向量化文档，结果顺序与输入一致
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            list: 向量列表
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        
+        started = time.perf_counter()
+        try:
+            return self._embed_batches(self.embeddings.embed_documents, texts, record=True)
+        finally:
+            self.stats.elapsed += time.perf_counter() - started
+    
+    def embed_queries(self, texts):
+        """
+        批量并发向量化查询（离线批量问答使用），结果顺序与输入一致
+        
+        Args:
+            texts: 查询文本列表
+        
+        Returns:
+            list: 查询向量列表
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        return self._embed_batches(_query_batch_function(self.embeddings), texts, record=False)
+    
+    def embed_query(self, text):
+        """
+        向量化单条查询（同样受限速与重试保护）
+        
+        Args:
+            text: 查询文本
+        
+        Returns:
+            list: 查询向量
+        """
+        return self._call_with_retry(
+            lambda batch: self.embeddings.embed_query(batch[0]), [text], record=False
+        )
@@ -1,6 +1,20 @@
 """地图搜索工具"""
-import os
-import requests
+from resilience import CircuitOpenError
+from .amap_client import get_amap_client, PLACE_TEXT_ENDPOINT
+
+
+def _format_pois(data):
+    """将高德地点搜索接口返回的 JSON 格式化为前 3 条结果"""
+    pois = data.get("pois", [])
+    
+    if not pois:
+        return "未找到相关地点"
+    
+    results = []
+    for i, p in enumerate(pois[:3], 1):
+        results.append(f"{i}. {p['name']} - {p['address']}")
+    
+    return "\n".join(results)
 
 
 def search_nearby(keyword, city):
@@ -14,25 +28,43 @@ def search_nearby(keyword, city):
     Returns:
         str: 搜索结果列表
     """
-    AMAP_KEY = os.getenv('AMAP_KEY')
-    if not AMAP_KEY:
+    client = get_amap_client()
+    if not client.key:
         return "未配置高德地图API密钥"
     
-    url = "https://restapi.amap.com/v3/place/text"
-    params = {"key": AMAP_KEY, "keywords": keyword, "city": city}
+    params = {"keywords": keyword, "city": city}
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        pois = data.get("pois", [])
-        
-        if not pois:
-            return "未找到相关地点"
-        
-        results = []
-        for i, p in enumerate(pois[:3], 1):
-            results.append(f"{i}. {p['name']} - {p['address']}")
+        return _format_pois(client.get_json(PLACE_TEXT_ENDPOINT, params))
+    except CircuitOpenError:
+        # 上游熔断中：交给调用方返回降级结果
+        raise
+    except Exception as e:
+        return f"搜索出错: {str(e)}"
+
+
+async def search_nearby_async(keyword, city, http_client):
+    """
+    search_nearby 的异步版本（与同步版本共享响应缓存）
+    
+    Args:
+        keyword: 搜索关键词
+        city: 城市名称
+        http_client: 共享的 httpx.AsyncClient（连接池）
         
-        return "\n".join(results)
+    Returns:
+        str: 搜索结果列表
+    """
+    client = get_amap_client()
+    if not client.key:
+        return "未配置高德地图API密钥"
+    
+    params = {"keywords": keyword, "city": city}
+    
+    try:
+        return _format_pois(await client.aget_json(PLACE_TEXT_ENDPOINT, params, http_client))
+    except CircuitOpenError:
+        # 上游熔断中：交给调用方返回降级结果
+        raise
     except Exception as e:
         return f"搜索出错: {str(e)}"
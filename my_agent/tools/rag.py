@@ -1,135 +1,1057 @@
 """知识库RAG工具"""
 import os
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import Docx2txtLoader
-from langchain_community.vectorstores import FAISS
-from langchain_community.chat_models.tongyi import ChatTongyi
-from langchain_community.embeddings.dashscope import DashScopeEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+import json
+import hashlib
+import time
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import numpy as np
+from .answer_cache import AnswerCache
+from .tokens import estimate_tokens
+from .bm25 import BM25Index
+from tracing import tracer
+
+# LangChain / FAISS 导入耗时较长，统一推迟到首次使用时（通常在后台预热线程中）导入，
+# 导入本模块不会拖慢界面与服务的启动
+
+
+# 切分与向量化参数（任一参数变化都会使磁盘索引失效并触发全量重建）
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+EMBEDDING_MODEL = "text-embedding-v2"
+
+# 向量化管线参数（可通过环境变量覆盖，限速为 0 表示不限）
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "25"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_RPS = float(os.getenv("EMBEDDING_RPS", "0")) or None
+EMBEDDING_TPS = float(os.getenv("EMBEDDING_TPS", "0")) or None
+
+# 检索返回的文档块数，以及去重前的候选数
+RETRIEVAL_K = 4
+RETRIEVAL_FETCH_K = 8
+
+# 向量检索与 BM25 检索结果的倒数排名融合（RRF）常数
+RRF_K = 60
+
+# 纯词法快速路径：BM25 首位结果覆盖问题中足够多的检索词（按 idf 加权），
+# 且分数明显领先第二名时，跳过向量接口直接使用关键词结果（覆盖率设为大于 1 的值可关闭）
+BM25_FAST_PATH_COVERAGE = float(os.getenv("BM25_FAST_PATH_COVERAGE", "0.8"))
+BM25_FAST_PATH_MARGIN = float(os.getenv("BM25_FAST_PATH_MARGIN", "1.5"))
+
+# 查询模式：answer = 检索后由内部 LLM 生成答案；retrieval = 直接返回检索片段给 Agent
+RAG_MODE = os.getenv("RAG_MODE", "answer")
+
+# 检索片段的上下文 token 预算
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+
+# 多进程共享索引：构建后发布为内存映射快照，各进程只读映射同一份数据
+RAG_SHARED_INDEX = os.getenv("RAG_SHARED_INDEX", "0") == "1"
+
+# 后台预热期间知识库查询最多等待的秒数，超时返回“正在预热”提示（需小于工具截止时间）
+RAG_WARMUP_WAIT = float(os.getenv("RAG_WARMUP_WAIT", "5"))
+
+# 问答缓存参数：每级条目上限、存活秒数、语义命中的余弦相似度阈值
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+# 磁盘索引格式版本，索引文件结构变化时递增
+INDEX_FORMAT_VERSION = 3
+
+# 默认索引目录：my_agent/vector_store（可通过环境变量 RAG_INDEX_DIR 覆盖）
+DEFAULT_INDEX_DIR = os.getenv("RAG_INDEX_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vector_store"
+)
+MANIFEST_FILE = "manifest.json"
+
+# 由精确索引派生的近似索引（HNSW / IVF 等）及其元数据
+ANN_INDEX_FILE = "ann.faiss"
+ANN_META_FILE = "ann.json"
+
+
+def _docx_loader(path):
+    from langchain_community.document_loaders import Docx2txtLoader
+    return Docx2txtLoader(path)
+
+
+def _text_loader(path):
+    from langchain_community.document_loaders import TextLoader
+    return TextLoader(path, encoding="utf-8")
+
+
+# 支持的文档类型及对应的加载器
+DOCUMENT_LOADERS = {
+    ".docx": _docx_loader,
+    ".txt": _text_loader,
+    ".md": _text_loader,
+}
+
+
+def _hash_file(path):
+    """计算文件内容的 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _chunk_id(text):
+    """文档块的内容寻址ID：相同文本得到相同ID"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
 
 
 class RAGSystem:
     """RAG知识库系统"""
     
-    def __init__(self, docx_path, api_key):
+    def __init__(self, data_path, api_key, index_dir=None, mode=None,
+                 context_token_budget=None, embeddings=None, llm=None,
+                 index_type=None, index_memory_mb=None):
         """
         初始化RAG系统
         
         Args:
-            docx_path: 文档路径
+            data_path: 文档路径，或包含多个文档的目录（如 data/）
             api_key: DashScope API密钥
+            index_dir: 向量索引持久化目录，默认 my_agent/vector_store
+            mode: 查询模式 "answer" | "retrieval"，默认读取 RAG_MODE
+            context_token_budget: 检索片段的 token 预算，默认读取 RAG_CONTEXT_TOKENS
+            embeddings: 自定义向量模型（如基准测试的本地桩模型），默认使用 DashScope
+            llm: 自定义回答模型，默认使用通义千问
+            index_type: 检索索引类型 "auto" 或 FAISS index_factory 字符串，默认读取 RAG_INDEX_TYPE
+            index_memory_mb: 自动选择索引类型时的内存预算，默认读取 RAG_INDEX_MEMORY_MB
         """
-        self.docx_path = docx_path
+        self.data_path = data_path
         self.api_key = api_key
-        self.rag_chain = None
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+        self.mode = mode or RAG_MODE
+        self.context_token_budget = context_token_budget or RAG_CONTEXT_TOKENS
+        self.index_version = None
+        self.embedding_stats = None
+        self.embeddings = None
+        self._custom_embeddings = embeddings
+        self._custom_llm = llm
+        self.vector_store = None
+        self.bm25 = None
+        from . import vector_index
+        self.index_type = index_type or vector_index.RAG_INDEX_TYPE
+        self.index_memory_mb = index_memory_mb or vector_index.RAG_INDEX_MEMORY_MB
+        self.index_spec = None
+        self.lexical_fast_path_hits = 0
+        self.answer_chain = None
+        self.answer_cache = AnswerCache(
+            max_entries=ANSWER_CACHE_SIZE,
+            ttl=ANSWER_CACHE_TTL,
+            similarity_threshold=ANSWER_CACHE_SIMILARITY
+        )
         self.error = None
+    
+    def _list_sources(self):
+        """
+        列出需要索引的文档
         
-    def initialize(self):
-        """初始化知识库"""
-        if not os.path.exists(self.docx_path):
-            self.error = f"⚠️ 未找到文件: {self.docx_path}"
-            return False
+        Returns:
+            list: 文档绝对路径列表（按路径排序）
+        """
+        if os.path.isfile(self.data_path):
+            return [os.path.abspath(self.data_path)]
         
+        sources = []
+        for root, _, files in os.walk(self.data_path):
+            for name in files:
+                # 跳过 Word 打开文档时生成的 ~$ 临时文件
+                if name.startswith("~$"):
+                    continue
+                if os.path.splitext(name)[1].lower() in DOCUMENT_LOADERS:
+                    sources.append(os.path.abspath(os.path.join(root, name)))
+        return sorted(sources)
+    
+    def _source_key(self, path):
+        """文档在清单中的键：相对于数据目录的路径"""
+        base = self.data_path if os.path.isdir(self.data_path) else os.path.dirname(self.data_path)
+        return os.path.relpath(path, base).replace(os.sep, "/")
+    
+    @staticmethod
+    def _config_key():
+        """
+        计算索引配置键：切分参数 + 向量模型名
+        
+        配置键变化意味着已有向量全部不可复用，需要全量重建。
+        
+        Returns:
+            str: 十六进制 SHA-256 摘要
+        """
+        params = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "embedding_model": EMBEDDING_MODEL,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def _split_document(self, path):
+        """
+        加载并切分单个文档
+        
+        Args:
+            path: 文档路径
+        
+        Returns:
+            list: 切分后的 Document 列表
+        """
+        loader = DOCUMENT_LOADERS[os.path.splitext(path)[1].lower()](path)
+        pages = loader.load()
+        for page in pages:
+            page.metadata["source"] = self._source_key(path)
+        
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        
+        # add_start_index 记录每个块在原文中的字符偏移，检索结果据此标注出处
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, 
+            chunk_overlap=CHUNK_OVERLAP,
+            add_start_index=True
+        )
+        return text_splitter.split_documents(pages)
+    
+    def _read_manifest(self):
+        """读取索引清单，不存在或损坏时返回 None"""
+        manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
         try:
-            # 1. 加载文档
-            loader = Docx2txtLoader(self.docx_path)
-            pages = loader.load()
-            
-            # 2. 分割文档
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000, 
-                chunk_overlap=100
-            )
-            docs = text_splitter.split_documents(pages)
-            
-            # 3. 向量化并存入 FAISS
-            embeddings = DashScopeEmbeddings(
-                model="text-embedding-v2", 
-                dashscope_api_key=self.api_key
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"索引清单读取失败，将重新构建: {e}")
+            return None
+    
+    def _load_index(self, embeddings):
+        """
+        从磁盘加载 FAISS 索引
+        
+        Args:
+            embeddings: 向量模型（查询时使用）
+        
+        Returns:
+            FAISS | None: 加载成功返回向量库，否则返回 None
+        """
+        from langchain_community.vectorstores import FAISS
+        
+        try:
+            # 索引文件由本进程写出，反序列化 docstore 是安全的
+            return FAISS.load_local(
+                self.index_dir,
+                embeddings,
+                allow_dangerous_deserialization=True,
+                normalize_L2=True
             )
-            vector_store = FAISS.from_documents(docs, embeddings)
+        except Exception as e:
+            print(f"磁盘索引加载失败，将重新构建: {e}")
+            return None
+    
+    def _save_index(self, vector_store, manifest):
+        """
+        将 FAISS 索引、文档块和清单持久化到磁盘
+        
+        Args:
+            vector_store: 已构建的向量库
+            manifest: 索引清单
+        """
+        manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            # 先删除旧清单，保证写入中途失败时不会误用半新半旧的索引
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
             
-            # 4. 构建检索链
-            retriever = vector_store.as_retriever()
-            llm = ChatTongyi(
-                model_name="qwen-plus", 
-                dashscope_api_key=self.api_key, 
-                temperature=0
-            )
+            vector_store.save_local(self.index_dir)
             
-            template = """
-            请根据以下提供的上下文来回答问题。
-            如果你在上下文中找不到答案，就根据你的知识库查找答案，不要试图编造答案。
-
-            上下文:
-            {context}
-
-            问题:
-            {question}
-
-            答案:
-            """
-            prompt = ChatPromptTemplate.from_template(template)
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, manifest_path)
+        except Exception as e:
+            # 持久化失败不影响本次使用，下次启动会重新构建
+            print(f"索引保存失败: {e}")
+    
+    def _sync_index(self, embeddings):
+        """
+        增量同步向量索引
+        
+        未变化的文档直接复用清单中的块ID；变化的文档重新切分，
+        只有新出现的文档块才会被向量化，消失的文档块从索引中删除。
+        
+        Args:
+            embeddings: 向量模型
+        
+        Returns:
+            FAISS | None: 同步后的向量库，没有可用文档时返回 None
+        """
+        config_key = self._config_key()
+        manifest = self._read_manifest()
+        vector_store = None
+        if manifest and manifest.get("config_key") == config_key:
+            vector_store = self._load_index(embeddings)
+        if vector_store is None:
+            manifest = {"documents": {}}
+        
+        # 1. 逐个文档比对内容哈希，只切分发生变化的文档
+        documents = {}
+        changed_chunks = {}
+        for path in self._list_sources():
+            source = self._source_key(path)
+            file_hash = _hash_file(path)
+            previous = manifest["documents"].get(source)
+            if previous and previous["sha256"] == file_hash:
+                documents[source] = previous
+                continue
             
-            def format_docs(docs):
-                return "\n\n".join(doc.page_content for doc in docs)
+            chunk_ids = []
+            for doc in self._split_document(path):
+                cid = _chunk_id(doc.page_content)
+                chunk_ids.append(cid)
+                changed_chunks.setdefault(cid, doc)
+            documents[source] = {"sha256": file_hash, "chunk_ids": chunk_ids}
+        
+        # 2. 计算块级差异
+        wanted = set()
+        for entry in documents.values():
+            wanted.update(entry["chunk_ids"])
+        existing = set(vector_store.index_to_docstore_id.values()) if vector_store else set()
+        stale_ids = sorted(existing - wanted)
+        new_ids = [cid for cid in changed_chunks if cid not in existing]
+        new_docs = [changed_chunks[cid] for cid in new_ids]
+        
+        if not wanted:
+            self.error = f"⚠️ 未找到可用文档: {self.data_path}"
+            return None
+        
+        # 3. 应用差异：删除过期块，只向量化新增块
+        if vector_store is None:
+            from langchain_community.vectorstores import FAISS
             
-            self.rag_chain = (
-                {"context": retriever | format_docs, "question": RunnablePassthrough()}
-                | prompt
-                | llm
-                | StrOutputParser()
+            # 向量归一化后 L2 距离与余弦相似度一一对应
+            vector_store = FAISS.from_documents(new_docs, embeddings, ids=new_ids, normalize_L2=True)
+        else:
+            if stale_ids:
+                vector_store.delete(stale_ids)
+            if new_docs:
+                vector_store.add_documents(new_docs, ids=new_ids)
+        
+        self.index_version = hashlib.sha256(
+            (config_key + "".join(sorted(wanted))).encode("utf-8")
+        ).hexdigest()
+        
+        if new_ids or stale_ids or documents != manifest["documents"]:
+            self._save_index(vector_store, {
+                "format_version": INDEX_FORMAT_VERSION,
+                "config_key": config_key,
+                "version": self.index_version,
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "embedding_model": EMBEDDING_MODEL,
+                "documents": documents,
+                "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        
+        print(f"✅ 知识库加载完成！共 {len(wanted)} 个文档块"
+              f"（新增向量化 {len(new_ids)}，删除 {len(stale_ids)}）。")
+        if new_ids and hasattr(embeddings, "stats"):
+            self.embedding_stats = embeddings.stats.as_dict()
+            print(f"📈 向量化吞吐: {self.embedding_stats['chunks_per_second']} 块/秒，"
+                  f"{self.embedding_stats['tokens_per_second']} tokens/秒，"
+                  f"重试 {self.embedding_stats['retries']} 次")
+        return vector_store
+    
+    def _prepare_search_index(self, vector_store):
+        """
+        按配置为检索准备索引
+        
+        磁盘上的精确（Flat）索引始终是增量同步的基准；选择近似索引时，
+        从精确索引的向量训练并构建 HNSW / IVF 索引替换内存中的检索索引，
+        并按索引版本缓存到磁盘，文档不变时下次启动直接加载。
+        
+        Args:
+            vector_store: 已同步的向量库（检索索引会被原地替换）
+        """
+        from . import vector_index
+        
+        flat = vector_store.index
+        spec = self.index_type
+        if spec == "auto":
+            spec = vector_index.choose_index_spec(
+                flat.ntotal, flat.d, self.index_memory_mb * 2 ** 20
             )
+        self.index_spec = spec
+        if spec == "Flat":
+            return
+        
+        index_path = os.path.join(self.index_dir, ANN_INDEX_FILE)
+        meta_path = os.path.join(self.index_dir, ANN_META_FILE)
+        meta = {"spec": spec, "version": self.index_version}
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) == meta:
+                    vector_store.index = vector_index.faiss.read_index(index_path)
+                    print(f"✅ 已加载 {spec} 检索索引")
+                    return
+        except Exception:
+            pass
+        
+        try:
+            started = time.time()
+            vectors = flat.reconstruct_n(0, flat.ntotal)
+            ann = vector_index.build_index(vectors, spec)
+        except Exception as e:
+            # 语料太小无法训练等情况，退回精确检索
+            print(f"⚠️ {spec} 索引构建失败，使用精确检索: {e}")
+            self.index_spec = "Flat"
+            return
+        
+        vector_store.index = ann
+        print(f"✅ {spec} 检索索引构建完成，耗时 {time.time() - started:.1f}s")
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            vector_index.faiss.write_index(ann, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        except Exception as e:
+            print(f"检索索引保存失败: {e}")
+    
+    @staticmethod
+    def _build_lexical_index(vector_store):
+        """
+        由向量库中的文档块构建 BM25 倒排索引（纯本地计算，不调用接口）
+        
+        Args:
+            vector_store: 已同步的向量库
+        
+        Returns:
+            BM25Index: 以块ID为文档ID的倒排索引
+        """
+        index = BM25Index()
+        for chunk_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(chunk_id)
+            if hasattr(doc, "page_content"):
+                index.add(chunk_id, doc.page_content)
+        return index
+    
+    def _create_embeddings(self):
+        """查询（与建索引）使用的向量模型"""
+        if self._custom_embeddings:
+            return self._custom_embeddings
+        from langchain_community.embeddings.dashscope import DashScopeEmbeddings
+        from .embedding import BatchedEmbeddings
+        
+        # 重试与限流由 BatchedEmbeddings 统一处理，底层只尝试一次
+        return BatchedEmbeddings(
+            DashScopeEmbeddings(
+                model=EMBEDDING_MODEL, 
+                dashscope_api_key=self.api_key,
+                max_retries=1
+            ),
+            batch_size=EMBEDDING_BATCH_SIZE,
+            max_workers=EMBEDDING_CONCURRENCY,
+            requests_per_second=EMBEDDING_RPS,
+            tokens_per_second=EMBEDDING_TPS
+        )
+    
+    def _create_answer_chain(self):
+        """构建回答链（检索在 query 中单独完成，以便复用问题向量）"""
+        from langchain_community.chat_models.tongyi import ChatTongyi
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        
+        llm = self._custom_llm or ChatTongyi(
+            model_name="qwen-plus", 
+            dashscope_api_key=self.api_key, 
+            temperature=0
+        )
+        
+        template = """
+        请根据以下提供的上下文来回答问题。
+        如果你在上下文中找不到答案，就根据你的知识库查找答案，不要试图编造答案。
+        
+        上下文:
+        {context}
+        
+        问题:
+        {question}
+        
+        答案:
+        """
+        prompt = ChatPromptTemplate.from_template(template)
+        return prompt | llm | StrOutputParser()
+    
+    def initialize(self):
+        """初始化知识库"""
+        if not os.path.exists(self.data_path):
+            self.error = f"⚠️ 未找到文件: {self.data_path}"
+            return False
+        
+        try:
+            embeddings = self._create_embeddings()
+            vector_store = self._sync_index(embeddings)
+            if vector_store is None:
+                return False
             
-            print(f"✅ 知识库加载完成！共 {len(docs)} 个文档块。")
+            self.embeddings = embeddings
+            self.vector_store = vector_store
+            self._prepare_search_index(vector_store)
+            self.bm25 = self._build_lexical_index(vector_store)
+            self.answer_chain = self._create_answer_chain()
             return True
-            
+        
         except Exception as e:
             self.error = str(e)
             print(f"知识库初始化失败: {e}")
             return False
     
+    def _document_hashes(self):
+        """当前数据目录中各文档的内容哈希 {出处: sha256}"""
+        return {self._source_key(path): _hash_file(path) for path in self._list_sources()}
+    
+    def export_shared(self):
+        """
+        将已初始化的索引、文档块和 BM25 倒排表发布为共享快照，供其他进程只读映射
+        
+        Returns:
+            str | None: 快照目录，失败时返回 None
+        """
+        from . import shared_index
+        
+        try:
+            directory = shared_index.write_snapshot(self.index_dir, self.vector_store, self.bm25, {
+                "version": self.index_version,
+                "config_key": self._config_key(),
+                "spec": self.index_spec,
+                "documents": self._document_hashes(),
+            })
+            print(f"📤 共享索引快照已发布: {directory}")
+            return directory
+        except Exception as e:
+            print(f"共享索引快照发布失败: {e}")
+            return None
+    
+    def attach_shared(self):
+        """
+        只读映射当前发布的共享快照，代替在本进程内加载索引
+        
+        快照的切分 / 向量配置与文档哈希都与当前一致时才会使用，
+        指定了具体索引类型时还要求类型一致。
+        
+        Returns:
+            bool: 是否成功映射
+        """
+        if not os.path.exists(self.data_path):
+            self.error = f"⚠️ 未找到文件: {self.data_path}"
+            return False
+        from . import shared_index
+        
+        directory = shared_index.current_snapshot(self.index_dir)
+        if directory is None:
+            return False
+        
+        try:
+            store = shared_index.SharedIndex(directory)
+            meta = store.meta
+            if meta["config_key"] != self._config_key() or meta["documents"] != self._document_hashes():
+                print("共享索引快照已过期，将重新构建")
+                return False
+            if self.index_type != "auto" and meta["spec"] != self.index_type:
+                return False
+            
+            self.embeddings = self._create_embeddings()
+            self.vector_store = store
+            self.bm25 = store.bm25
+            self.index_version = store.version
+            self.index_spec = meta["spec"]
+            self.answer_chain = self._create_answer_chain()
+            print(f"✅ 已映射共享索引快照（{meta['count']} 个文档块，{meta['spec']}）")
+            return True
+        except Exception as e:
+            print(f"共享索引快照映射失败: {e}")
+            return False
+    
+    def _vector_search(self, query_vector, k, search_params=None):
+        """
+        向量检索（支持近似索引的单次检索参数）
+        
+        Args:
+            query_vector: 问题向量
+            k: 返回数量
+            search_params: {"nprobe": int, "efSearch": int}，只对对应类型的索引生效
+        
+        Returns:
+            list: [(块ID, Document, 平方 L2 距离), ...]
+        """
+        return self._vector_search_batch([query_vector], k, search_params)[0]
+    
+    def _vector_search_batch(self, query_vectors, k, search_params=None):
+        """
+        多个问题向量组成矩阵一次检索
+        
+        Returns:
+            list: 每个问题一个 [(块ID, Document, 平方 L2 距离), ...]
+        """
+        from . import vector_index
+        
+        search_params = search_params or {}
+        index = self.vector_store.index
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        vector_index.faiss.normalize_L2(queries)
+        params = vector_index.search_parameters(
+            index, nprobe=search_params.get("nprobe"), ef_search=search_params.get("efSearch")
+        )
+        distances, positions = index.search(queries, k, params=params)
+        
+        batch = []
+        for row_distances, row_positions in zip(distances, positions):
+            results = []
+            for distance, position in zip(row_distances, row_positions):
+                if position < 0:
+                    continue
+                chunk_id = self.vector_store.index_to_docstore_id[int(position)]
+                doc = self.vector_store.docstore.search(chunk_id)
+                if hasattr(doc, "page_content"):
+                    results.append((chunk_id, doc, float(distance)))
+            batch.append(results)
+        return batch
+    
+    def retrieve(self, question, k=RETRIEVAL_K, token_budget=None, query_vector=None,
+                 lexical_hits=None, use_vector=True, search_params=None, vector_hits=None):
+        """
+        混合检索与问题最相关的文档块（不调用 LLM）
+        
+        向量检索与 BM25 关键词检索的候选按倒数排名融合（RRF）排序后去重：
+        内容相同或被已选块包含的块会被跳过；累计 token 超出预算时停止，
+        首个块超出预算时截断。
+        
+        Args:
+            question: 查询问题
+            k: 最多返回的块数
+            token_budget: token 预算，默认使用实例配置
+            query_vector: 已计算好的问题向量，None 时现场计算
+            lexical_hits: 已计算好的 BM25 结果，None 时现场检索
+            use_vector: False 时只用 BM25 结果，不调用向量接口
+            search_params: 近似索引的单次检索参数 {"nprobe": int, "efSearch": int}
+            vector_hits: 已检索好的向量候选（批量检索时传入），None 时现场检索
+        
+        Returns:
+            list: 命中列表，每项包含 content / score / bm25 / source / start_index / chunk_id
+        """
+        budget = token_budget or self.context_token_budget
+        fetch_k = max(k, RETRIEVAL_FETCH_K)
+        if lexical_hits is None:
+            lexical_hits = self.bm25.search(question, fetch_k) if self.bm25 else []
+        
+        # 块ID -> 候选信息；两路结果各自按名次累加 RRF 分数
+        ranked = {}
+        if use_vector:
+            if vector_hits is None:
+                if query_vector is None:
+                    query_vector = self.embeddings.embed_query(question)
+                vector_hits = self._vector_search(query_vector, fetch_k, search_params)
+            for rank, (chunk_id, doc, distance) in enumerate(vector_hits):
+                entry = ranked.setdefault(chunk_id, {"doc": doc, "score": None, "bm25": None, "rrf": 0.0})
+                # 归一化向量的平方 L2 距离 d 与余弦相似度满足 cos = 1 - d / 2
+                entry["score"] = round(1.0 - float(distance) / 2.0, 4)
+                entry["rrf"] += 1.0 / (RRF_K + rank + 1)
+        
+        for rank, (chunk_id, bm25_score, _) in enumerate(lexical_hits[:fetch_k]):
+            entry = ranked.get(chunk_id)
+            if entry is None:
+                doc = self.vector_store.docstore.search(chunk_id)
+                if not hasattr(doc, "page_content"):
+                    continue
+                entry = ranked[chunk_id] = {"doc": doc, "score": None, "bm25": None, "rrf": 0.0}
+            entry["bm25"] = round(bm25_score, 3)
+            entry["rrf"] += 1.0 / (RRF_K + rank + 1)
+        
+        hits = []
+        used_tokens = 0
+        for chunk_id, entry in sorted(ranked.items(), key=lambda item: item[1]["rrf"], reverse=True):
+            doc = entry["doc"]
+            content = doc.page_content.strip()
+            if any(content in hit["content"] or hit["content"] in content for hit in hits):
+                continue
+            
+            tokens = estimate_tokens(content)
+            if used_tokens + tokens > budget:
+                if hits:
+                    break
+                # 预算连一个完整块都放不下时，按比例截断首个块
+                content = content[:max(1, int(len(content) * budget / tokens))]
+                tokens = estimate_tokens(content)
+            
+            hits.append({
+                "chunk_id": chunk_id,
+                "content": content,
+                "score": entry["score"],
+                "bm25": entry["bm25"],
+                "source": doc.metadata.get("source", ""),
+                "start_index": doc.metadata.get("start_index"),
+            })
+            used_tokens += tokens
+            if len(hits) >= k:
+                break
+        return hits
+    
+    @staticmethod
+    def _lexical_confident(lexical_hits):
+        """BM25 结果是否足够可信，可以跳过向量检索"""
+        if not lexical_hits:
+            return False
+        _, top_score, coverage = lexical_hits[0]
+        runner_up = lexical_hits[1][1] if len(lexical_hits) > 1 else 0.0
+        return coverage >= BM25_FAST_PATH_COVERAGE and top_score >= runner_up * BM25_FAST_PATH_MARGIN
+    
+    @staticmethod
+    def format_hits(hits):
+        """
+        将检索命中格式化为工具返回文本
+        
+        Args:
+            hits: retrieve 返回的命中列表
+        
+        Returns:
+            str: 带编号、相似度 / BM25 分数和出处的片段文本
+        """
+        if not hits:
+            return "知识库中未找到相关内容"
+        
+        parts = []
+        for i, hit in enumerate(hits, 1):
+            location = hit["source"]
+            if hit["start_index"] is not None:
+                location += f" @{hit['start_index']}"
+            scores = []
+            if hit.get("score") is not None:
+                scores.append(f"相似度 {hit['score']:.3f}")
+            if hit.get("bm25") is not None:
+                scores.append(f"BM25 {hit['bm25']:.2f}")
+            parts.append(f"[{i}] {' '.join(scores)} | 出处 {location}\n{hit['content']}")
+        return "\n\n".join(parts)
+    
+    def _answer(self, question, hits):
+        """按查询模式将检索结果转为工具返回文本"""
+        if self.mode == "retrieval":
+            return self.format_hits(hits)
+        context = "\n\n".join(hit["content"] for hit in hits)
+        with tracer.span("rag.generate", context_tokens=estimate_tokens(context)):
+            return self.answer_chain.invoke({"context": context, "question": question})
+    
     def query(self, question):
         """
         查询知识库
         
+        answer 模式下检索后由内部 LLM 生成答案；retrieval 模式下
+        直接返回检索片段，由外层 Agent 组织回答，省去一次 LLM 调用。
+        
         Args:
             question: 查询问题
-            
+        
         Returns:
             str: 查询结果
         """
-        if not self.rag_chain:
+        if not self.vector_store:
             return f"知识库不可用: {self.error}"
         
-        try:
-            result = self.rag_chain.invoke(question)
+        with tracer.span("rag.query", mode=self.mode) as span:
+            try:
+                return self._query(question, span)
+            except Exception as e:
+                span.record_error(e)
+                return f"检索出错: {e}"
+    
+    def _query(self, question, span):
+        """query 的实现，span 记录命中的路径（cache: exact / lexical / semantic / miss）"""
+        # 1. 索引版本变化时缓存自动失效，然后查精确匹配缓存
+        self.answer_cache.ensure_version(self.index_version)
+        cached = self.answer_cache.get_exact(question)
+        if cached is not None:
+            span.set(cache="exact")
+            return cached
+        
+        # 2. 关键词检索足够可信时走纯词法快速路径，不调用向量接口
+        lexical_hits = self.bm25.search(question, RETRIEVAL_FETCH_K) if self.bm25 else []
+        if self._lexical_confident(lexical_hits):
+            self.lexical_fast_path_hits += 1
+            span.set(cache="lexical")
+            with tracer.span("rag.retrieve", vector=False):
+                hits = self.retrieve(question, lexical_hits=lexical_hits, use_vector=False)
+            result = self._answer(question, hits)
+            self.answer_cache.put(question, None, result)
             return result
-        except Exception as e:
-            return f"检索出错: {e}"
+        
+        # 3. 问题向量同时用于语义缓存查找和向量检索
+        with tracer.span("rag.embed_query"):
+            query_vector = self.embeddings.embed_query(question)
+        cached = self.answer_cache.get_similar(query_vector)
+        if cached is not None:
+            span.set(cache="semantic")
+            return cached
+        
+        # 4. 混合检索（+ 生成），并写回缓存
+        span.set(cache="miss")
+        with tracer.span("rag.retrieve", vector=True) as retrieve_span:
+            hits = self.retrieve(question, query_vector=query_vector, lexical_hits=lexical_hits)
+            retrieve_span.set(hits=len(hits))
+        result = self._answer(question, hits)
+        self.answer_cache.put(question, query_vector, result)
+        return result
+    
+    def _embed_queries(self, questions):
+        """批量向量化问题：向量模型支持 embed_queries 时按批请求，否则逐条请求"""
+        if hasattr(self.embeddings, "embed_queries"):
+            return self.embeddings.embed_queries(questions)
+        return [self.embeddings.embed_query(question) for question in questions]
+    
+    def query_batch(self, questions, max_concurrency=4):
+        """
+        批量查询知识库（离线批量问答、手册更新后的回归测试）
+        
+        与逐条调用 query 的缓存与检索路径一致，但未命中缓存的问题一次批量向量化、
+        组成矩阵一次向量检索；answer 模式下以有界并发生成答案。
+        
+        Args:
+            questions: 问题列表
+            max_concurrency: answer 模式下同时生成的答案数上限
+        
+        Returns:
+            list: 与输入顺序一致，每项为 {"question", "result", "path"}，
+                path 为 exact / lexical / semantic / miss / error
+        """
+        questions = list(questions)
+        if not self.vector_store:
+            return [{"question": q, "result": f"知识库不可用: {self.error}", "path": "error"} for q in questions]
+        
+        with tracer.span("rag.query_batch", mode=self.mode, questions=len(questions)) as span:
+            try:
+                results = self._query_batch(questions, max_concurrency)
+            except Exception as e:
+                span.record_error(e)
+                return [{"question": q, "result": f"检索出错: {e}", "path": "error"} for q in questions]
+            for item in results:
+                span.add(f"{item['path']}_count", 1)
+            return results
+    
+    def _query_batch(self, questions, max_concurrency):
+        """query_batch 的实现"""
+        self.answer_cache.ensure_version(self.index_version)
+        results = [None] * len(questions)
+        # 需要生成答案的问题：[(位置, 检索命中, 问题向量)]
+        pending = []
+        # 需要向量检索的问题：[(位置, BM25 结果)]
+        vector_queue = []
+        for position, question in enumerate(questions):
+            cached = self.answer_cache.get_exact(question)
+            if cached is not None:
+                results[position] = {"question": question, "result": cached, "path": "exact"}
+                continue
+            lexical_hits = self.bm25.search(question, RETRIEVAL_FETCH_K) if self.bm25 else []
+            if self._lexical_confident(lexical_hits):
+                self.lexical_fast_path_hits += 1
+                hits = self.retrieve(question, lexical_hits=lexical_hits, use_vector=False)
+                results[position] = {"question": question, "result": None, "path": "lexical"}
+                pending.append((position, hits, None))
+            else:
+                vector_queue.append((position, lexical_hits))
+        
+        if vector_queue:
+            with tracer.span("rag.embed_query", batch=len(vector_queue)):
+                vectors = self._embed_queries([questions[position] for position, _ in vector_queue])
+            searchable = []
+            for (position, lexical_hits), vector in zip(vector_queue, vectors):
+                cached = self.answer_cache.get_similar(vector)
+                if cached is not None:
+                    results[position] = {"question": questions[position], "result": cached, "path": "semantic"}
+                else:
+                    searchable.append((position, lexical_hits, vector))
+            if searchable:
+                fetch_k = max(RETRIEVAL_K, RETRIEVAL_FETCH_K)
+                with tracer.span("rag.retrieve", vector=True, batch=len(searchable)):
+                    candidates = self._vector_search_batch([vector for _, _, vector in searchable], fetch_k)
+                    for (position, lexical_hits, vector), vector_hits in zip(searchable, candidates):
+                        hits = self.retrieve(questions[position], lexical_hits=lexical_hits, vector_hits=vector_hits)
+                        results[position] = {"question": questions[position], "result": None, "path": "miss"}
+                        pending.append((position, hits, vector))
+        
+        for (position, _, vector), answer in zip(pending, self._answer_batch(
+                [(questions[position], hits) for position, hits, _ in pending], max_concurrency)):
+            if isinstance(answer, Exception):
+                results[position].update(result=f"检索出错: {answer}", path="error")
+                continue
+            results[position]["result"] = answer
+            self.answer_cache.put(questions[position], vector, answer)
+        return results
+    
+    def _answer_batch(self, items, max_concurrency):
+        """
+        批量将检索结果转为工具返回文本
+        
+        Args:
+            items: [(问题, 检索命中), ...]
+            max_concurrency: 生成并发上限
+        
+        Returns:
+            list: 与输入顺序一致的结果文本，生成失败的项为异常对象
+        """
+        if not items:
+            return []
+        if self.mode == "retrieval":
+            return [self.format_hits(hits) for _, hits in items]
+        inputs = [
+            {"context": "\n\n".join(hit["content"] for hit in hits), "question": question}
+            for question, hits in items
+        ]
+        with tracer.span("rag.generate", batch=len(inputs), max_concurrency=max_concurrency):
+            return self.answer_chain.batch(
+                inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+            )
 
 
 # 全局RAG实例
 _rag_instance = None
 
+# 后台预热任务：Future 完成即知识库就绪（结果为 init_rag_system 的返回值）
+_warmup_future = None
+_warmup_lock = threading.Lock()
 
-def init_rag_system(docx_path, api_key):
+
+def init_rag_system(data_path, api_key, index_dir=None, mode=None, shared=None):
     """
     初始化全局RAG系统
     
+    共享模式下优先只读映射已发布的快照；快照不存在或已过期时在本进程构建，
+    发布新快照后改为映射快照，释放进程内的私有副本。
+    
     Args:
-        docx_path: 文档路径
+        data_path: 文档路径或文档目录
         api_key: API密钥
-        
+        index_dir: 向量索引持久化目录
+        mode: 查询模式 "answer" | "retrieval"
+        shared: 是否使用共享快照，默认读取 RAG_SHARED_INDEX
+    
     Returns:
         tuple: (RAG实例, 错误信息)
     """
     global _rag_instance
-    _rag_instance = RAGSystem(docx_path, api_key)
-    success = _rag_instance.initialize()
-    return _rag_instance if success else None, _rag_instance.error
+    shared = RAG_SHARED_INDEX if shared is None else shared
+    # 初始化完成后才替换全局实例，预热期间的查询不会拿到未就绪的实例
+    rag = RAGSystem(data_path, api_key, index_dir=index_dir, mode=mode)
+    if shared and rag.attach_shared():
+        _rag_instance = rag
+        return rag, None
+    
+    success = rag.initialize()
+    if success and shared and rag.export_shared():
+        rag.attach_shared()
+    _rag_instance = rag
+    return rag if success else None, rag.error
+
+
+def start_rag_warmup(data_path, api_key, **kwargs):
+    """
+    在后台线程中初始化全局RAG系统，立即返回
+    
+    重复调用返回同一个 Future，界面重跑或多次启动不会重复加载。
+    
+    Args:
+        data_path: 文档路径或文档目录
+        api_key: API密钥
+        **kwargs: 传给 init_rag_system 的其他参数
+    
+    Returns:
+        Future: 结果为 (RAG实例, 错误信息)
+    """
+    global _warmup_future
+    with _warmup_lock:
+        if _warmup_future is not None:
+            return _warmup_future
+        future = _warmup_future = Future()
+    
+    def run():
+        future.set_running_or_notify_cancel()
+        started = time.time()
+        try:
+            result = init_rag_system(data_path, api_key, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        print(f"🔥 知识库预热完成，耗时 {time.time() - started:.1f}s")
+        future.set_result(result)
+    
+    # 守护线程：预热未完成时退出进程不会被阻塞
+    threading.Thread(target=run, name="rag-warmup", daemon=True).start()
+    return future
+
+
+def wait_rag_warmup(timeout=None):
+    """
+    等待后台预热结束（未启动预热时立即返回）
+    
+    Args:
+        timeout: 最长等待秒数，None 表示一直等待
+    
+    Returns:
+        bool: 预热是否已结束（成功或失败），超时返回 False
+    """
+    future = _warmup_future
+    if future is None:
+        return True
+    try:
+        future.result(timeout=timeout)
+    except FutureTimeoutError:
+        return False
+    except Exception:
+        pass
+    return True
+
+
+def rag_status():
+    """
+    获取知识库状态
+    
+    Returns:
+        tuple: (状态, 错误信息)，状态为 "idle" | "warming" | "ready" | "failed"
+    """
+    future = _warmup_future
+    if future is not None and not future.done():
+        return "warming", None
+    if future is not None and future.exception() is not None:
+        return "failed", str(future.exception())
+    if _rag_instance is None:
+        return "idle", None
+    if _rag_instance.vector_store is None:
+        return "failed", _rag_instance.error
+    return "ready", None
+
+
+def get_index_version():
+    """
+    当前知识库索引版本（文档或切分配置变化时改变）
+    
+    Returns:
+        str | None: 索引版本，知识库未初始化时返回 None
+    """
+    return _rag_instance.index_version if _rag_instance else None
+
+
+def get_cache_stats():
+    """
+    获取问答缓存的命中统计，用于调整语义相似度阈值
+    
+    Returns:
+        dict | None: 缓存统计，知识库未初始化时返回 None
+    """
+    if not _rag_instance:
+        return None
+    stats = _rag_instance.answer_cache.stats()
+    stats["lexical_fast_path"] = _rag_instance.lexical_fast_path_hits
+    return stats
 
 
 def search_knowledge_base(query):
@@ -138,10 +1060,13 @@ def search_knowledge_base(query):
     
     Args:
         query: 查询问题
-        
+    
     Returns:
         str: 检索结果
     """
+    # 预热中：短暂等待就绪，仍未完成时直接提示，不占满工具截止时间
+    if not wait_rag_warmup(RAG_WARMUP_WAIT):
+        return "知识库正在预热，请稍后再试"
     if not _rag_instance:
         return "知识库未初始化"
     
@@ -0,0 +1,306 @@
+"""
+多进程共享的只读知识库快照
+
+由一个进程把检索索引、文档块文本与 BM25 倒排表写成一组可内存映射的文件，
+其他 worker 进程以只读方式映射（numpy memmap + FAISS mmap 读取），
+数据页由操作系统页缓存在进程间共享，进程私有内存几乎不随语料规模和 worker 数增长。
+
+快照目录结构（<索引目录>/shared/<版本>/）:
+    index.faiss        检索索引（Flat / HNSW / IVF / IVF-PQ）
+    ids.npy            位置 -> 块ID
+    ids_sorted.npy     排序后的块ID，ids_order.npy 为其对应位置（按块ID查找）
+    texts.bin          UTF-8 文本拼接，text_offsets.npy 为各块起止偏移
+    sources.npy        位置 -> 出处编号（出处列表在 meta.json），starts.npy 为原文偏移
+    bm25_*.npy         CSR 格式的 BM25 倒排表
+    meta.json          版本、配置键、文档哈希等
+当前生效的快照由 <索引目录>/shared/CURRENT 指向，发布新快照时原子替换。
+"""
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from .bm25 import tokenize
+
+SHARED_DIR = "shared"
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+
+# 快照格式版本，文件结构变化时递增
+SNAPSHOT_FORMAT_VERSION = 1
+
+# 只读映射：精确 / HNSW 的向量存储用 MMAP_IFC 直接映射文件；
+# IVF / IVF-PQ 的倒排表用 MMAP 映射（MMAP_IFC 不支持 IVF 索引，读取会报错）
+FAISS_READ_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+FAISS_IVF_READ_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+def _save_array(directory, name, array):
+    np.save(os.path.join(directory, name + ".npy"), array)
+
+
+def _load_array(directory, name):
+    return np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+
+
+def write_snapshot(index_dir, vector_store, bm25, meta):
+    """
+    将已初始化的向量库与 BM25 索引写成共享快照并发布为当前版本
+    
+    Args:
+        index_dir: 索引目录
+        vector_store: 向量库（index / index_to_docstore_id / docstore）
+        bm25: 以块ID为文档ID的 BM25Index
+        meta: 写入 meta.json 的附加信息（需包含 version）
+    
+    Returns:
+        str: 快照目录
+    """
+    root = os.path.join(index_dir, SHARED_DIR)
+    # 随机后缀：同一进程以相同语料再次发布（如更换索引类型）时不会与已有目录重名
+    name = f"{meta['version'][:16]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, name)
+    tmp_directory = directory + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    
+    count = vector_store.index.ntotal
+    chunk_ids = [vector_store.index_to_docstore_id[i] for i in range(count)]
+    positions = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+    
+    # 1. 检索索引
+    faiss.write_index(vector_store.index, os.path.join(tmp_directory, "index.faiss"))
+    
+    # 2. 块ID（含按ID查找用的排序副本）
+    ids = np.array(chunk_ids, dtype="S")
+    order = np.argsort(ids, kind="stable")
+    _save_array(tmp_directory, "ids", ids)
+    _save_array(tmp_directory, "ids_sorted", ids[order])
+    _save_array(tmp_directory, "ids_order", order.astype(np.int64))
+    
+    # 3. 文本与出处
+    sources = []
+    source_numbers = {}
+    source_ids = np.empty(count, dtype=np.int32)
+    starts = np.full(count, -1, dtype=np.int64)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    with open(os.path.join(tmp_directory, "texts.bin"), "wb") as f:
+        for i, chunk_id in enumerate(chunk_ids):
+            doc = vector_store.docstore.search(chunk_id)
+            data = doc.page_content.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+            source = doc.metadata.get("source", "")
+            if source not in source_numbers:
+                source_numbers[source] = len(sources)
+                sources.append(source)
+            source_ids[i] = source_numbers[source]
+            if doc.metadata.get("start_index") is not None:
+                starts[i] = doc.metadata["start_index"]
+    _save_array(tmp_directory, "text_offsets", offsets)
+    _save_array(tmp_directory, "sources", source_ids)
+    _save_array(tmp_directory, "starts", starts)
+    
+    # 4. BM25 倒排表（CSR：检索词有序排列，倒排按位置升序）
+    terms = sorted(bm25.postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    docs, tfs = [], []
+    for t, term in enumerate(terms):
+        postings = sorted((positions[doc_id], tf) for doc_id, tf in bm25.postings[term].items())
+        docs.extend(p for p, _ in postings)
+        tfs.extend(tf for _, tf in postings)
+        term_offsets[t + 1] = len(docs)
+    doc_lengths = np.zeros(count, dtype=np.int32)
+    for doc_id, length in bm25.doc_lengths.items():
+        doc_lengths[positions[doc_id]] = length
+    _save_array(tmp_directory, "bm25_terms", np.array([t.encode("utf-8") for t in terms], dtype="S"))
+    _save_array(tmp_directory, "bm25_term_offsets", term_offsets)
+    _save_array(tmp_directory, "bm25_docs", np.array(docs, dtype=np.int32))
+    _save_array(tmp_directory, "bm25_tfs", np.array(tfs, dtype=np.int32))
+    _save_array(tmp_directory, "bm25_doc_lengths", doc_lengths)
+    
+    meta = dict(meta, format_version=SNAPSHOT_FORMAT_VERSION, count=count,
+                dim=vector_store.index.d, sources=sources,
+                ivf=faiss.try_extract_index_ivf(vector_store.index) is not None,
+                bm25={"k1": bm25.k1, "b": bm25.b, "total_length": bm25.total_length})
+    with open(os.path.join(tmp_directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    
+    # 5. 发布：目录改名后原子替换 CURRENT 指针，再清理旧快照
+    #    （已映射旧快照的进程不受影响，文件删除后映射依然有效）
+    os.replace(tmp_directory, directory)
+    current_path = os.path.join(root, CURRENT_FILE)
+    with open(current_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(current_path + ".tmp", current_path)
+    for entry in os.listdir(root):
+        # 其他进程正在写入的 .tmp 目录不清理
+        if entry == name or entry.endswith(".tmp"):
+            continue
+        if os.path.isdir(os.path.join(root, entry)):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return directory
+
+
+def current_snapshot(index_dir):
+    """
+    当前发布的快照目录
+    
+    Returns:
+        str | None: 快照目录，未发布或格式不兼容时返回 None
+    """
+    root = os.path.join(index_dir, SHARED_DIR)
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            directory = os.path.join(root, f.read().strip())
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            if json.load(f).get("format_version") != SNAPSHOT_FORMAT_VERSION:
+                return None
+        return directory
+    except (OSError, ValueError):
+        return None
+
+
+class _ChunkIds:
+    """位置 -> 块ID 的只读视图（对应向量库的 index_to_docstore_id）"""
+    
+    def __init__(self, ids):
+        self._ids = ids
+    
+    def __getitem__(self, position):
+        return self._ids[position].decode("ascii")
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def values(self):
+        return (chunk_id.decode("ascii") for chunk_id in self._ids)
+
+
+class SharedBM25:
+    """基于内存映射倒排表的 BM25 检索，打分与 BM25Index 一致"""
+    
+    def __init__(self, directory, params, chunk_ids):
+        self.k1 = params["k1"]
+        self.b = params["b"]
+        self.total_length = params["total_length"]
+        self.terms = _load_array(directory, "bm25_terms")
+        self.term_offsets = _load_array(directory, "bm25_term_offsets")
+        self.docs = _load_array(directory, "bm25_docs")
+        self.tfs = _load_array(directory, "bm25_tfs")
+        self.doc_lengths = _load_array(directory, "bm25_doc_lengths")
+        self.chunk_ids = chunk_ids
+    
+    def __len__(self):
+        return len(self.doc_lengths)
+    
+    def _postings(self, term):
+        """检索词的倒排 (位置数组, 词频数组)，不存在时返回 None"""
+        key = term.encode("utf-8")
+        if not len(self.terms) or len(key) > self.terms.dtype.itemsize:
+            return None
+        t = int(np.searchsorted(self.terms, key))
+        if t >= len(self.terms) or self.terms[t] != key:
+            return None
+        start, end = self.term_offsets[t], self.term_offsets[t + 1]
+        return self.docs[start:end], self.tfs[start:end]
+    
+    def search(self, query, k=10):
+        """
+        BM25 检索
+        
+        Returns:
+            list: [(块ID, bm25 分数, 覆盖率), ...]，同 BM25Index.search
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        total = len(self.doc_lengths)
+        if not terms or not total:
+            return []
+        
+        avg_length = self.total_length / total
+        scores = np.zeros(total, dtype=np.float64)
+        matched_idf = np.zeros(total, dtype=np.float64)
+        total_idf = 0.0
+        for term in terms:
+            postings = self._postings(term)
+            n = len(postings[0]) if postings else 0
+            weight = np.log(1 + (total - n + 0.5) / (n + 0.5))
+            total_idf += weight
+            if not n:
+                continue
+            docs, tfs = postings
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / avg_length)
+            scores[docs] += weight * tfs * (self.k1 + 1) / (tfs + norm)
+            matched_idf[docs] += weight
+        
+        candidates = np.flatnonzero(matched_idf)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.chunk_ids[int(p)], float(scores[p]), float(matched_idf[p] / total_idf))
+                for p in candidates]
+
+
+class SharedIndex:
+    """
+    只读映射的知识库快照
+    
+    提供 RAGSystem 检索用到的向量库接口（index / index_to_docstore_id / docstore.search），
+    可直接作为 RAGSystem.vector_store 使用；bm25 属性可直接作为 RAGSystem.bm25 使用。
+    """
+    
+    def __init__(self, directory):
+        """
+        Args:
+            directory: 快照目录（见 current_snapshot）
+        """
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        flags = FAISS_IVF_READ_FLAGS if self.meta.get("ivf") else FAISS_READ_FLAGS
+        self.index = faiss.read_index(os.path.join(directory, "index.faiss"), flags)
+        self.ids = _load_array(directory, "ids")
+        self.ids_sorted = _load_array(directory, "ids_sorted")
+        self.ids_order = _load_array(directory, "ids_order")
+        self.text_offsets = _load_array(directory, "text_offsets")
+        self.texts = np.memmap(os.path.join(directory, "texts.bin"), dtype=np.uint8, mode="r") \
+            if self.text_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.source_ids = _load_array(directory, "sources")
+        self.starts = _load_array(directory, "starts")
+        self.index_to_docstore_id = _ChunkIds(self.ids)
+        self.docstore = self
+        self.bm25 = SharedBM25(directory, self.meta["bm25"], self.index_to_docstore_id)
+    
+    @property
+    def version(self):
+        return self.meta["version"]
+    
+    def position(self, chunk_id):
+        """块ID 对应的位置，不存在时返回 None"""
+        key = chunk_id.encode("ascii")
+        i = int(np.searchsorted(self.ids_sorted, key))
+        if i < len(self.ids_sorted) and self.ids_sorted[i] == key:
+            return int(self.ids_order[i])
+        return None
+    
+    def document(self, position):
+        """按位置读取文档块"""
+        start, end = self.text_offsets[position], self.text_offsets[position + 1]
+        metadata = {"source": self.meta["sources"][self.source_ids[position]]}
+        if self.starts[position] >= 0:
+            metadata["start_index"] = int(self.starts[position])
+        return Document(page_content=bytes(self.texts[start:end]).decode("utf-8"), metadata=metadata)
+    
+    def search(self, chunk_id):
+        """
+        按块ID读取文档块（与 InMemoryDocstore.search 相同的约定）
+        
+        Returns:
+            Document | str: 不存在时返回提示文本
+        """
+        position = self.position(chunk_id)
+        if position is None:
+            return f"ID {chunk_id} not found."
+        return self.document(position)
@@ -0,0 +1,22 @@
+"""Token 数量估算"""
+import re
+
+# 中日韩字符大致 1 字 1 token；其余文本按约 4 个字符 1 token 估算
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]")
+
+
+def estimate_tokens(text):
+    """
+    估算文本的 token 数（无需加载分词器）
+    
+    Args:
+        text: 文本
+        
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
@@ -0,0 +1,147 @@
+"""FAISS 索引类型选择与构建（Flat / HNSW / IVF-Flat / IVF-PQ）"""
+import math
+import os
+import numpy as np
+import faiss
+
+# 索引类型："auto" 按语料规模和内存预算自动选择，或指定 FAISS index_factory 字符串，
+# 如 "Flat"、"HNSW32"、"IVF1024,Flat"、"IVF1024,PQ64"
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+
+# 向量索引的内存预算（MB）
+RAG_INDEX_MEMORY_MB = float(os.getenv("RAG_INDEX_MEMORY_MB", "1024"))
+
+# 默认检索参数：IVF 探查的聚类数、HNSW 搜索队列长度
+RAG_NPROBE = int(os.getenv("RAG_NPROBE", "16"))
+RAG_EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))
+
+# 训练（聚类 / 乘积量化）使用的最大采样数
+RAG_INDEX_TRAIN_SAMPLE = int(os.getenv("RAG_INDEX_TRAIN_SAMPLE", "50000"))
+
+# 语料不超过该规模且放得下时直接使用精确检索
+EXACT_SEARCH_MAX = 20000
+
+# HNSW 每个节点的邻居数
+HNSW_M = 32
+
+# 候选的 PQ 子空间数（越大精度越高、占用越大）
+PQ_SUBQUANTIZERS = (64, 48, 32, 24, 16, 8, 4)
+
+
+def _nlist_for(count):
+    """IVF 聚类数：约 4·√n 取 2 的幂，且保证每个聚类至少约 39 个训练点"""
+    nlist = 2 ** max(0, round(math.log2(max(1.0, 4 * math.sqrt(count)))))
+    return max(1, min(nlist, count // 39 or 1))
+
+
+def estimate_index_bytes(spec, count, dim):
+    """
+    估算索引的内存占用
+    
+    Args:
+        spec: index_factory 字符串
+        count: 向量数
+        dim: 向量维度
+    
+    Returns:
+        int: 估算字节数
+    """
+    if spec.startswith("HNSW"):
+        m = int(spec[4:].split(",")[0] or HNSW_M)
+        return count * (dim * 4 + m * 2 * 4)
+    if ",PQ" in spec:
+        m = int(spec.split(",PQ")[1].split("x")[0])
+        nlist = int(spec[3:].split(",")[0])
+        # 编码 + 倒排表中的 ID + 聚类中心
+        return count * (m + 8) + nlist * dim * 4
+    if spec.startswith("IVF"):
+        nlist = int(spec[3:].split(",")[0])
+        return count * (dim * 4 + 8) + nlist * dim * 4
+    return count * dim * 4
+
+
+def choose_index_spec(count, dim, memory_budget_bytes=None):
+    """
+    按语料规模和内存预算选择索引类型
+    
+    小语料用精确检索；内存允许时优先 HNSW（延迟最低），其次 IVF-Flat，
+    都放不下时用 IVF-PQ 压缩向量。
+    
+    Args:
+        count: 向量数
+        dim: 向量维度
+        memory_budget_bytes: 内存预算，默认 RAG_INDEX_MEMORY_MB
+    
+    Returns:
+        str: index_factory 字符串
+    """
+    budget = memory_budget_bytes or RAG_INDEX_MEMORY_MB * 2 ** 20
+    if count <= EXACT_SEARCH_MAX and estimate_index_bytes("Flat", count, dim) <= budget:
+        return "Flat"
+    
+    hnsw = f"HNSW{HNSW_M}"
+    if estimate_index_bytes(hnsw, count, dim) <= budget:
+        return hnsw
+    
+    nlist = _nlist_for(count)
+    ivf_flat = f"IVF{nlist},Flat"
+    if estimate_index_bytes(ivf_flat, count, dim) <= budget:
+        return ivf_flat
+    
+    divisors = [m for m in PQ_SUBQUANTIZERS if dim % m == 0] or [1]
+    for m in divisors:
+        spec = f"IVF{nlist},PQ{m}"
+        if estimate_index_bytes(spec, count, dim) <= budget:
+            return spec
+    # 预算不足以容纳任何候选时，选择占用最小的压缩索引
+    return f"IVF{nlist},PQ{divisors[-1]}"
+
+
+def build_index(vectors, spec, train_sample=None, seed=0):
+    """
+    由（已归一化的）向量构建指定类型的索引，位置编号与输入顺序一致
+    
+    Args:
+        vectors: float32 矩阵 (n, d)
+        spec: index_factory 字符串
+        train_sample: 训练采样数上限，默认 RAG_INDEX_TRAIN_SAMPLE
+        seed: 采样随机种子
+    
+    Returns:
+        faiss.Index: 构建完成的索引
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        limit = train_sample or RAG_INDEX_TRAIN_SAMPLE
+        if len(vectors) > limit:
+            rows = np.random.default_rng(seed).choice(len(vectors), limit, replace=False)
+            index.train(vectors[np.sort(rows)])
+        else:
+            index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def search_parameters(index, nprobe=None, ef_search=None):
+    """
+    生成单次检索使用的参数（不修改索引本身，可并发使用不同参数）
+    
+    Args:
+        index: faiss 索引
+        nprobe: IVF 探查聚类数，默认 RAG_NPROBE
+        ef_search: HNSW 搜索队列长度，默认 RAG_EF_SEARCH
+    
+    Returns:
+        faiss.SearchParameters | None: 精确索引返回 None
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe or RAG_NPROBE)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or RAG_EF_SEARCH)
+    return None
+
+
+def index_bytes(index):
+    """索引序列化后的实际大小（字节）"""
+    return int(faiss.serialize_index(index).size)
@@ -1,6 +1,15 @@
 """天气查询工具"""
-import os
-import requests
+from resilience import CircuitOpenError
+from .amap_client import get_amap_client, AMapRequestError, WEATHER_ENDPOINT
+
+
+def _format_weather(data):
+    """将高德天气接口返回的 JSON 格式化为文本"""
+    if not data.get("lives"):
+        return "无数据"
+    
+    live = data["lives"][0]
+    return f"{live['city']} 天气{live['weather']} {live['temperature']}℃"
 
 
 def get_weather(city):
@@ -13,23 +22,46 @@ def get_weather(city):
     Returns:
         str: 天气信息字符串
     """
-    AMAP_KEY = os.getenv('AMAP_KEY')
-    if not AMAP_KEY:
+    client = get_amap_client()
+    if not client.key:
         return "未配置高德地图API密钥"
     
-    url = "https://restapi.amap.com/v3/weather/weatherInfo?parameters"
-    params = {"key": AMAP_KEY, "city": city, "extensions": "base"}
+    params = {"city": city, "extensions": "base"}
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code != 200:
-            return "查询失败"
-        
-        data = response.json()
-        if not data.get("lives"):
-            return "无数据"
+        return _format_weather(client.get_json(WEATHER_ENDPOINT, params))
+    except CircuitOpenError:
+        # 上游熔断中：交给调用方返回降级结果
+        raise
+    except AMapRequestError:
+        return "查询失败"
+    except Exception as e:
+        return f"查询出错: {str(e)}"
+
+
+async def get_weather_async(city, http_client):
+    """
+    get_weather 的异步版本（与同步版本共享响应缓存）
+    
+    Args:
+        city: 城市名称
+        http_client: 共享的 httpx.AsyncClient（连接池）
         
-        live = data["lives"][0]
-        return f"{live['city']} 天气{live['weather']} {live['temperature']}℃"
+    Returns:
+        str: 天气信息字符串
+    """
+    client = get_amap_client()
+    if not client.key:
+        return "未配置高德地图API密钥"
+    
+    params = {"city": city, "extensions": "base"}
+    
+    try:
+        return _format_weather(await client.aget_json(WEATHER_ENDPOINT, params, http_client))
+    except CircuitOpenError:
+        # 上游熔断中：交给调用方返回降级结果
+        raise
+    except AMapRequestError:
+        return "查询失败"
     except Exception as e:
         return f"查询出错: {str(e)}"
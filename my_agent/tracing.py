@@ -0,0 +1,424 @@
+"""
+请求级延迟追踪
+
+轻量的 span 记录：每个 span 记录名称、起止时间、父子关系、属性（token 数、缓存命中等）
+与错误状态。当前 span 通过 contextvars 传递，线程池中的工具调用需显式传入 parent。
+结束的 span 按名称汇总延迟分位数，并可导出为：
+
+- jsonl: 每行一个 span 的扁平 JSON，便于本地分析
+- otlp:  每行一个 OTLP/JSON（ExportTraceServiceRequest）文档，
+         可由 OpenTelemetry Collector 的 otlpjsonfile 接收器读取
+"""
+import contextvars
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# 导出格式："" 不导出（仍在内存中汇总）| "jsonl" | "otlp"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+
+# 导出文件路径
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join("traces", "spans.jsonl"))
+
+# 设为 0 时完全关闭追踪（span 退化为空操作）
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") != "0"
+
+# 每个 span 名称保留的最近延迟样本数（用于分位数汇总）
+TRACE_SAMPLE_SIZE = 1000
+
+SERVICE_NAME = "my_agent"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一次计时的操作"""
+    
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes",
+                 "start_ns", "end_ns", "_started", "duration", "error")
+    
+    def __init__(self, name, parent=None, attributes=None):
+        """
+        Args:
+            name: span 名称，如 "llm.chat"、"tool.get_weather"
+            parent: 父 span，为 None 时开启新的 trace
+            attributes: 初始属性
+        """
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._started = time.perf_counter()
+        self.duration = None
+        self.error = None
+    
+    def set(self, **attributes):
+        """设置属性（值为 None 的忽略）"""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+        return self
+    
+    def add(self, key, amount=1):
+        """累加数值属性，如多次调用的 token 数"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+    
+    def get(self, key, default=None):
+        """读取属性"""
+        return self.attributes.get(key, default)
+    
+    def mark(self, key):
+        """首次调用时把距开始的毫秒数记为属性，如首字延迟 ttft_ms"""
+        if key not in self.attributes:
+            self.attributes[key] = round((time.perf_counter() - self._started) * 1000, 2)
+        return self
+    
+    def record_error(self, error):
+        """标记为失败，error 可以是异常或描述文本"""
+        self.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+        return self
+    
+    def to_dict(self):
+        """扁平 JSON 表示（jsonl 导出格式）"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+    
+    def set(self, **attributes):
+        return self
+    
+    def add(self, key, amount=1):
+        return self
+    
+    def get(self, key, default=None):
+        return default
+    
+    def mark(self, key):
+        return self
+    
+    def record_error(self, error):
+        return self
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(span):
+    """
+    转换为 OTLP/JSON 的 Span 对象
+    
+    Returns:
+        dict: 字段名与取值遵循 opentelemetry-proto 的 JSON 映射
+    """
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+        # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class JsonlExporter:
+    """将结束的 span 逐行追加写入文件"""
+    
+    def __init__(self, path, fmt="jsonl"):
+        """
+        Args:
+            path: 输出文件路径
+            fmt: "jsonl" 扁平格式 | "otlp" OTLP/JSON 格式
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+    
+    def _encode(self, span):
+        if self.fmt == "otlp":
+            return {
+                "resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [to_otlp(span)]}],
+                }]
+            }
+        return span.to_dict()
+    
+    def export(self, span):
+        line = json.dumps(self._encode(span), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+    
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SpanAggregator:
+    """按 span 名称汇总次数、错误数与延迟分位数"""
+    
+    def __init__(self, sample_size=TRACE_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._durations = defaultdict(lambda: deque(maxlen=self.sample_size))
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._totals = defaultdict(float)
+    
+    @staticmethod
+    def keys_for(span):
+        """
+        span 计入的汇总键：名称本身，带 iteration 属性的再按轮次单独汇总，
+        如 "agent.iteration" 与 "agent.iteration[2]"
+        """
+        keys = [span.name]
+        iteration = span.attributes.get("iteration")
+        if iteration is not None:
+            keys.append(f"{span.name}[{iteration}]")
+        return keys
+    
+    def record(self, span):
+        with self._lock:
+            for key in self.keys_for(span):
+                self._durations[key].append(span.duration)
+                self._counts[key] += 1
+                self._totals[key] += span.duration
+                if span.error:
+                    self._errors[key] += 1
+    
+    def summary(self, prefix=None):
+        """
+        Args:
+            prefix: 只返回以此开头的名称，如 "tool."
+        
+        Returns:
+            dict: {名称: {count, errors, mean_ms, p50_ms, p95_ms, max_ms}}
+        """
+        with self._lock:
+            result = {}
+            for key, durations in self._durations.items():
+                if prefix and not key.startswith(prefix):
+                    continue
+                ordered = sorted(durations)
+                count = self._counts[key]
+                result[key] = {
+                    "count": count,
+                    "errors": self._errors[key],
+                    "mean_ms": round(self._totals[key] / count * 1000, 2),
+                    "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+                    "p95_ms": round(_percentile(ordered, 95) * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+            return result
+    
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._errors.clear()
+            self._totals.clear()
+
+
+def _percentile(ordered, p):
+    """已排序样本的最近秩百分位数"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Tracer:
+    """span 的创建、汇总与导出"""
+    
+    def __init__(self, exporter=None, enabled=True):
+        """
+        Args:
+            exporter: 具有 export(span) 方法的导出器，None 时只在内存中汇总
+            enabled: False 时所有 span 为空操作
+        """
+        self.exporter = exporter
+        self.enabled = enabled
+        self.aggregator = SpanAggregator()
+    
+    @staticmethod
+    def current_span():
+        """当前上下文中的 span"""
+        return _current_span.get()
+    
+    def start_span(self, name, parent=None, **attributes):
+        """
+        开始一个 span（不设为当前 span），需调用 end_span 结束
+        
+        适用于跨越 yield 的生成器代码：生成器挂起期间不应改变调用方的当前 span。
+        
+        Args:
+            name: span 名称
+            parent: 父 span，默认当前 span
+            **attributes: 初始属性
+        
+        Returns:
+            Span
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(name, parent or _current_span.get(), attributes)
+    
+    def end_span(self, span, error=None):
+        """结束 span 并汇总、导出（重复结束会被忽略）"""
+        if span is _NOOP_SPAN or span.end_ns is not None:
+            return
+        if error is not None:
+            span.record_error(error)
+        span.duration = time.perf_counter() - span._started
+        span.end_ns = time.time_ns()
+        self.aggregator.record(span)
+        if self.exporter:
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                print(f"⚠️ [Trace] 导出失败: {e}")
+    
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        """
+        在 with 块内记录一个 span，并设为当前 span；块内抛出的异常记为错误状态
+        
+        Args:
+            name: span 名称
+            parent: 父 span，默认当前 span（工作线程中需显式传入）
+            **attributes: 初始属性
+        
+        Yields:
+            Span
+        """
+        span = self.start_span(name, parent, **attributes)
+        if span is _NOOP_SPAN:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+    
+    def summary(self, prefix=None):
+        """按 span 名称汇总的延迟统计，见 SpanAggregator.summary"""
+        return self.aggregator.summary(prefix)
+
+
+def _span_from_record(record):
+    """从导出文件的一行恢复 span（jsonl 与 otlp 两种格式）"""
+    if "resourceSpans" not in record:
+        span = Span(record["name"], attributes=record.get("attributes"))
+        span.duration = (record.get("duration_ms") or 0.0) / 1000
+        span.error = record.get("error")
+        return [span]
+    spans = []
+    for resource in record["resourceSpans"]:
+        for scope in resource.get("scopeSpans", []):
+            for item in scope.get("spans", []):
+                attributes = {}
+                for attribute in item.get("attributes", []):
+                    value = attribute["value"]
+                    if "intValue" in value:
+                        attributes[attribute["key"]] = int(value["intValue"])
+                    else:
+                        attributes[attribute["key"]] = next(iter(value.values()), None)
+                span = Span(item["name"], attributes=attributes)
+                span.duration = (int(item["endTimeUnixNano"]) - int(item["startTimeUnixNano"])) / 1e9
+                if item.get("status", {}).get("code") == 2:
+                    span.error = item["status"].get("message") or "error"
+                spans.append(span)
+    return spans
+
+
+def summarize_file(path, prefix=None):
+    """
+    汇总导出文件中的 span
+    
+    Args:
+        path: TRACE_FILE 导出的文件
+        prefix: 只返回以此开头的名称
+    
+    Returns:
+        dict: 同 SpanAggregator.summary
+    """
+    aggregator = SpanAggregator(sample_size=None)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                for span in _span_from_record(json.loads(line)):
+                    aggregator.record(span)
+    return aggregator.summary(prefix)
+
+
+def _tracer_from_env():
+    exporter = None
+    if TRACE_ENABLED and TRACE_EXPORT in ("jsonl", "otlp"):
+        exporter = JsonlExporter(TRACE_FILE, TRACE_EXPORT)
+    return Tracer(exporter=exporter, enabled=TRACE_ENABLED)
+
+
+# 全局追踪器
+tracer = _tracer_from_env()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="汇总导出的 span 文件")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE, help="span 文件路径")
+    parser.add_argument("--prefix", help="只显示以此开头的 span，如 tool.")
+    args = parser.parse_args()
+    
+    for name, stats in sorted(summarize_file(args.path, args.prefix).items()):
+        print(f"{name:<32} n={stats['count']:<6} err={stats['errors']:<4} "
+              f"mean={stats['mean_ms']}ms p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms max={stats['max_ms']}ms")